@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import boto3
+import click
+import yaml
+
+CASPER_TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "casper-tool.py")
+
+BUCKET = "casper-kube-bench"
+
+# minimal templates with every section casper-tool.py patches
+CHAINSPEC_TEMPLATE = """[protocol]
+version = '1.0.0'
+hard_reset = false
+activation_point = '2021-03-31T15:00:00Z'
+
+[network]
+name = 'casper'
+maximum_net_message_size = 23_068_672
+
+[core]
+era_duration = '120min'
+minimum_era_height = 100
+auction_delay = 3
+locked_funds_period = '90days'
+unbonding_delay = 14
+
+[highway]
+finality_threshold_fraction = [1, 3]
+
+[deploys]
+max_payment_cost = '0'
+block_max_transfer_count = 1000
+"""
+
+CONFIG_TEMPLATE = """[node]
+trusted_hash = 'HEX-FORMATTED BLOCK HASH'
+
+[logging]
+format = 'json'
+color = false
+abbreviate_modules = false
+
+[consensus]
+secret_key_path = '/etc/casper/validator_keys/secret_key.pem'
+
+[consensus.highway]
+unit_hashes_folder = '/var/lib/casper/casper-node'
+pending_vertex_timeout = '30min'
+standstill_timeout = '5min'
+
+[network]
+public_address = '<IP ADDRESS>:0'
+bind_address = '0.0.0.0:35000'
+known_addresses = ['1.2.3.4:35000']
+gossip_interval = '30sec'
+
+[rest_server]
+enable_server = true
+address = '0.0.0.0:8888'
+
+[rpc_server]
+address = '0.0.0.0:7777'
+
+[event_stream_server]
+enable_server = true
+address = '0.0.0.0:9999'
+
+[storage]
+path = '/var/lib/casper/casper-node'
+max_block_store_size = 483_183_820_800
+"""
+
+# writes the same files as `casper-client keygen`, for --keygen client runs
+STUB_CASPER_CLIENT = """#!/usr/bin/env python3
+import os
+import sys
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+key_path = sys.argv[2]
+os.makedirs(key_path, exist_ok=True)
+key = Ed25519PrivateKey.generate()
+pem = lambda data: data.replace(b"\\n", b"\\r\\n")
+with open(os.path.join(key_path, "secret_key.pem"), "wb") as f:
+    f.write(pem(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())))
+with open(os.path.join(key_path, "public_key.pem"), "wb") as f:
+    f.write(pem(key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)))
+with open(os.path.join(key_path, "public_key_hex"), "w") as f:
+    f.write("01" + key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw).hex())
+"""
+
+
+@click.command()
+@click.option(
+    "--node-counts",
+    default="5,50,100,500,1000",
+    help="Comma separated network sizes to benchmark (default=5,50,100,500,1000)",
+)
+@click.option(
+    "--binary-size",
+    type=int,
+    default=8,
+    help="Size in MiB of the stub casper-node binary (default=8)",
+)
+@click.option(
+    "--keygen",
+    type=click.Choice(["native", "client"]),
+    default="native",
+    help="Key generation engine passed to casper-tool.py (client uses a stub casper-client)",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(dir_okay=False),
+    default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json"),
+    help="Stored baseline to compare against",
+)
+@click.option(
+    "--update-baseline",
+    is_flag=True,
+    default=False,
+    help="Store this run as the baseline instead of comparing",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=0.25,
+    help="Allowed slowdown / memory growth over the baseline (default=0.25)",
+)
+@click.option(
+    "--results",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the results as JSON",
+)
+@click.option(
+    "--keep-workdir",
+    is_flag=True,
+    default=False,
+    help="Keep the generated artifacts for inspection",
+)
+def bench(node_counts, binary_size, keygen, baseline, update_baseline, tolerance, results, keep_workdir):
+    """Benchmark create-network, add-joiners and publish-network at increasing node counts.
+
+    Runs casper-tool.py against stub templates, a stub casper-node binary and a
+    local moto S3 server, recording wall time, peak RSS and file/object counts per phase."""
+    workdir = tempfile.mkdtemp(prefix="casper-kube-bench-")
+    moto_server, endpoint_url = start_s3()
+    try:
+        source_path = write_sources(workdir, binary_size)
+        measurements = []
+        for node_count in [int(n) for n in node_counts.split(",")]:
+            measurements += bench_network(workdir, source_path, node_count, keygen, endpoint_url)
+    finally:
+        moto_server.stop()
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            show_val("Workdir", workdir)
+
+    if results:
+        with open(results, "w") as f:
+            json.dump(measurements, f, indent=2)
+
+    if update_baseline:
+        with open(baseline, "w") as f:
+            json.dump({measurement_key(m): m for m in measurements}, f, indent=2)
+        show_val("Baseline", "stored in {}".format(baseline))
+        return
+
+    if not os.path.isfile(baseline):
+        show_val("Baseline", "{} not found, run with --update-baseline".format(baseline))
+        return
+
+    regressions = compare(json.load(open(baseline)), measurements, tolerance)
+    for regression in regressions:
+        show_val("Regression", regression)
+    if regressions:
+        sys.exit(1)
+    show_val("Baseline", "no regressions past {:.0%}".format(tolerance))
+
+
+def bench_network(workdir, source_path, node_count, keygen, endpoint_url):
+    """Run each phase for one network size and return the measurements."""
+    network_name = "bench-{}".format(node_count)
+    target_path = os.path.join(workdir, "artifacts", network_name)
+    zero_weight_count = node_count // 5
+    joiner_count = max(1, node_count // 10)
+
+    tool = [sys.executable, CASPER_TOOL,
+            "--casper-client", os.path.join(source_path, "casper-client"),
+            "--keygen", keygen,
+            "--validator-count", str(node_count - zero_weight_count),
+            "--non-validator-count", str(zero_weight_count)]
+
+    measurements = []
+    measurements.append(run_phase(workdir, node_count, "create-network", tool + [
+        "create-network",
+        "--source-config", os.path.join(source_path, "config-example.toml"),
+        "--source-chainspec", os.path.join(source_path, "chainspec.toml"),
+        "--source-casper-node", os.path.join(source_path, "casper-node"),
+        target_path,
+    ], target_path))
+
+    hosts_file = os.path.join(workdir, "{}-joiners.yaml".format(network_name))
+    write_joiners_hosts(os.path.join(target_path, "hosts.yaml"), hosts_file, network_name, node_count, joiner_count)
+    measurements.append(run_phase(workdir, node_count, "add-joiners", tool + [
+        "add-joiners", "--hosts-file", hosts_file, target_path,
+    ], target_path))
+
+    measurement = run_phase(workdir, node_count, "publish-network", tool + [
+        "publish-network",
+        "--aws-profile", "None",
+        "--target-s3-bucket", BUCKET,
+        "--s3-endpoint-url", endpoint_url,
+        target_path,
+    ], target_path)
+    measurement["objects"] = count_objects(endpoint_url, "networks/{}/".format(network_name))
+    measurements.append(measurement)
+    return measurements
+
+
+def run_phase(workdir, node_count, phase, argv, target_path):
+    """Run one casper-tool.py command, measuring wall time and the peak RSS of the process."""
+    timings_path = os.path.join(workdir, "{}-{}.json".format(phase, node_count))
+    argv = argv[:2] + ["--timings", timings_path] + argv[2:]
+    started = time.monotonic()
+    process = subprocess.Popen(argv, cwd=workdir, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    seconds = time.monotonic() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise click.ClickException("{} failed for {} nodes".format(phase, node_count))
+
+    measurement = {
+        "phase": phase,
+        "nodes": node_count,
+        "seconds": round(seconds, 3),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": round(rusage.ru_maxrss / 1024, 1),
+        "files": sum(len(files) for _, _, files in os.walk(target_path)),
+        "tool_phases": {p["name"]: round(p["seconds"], 3) for p in json.load(open(timings_path))["phases"]},
+    }
+    show_val("{} {}".format(phase, node_count), "{:.2f}s, {} MiB peak RSS, {} files".format(
+        measurement["seconds"], measurement["peak_rss_mib"], measurement["files"]))
+    return measurement
+
+
+def measurement_key(measurement):
+    return "{}@{}".format(measurement["phase"], measurement["nodes"])
+
+
+def compare(baseline, measurements, tolerance):
+    """Regressions of wall time or peak RSS past tolerance over the baseline."""
+    regressions = []
+    for measurement in measurements:
+        stored = baseline.get(measurement_key(measurement))
+        if not stored:
+            continue
+        for metric in ["seconds", "peak_rss_mib"]:
+            if measurement[metric] > stored[metric] * (1 + tolerance):
+                regressions.append("{} {}: {} vs baseline {}".format(
+                    measurement_key(measurement), metric, measurement[metric], stored[metric]))
+    return regressions
+
+
+def write_sources(workdir, binary_size):
+    source_path = os.path.join(workdir, "source")
+    Path(source_path).mkdir(parents=True)
+    with open(os.path.join(source_path, "chainspec.toml"), "w") as f:
+        f.write(CHAINSPEC_TEMPLATE)
+    with open(os.path.join(source_path, "config-example.toml"), "w") as f:
+        f.write(CONFIG_TEMPLATE)
+    with open(os.path.join(source_path, "casper-node"), "wb") as f:
+        for _ in range(binary_size):
+            f.write(os.urandom(1024 * 1024))
+    client_path = os.path.join(source_path, "casper-client")
+    with open(client_path, "w") as f:
+        f.write(STUB_CASPER_CLIENT)
+    os.chmod(client_path, 0o755)
+    return source_path
+
+
+def write_joiners_hosts(hosts_path, joiners_hosts_path, network_name, node_count, joiner_count):
+    """The network's hosts.yaml with a joiners group of new nodes appended."""
+    hosts = yaml.safe_load(open(hosts_path))
+    hosts["all"]["children"]["joiners"] = {"hosts": {
+        "casper-node-{}-{}".format(network_name, str(index).zfill(3)): ""
+        for index in range(node_count + 1, node_count + joiner_count + 1)
+    }}
+    with open(joiners_hosts_path, "w") as f:
+        yaml.safe_dump(hosts, f, sort_keys=False)
+
+
+def start_s3():
+    """A local moto S3 server with the benchmark bucket."""
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # moto accepts any credentials, make sure boto3 finds some
+    for name, value in [("AWS_ACCESS_KEY_ID", "bench"), ("AWS_SECRET_ACCESS_KEY", "bench"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")]:
+        os.environ.setdefault(name, value)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = "http://{}:{}".format(host, port)
+    boto3.client("s3", endpoint_url=endpoint_url).create_bucket(Bucket=BUCKET)
+    return server, endpoint_url
+
+
+def count_objects(endpoint_url, prefix):
+    s3 = boto3.client("s3", endpoint_url=endpoint_url)
+    count = 0
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=prefix):
+        count += page.get("KeyCount", 0)
+    return count
+
+
+def show_val(key, value):
+    """Auxiliary function to display a value on the terminal."""
+
+    key = "{:>20s}".format(key)
+    click.echo("{}:  {}".format(click.style(key, fg="blue"), value))
+
+
+if __name__ == "__main__":
+    bench()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import subprocess
 import click
@@ -12,16 +12,111 @@ import json
 import tarfile
 from pathlib import Path
 import boto3
+import boto3.s3.transfer
+import botocore.config
+import botocore.exceptions
 import requests
 import tarfile, io
+import base64
+import bisect
+import bz2
+import collections
+import csv
+import gzip
+import itertools
+import math
+import zlib
+import contextlib
+import hashlib
+import time
+import random
+import sys
+import threading
+import cProfile
+import asyncio
+import re
+import resource
+from urllib.parse import urlsplit
+import atexit
+import tempfile
+import requests.adapters
+import copy
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+except ImportError:
+    Ed25519PrivateKey = None
+
+MiB = 1024 * 1024
+
+# local state shared between runs (release downloads, key pools, timings)
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "casper-kube")
+
+# per-node reference to the files stored once in the network's shared/ store
+SHARED_MANIFEST = "shared-files.json"
+# the network's shared files in one bundle, below bundles/
+SHARED_BUNDLE = "shared.tar.gz"
+
+# measured durations of the commands between chainspec creation and every node being ready,
+# from which --adaptive-genesis predicts the genesis delay
+GENESIS_HISTORY = os.path.join(CACHE_ROOT, "genesis-history.jsonl")
+STARTUP_COMMANDS = ["create-network", "publish-network", "deploy-network"]
+
+# network state kept between create-network runs, and the files publish-network has yet to upload
+NETWORK_MANIFEST = ".network-manifest.json"
+PUBLISH_PENDING = ".publish-pending.json"
+
+# the extra accounts' secret keys: hidden, so publish-network never uploads or hashes them.
+# LEGACY_ACCOUNTS_EXPORT is where earlier versions wrote them, inside the published tree
+ACCOUNTS_EXPORT = "staging/.accounts.jsonl"
+LEGACY_ACCOUNTS_EXPORT = "staging/accounts.jsonl"
+
+# binaries are published as content defined chunks, stored once per bucket by sha256 and
+# gzipped, plus a chunk list per network. A cut point is where the gear hash of the last
+# BINARY_CHUNK_BITS bytes is zero, so an edit only moves the cut points around it.
+BINARY_CHUNK_LIST = "bundles/bin-chunks.json"
+BINARY_CHUNK_STORE = "binaries/chunks"
+BINARY_CHUNK_BITS = 18
+BINARY_CHUNK_MIN = 64 * 1024
+BINARY_CHUNK_MAX = MiB
+GEAR = [int.from_bytes(hashlib.sha256(b"gear %d" % i).digest()[:4], "little") & ((1 << BINARY_CHUNK_BITS) - 1)
+        for i in range(256)]
+GEAR_PLANES = [bytes((g >> 8 * plane) & 0xff for g in GEAR) for plane in range(3)]
 
 @click.group()
 @click.option(
     "--casper-client",
     help="path to casper client binary downloaded by default",
-    type=click.Path(exists=True, dir_okay=False, readable=True),
+    type=click.Path(dir_okay=False),
     default="./usr/bin/casper-client",
 )
+@click.option(
+    "--keygen",
+    type=click.Choice(["native", "client"]),
+    default="native" if Ed25519PrivateKey else "client",
+    help="Generate keys in-process (native) or with `casper-client keygen` (client)",
+)
+@click.option(
+    "--keygen-workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of parallel key generation workers (default=cpu count)",
+)
+@click.option(
+    "--keypool-dir",
+    type=click.Path(file_okay=False),
+    default=os.path.join(CACHE_ROOT, "keypool"),
+    help="Key pool to claim keys from before generating them (see `keypool fill`)",
+)
+@click.option(
+    "--no-keypool",
+    is_flag=True,
+    default=False,
+    help="Always generate keys, ignoring the key pool",
+)
 @click.option(
     "-P",
     "--node-port",
@@ -41,10 +136,40 @@ import tarfile, io
     default=2,
     help="Number of Non Validators",
 )
+@click.option(
+    "--package-workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of threads compressing archives (default=cpu count)",
+)
+@click.option(
+    "--workload",
+    type=click.Choice(["deployment", "statefulset"]),
+    default="deployment",
+    help="Kubernetes workload the network runs as, sets the node addresses (default=deployment)",
+)
+@click.option(
+    "--timings",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a JSON report of phase and per-node durations, bytes written and subprocesses",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write cProfile stats of the whole run",
+)
 @click.pass_context
 def cli(
     ctx,
     casper_client,
+    keygen,
+    keygen_workers,
+    keypool_dir,
+    no_keypool,
+    package_workers,
+    workload,
+    timings,
+    profile,
     node_port,
     validator_count,
     non_validator_count,
@@ -55,10 +180,30 @@ def cli(
     obj = {}
 
     obj["casper_client_argv0"] = [casper_client]
+    obj["keygen"] = keygen
+    obj["keygen-workers"] = max(1, keygen_workers or 1)
+    obj["keypool"] = None if no_keypool else keypool_dir
+    obj["package-workers"] = max(1, package_workers or 1)
     obj["validator-node-count"] = validator_count
     obj["zero-weight-node-count"] = non_validator_count
     obj["casper-node-port"] = node_port
+    obj["workload"] = workload
+    obj["timings"] = Timings(ctx.invoked_subcommand)
+
+    profiler = None
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
 
+    def write_reports():
+        obj["timings"].finish()
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+        if timings:
+            obj["timings"].write(timings)
+
+    ctx.call_on_close(write_reports)
     ctx.obj = obj
     return
 
@@ -107,6 +252,7 @@ def add_joiners(
 
     nodes_path = \
         os.path.join(target_path, "nodes")
+    shared_path = os.path.join(target_path, "shared")
 
     staging_path = os.path.join(target_path, "staging")
     bin_path = \
@@ -115,6 +261,9 @@ def add_joiners(
         os.path.join(staging_path, "bin", node_version)
     config_path = \
         os.path.join(staging_path, "config")
+    # create-network stages the config per version
+    if os.path.isdir(os.path.join(config_path, node_version)):
+        config_path = os.path.join(config_path, node_version)
 
     # Staging directories for config, chain
     show_val("Node version", node_version)
@@ -127,9 +276,10 @@ def add_joiners(
     node_bin_path = os.path.join(bin_version_path, "casper-node")
     os.chmod(node_bin_path, 0o744)
 
-    show_val("Creating binary archive", "bin.tar.bz2")
-    with tarfile.open(os.path.join(staging_path, "bin.tar.bz2"), "w:bz2") as tar:
-        tar.add(bin_path, arcname=os.path.basename(bin_path))
+    obj["timings"].phase("package")
+    create_archive(os.path.join(staging_path, "bin.tar.bz2"),
+                   [(os.path.basename(bin_path), bin_path)], obj, "bz2")
+    show_val("Binary archive", os.path.join(staging_path, "bin.tar.bz2"))
 
     faucet_path = os.path.join(staging_path, "faucet")
 
@@ -144,11 +294,42 @@ def add_joiners(
                            ["validators"]["hosts"].keys())
     bootstrap_nodes = list(hosts["all"]["children"]
                            ["bootstrap"]["hosts"].keys())
+    obj["node-addresses"] = kube_node_addresses(hosts, network_name, obj["workload"])
+    renderer = NodeConfigRenderer(config_template, obj)
+
+    # Store the files every joiner shares once, keyed by content digest
+    obj["timings"].phase("shared-files")
+    shared_files = {
+        os.path.join("casper", "keys", "faucet", "secret_key.pem"):
+            store_shared_file(shared_path, os.path.join(faucet_path, "secret_key.pem"))
+    }
+    for filename in os.listdir(config_path):
+        if os.path.isfile(os.path.join(config_path, filename)):
+            shared_files[os.path.join("casper", node_version, filename)] = \
+                store_shared_file(shared_path, os.path.join(config_path, filename))
+
+    obj["timings"].phase("keygen")
+    obj["timings"].set_node_count(len(joining_nodes))
+    show_val("Generating keys", "{} ({} keygen)".format(len(joining_nodes), obj["keygen"]))
+    joiner_keys = ensure_account_keys([
+        os.path.join(nodes_path, public_address, "etc", "casper", "keys")
+        for public_address in joining_nodes
+    ], obj, joining_nodes)
 
-    for public_address in joining_nodes:
+    manifest = load_network_manifest(target_path)
+    nodes = manifest["nodes"]
+
+    obj["timings"].phase("node-configs")
+    for public_address, public_key in zip(joining_nodes, joiner_keys):
         show_val("adding joining node", public_address)
-        generate_node_config(validator_nodes + bootstrap_nodes, config_template, obj,
-                      nodes_path, node_version, public_address, trusted_hash)
+        config_inputs, _ = update_node_config(
+            validator_nodes + bootstrap_nodes, renderer, obj, nodes_path, node_version,
+            public_address, trusted_hash, nodes.get(public_address))
+        nodes[public_address] = {
+            "role": "joiners",
+            "public_key": public_key,
+            "config_inputs": config_inputs,
+        }
         node_path = os.path.join(nodes_path, public_address)
 
         show_val("copying files to ", node_path)
@@ -156,24 +337,12 @@ def add_joiners(
         # copy the bin and chain into each node's versioned fileset
         node_var_lib_casper = os.path.join(node_path, "var", "lib", "casper")
         Path(node_var_lib_casper).mkdir(parents=True, exist_ok=True)
-        node_config_path = \
-            os.path.join(node_path, "etc", "casper", node_version)
-        node_key_path = os.path.join(node_path, "etc", "casper", "keys")
-        generate_account_key(node_key_path, public_address, obj)
-
-        # copy the faucet's secret_key.pem into each node's config
-        faucet_target_path = os.path.join(node_key_path, "faucet")
-        Path(faucet_target_path).mkdir(parents=True, exist_ok=True)
-        shutil.copyfile(
-            os.path.join(faucet_path, "secret_key.pem"),
-            os.path.join(faucet_target_path, "secret_key.pem")
-        )
 
-        for filename in os.listdir(config_path):
-            shutil.copyfile(
-                os.path.join(config_path, filename),
-                os.path.join(node_config_path, filename)
-            )
+        # reference the shared network files instead of copying them
+        write_shared_manifest(node_path, shared_files)
+
+    obj["timings"].phase("manifest")
+    record_network_changes(target_path, manifest, nodes)
 
 
 ## PUBLISH NETWORK ARTIFACTS
@@ -204,6 +373,61 @@ def add_joiners(
     default="1_0_0",
     help="Release Node Version (default=1_0_0)",
 )
+@click.option(
+    "--s3-endpoint-url",
+    type=STRING,
+    default=None,
+    help="S3 endpoint url, for S3 compatible stores (default=AWS)",
+)
+@click.option(
+    "--upload-workers",
+    type=int,
+    default=16,
+    help="Number of concurrent uploads (default=16)",
+)
+@click.option(
+    "--multipart-threshold",
+    type=int,
+    default=16,
+    help="File size in MiB from which multipart uploads are used (default=16)",
+)
+@click.option(
+    "--multipart-chunksize",
+    type=int,
+    default=16,
+    help="Multipart upload part size in MiB (default=16)",
+)
+@click.option(
+    "--multipart-concurrency",
+    type=int,
+    default=4,
+    help="Threads uploading the parts of one multipart upload (default=4)",
+)
+@click.option(
+    "--skip-unchanged",
+    is_flag=True,
+    default=False,
+    help="Skip files whose S3 ETag already matches the local file",
+)
+@click.option(
+    "--bundles/--no-bundles",
+    default=True,
+    help="Also publish one tar.gz bundle per node and one of the binaries, "
+         "fetched by init.sh with a single GET each (default=on)",
+)
+@click.option(
+    "--changed-only",
+    is_flag=True,
+    default=False,
+    help="Only upload the files create-network / add-joiners changed since the last publish, "
+         "and delete the objects of removed files",
+)
+@click.option(
+    "--binary-chunks/--no-binary-chunks",
+    default=True,
+    help="Publish the binaries as content defined chunks, uploading only chunks the bucket "
+         "doesn't have yet, instead of whole (default=on)",
+)
 # create network
 def publish_network(
     obj,
@@ -211,7 +435,16 @@ def publish_network(
     target_s3_bucket,
     aws_profile,
     network_name,
-    node_version
+    node_version,
+    s3_endpoint_url,
+    upload_workers,
+    multipart_threshold,
+    multipart_chunksize,
+    multipart_concurrency,
+    skip_unchanged,
+    bundles,
+    changed_only,
+    binary_chunks
 ):
 
     if not network_name:
@@ -222,21 +455,90 @@ def publish_network(
         if target_s3_bucket:
 
             show_val("AWS S3 Bucket", target_s3_bucket)
-            session = None
-            if aws_profile=="None":
-                session = boto3.session.Session()
+            transfer_config = boto3.s3.transfer.TransferConfig(
+                multipart_threshold=multipart_threshold * MiB,
+                multipart_chunksize=multipart_chunksize * MiB,
+                max_concurrency=multipart_concurrency,
+            )
+            # every upload worker may run a multipart upload with its own part threads
+            s3 = create_s3_client(aws_profile, s3_endpoint_url, upload_workers * transfer_config.max_concurrency)
+
+            prefix = "networks/{}".format(network_name)
+            # secret keys stay local
+            hide_accounts_export(target_path)
+            metadata = {}
+            if bundles:
+                obj["timings"].phase("bundles")
+                metadata = {
+                    "/".join([prefix, path]): {"sha256": digest}
+                    for path, digest in create_bundles(target_path, obj, binary_bundle=not binary_chunks).items()
+                }
+            binary_chunks = binary_chunks and os.path.isdir(os.path.join(target_path, "staging", "bin"))
+            if binary_chunks:
+                obj["timings"].phase("binary chunks")
+                chunk_list = create_binary_chunk_list(target_path, os.cpu_count())
+                metadata["/".join([prefix, BINARY_CHUNK_LIST])] = {
+                    "sha256": file_sha256(os.path.join(target_path, *BINARY_CHUNK_LIST.split("/")))}
+                chunks_uploaded, chunk_bytes = upload_binary_chunks(
+                    s3, target_s3_bucket, target_path, chunk_list, upload_workers)
+                obj["timings"].add_bytes(chunk_bytes, "bytes_uploaded")
+                obj["timings"].add_count("chunks_uploaded", chunks_uploaded)
+            elif os.path.isfile(os.path.join(target_path, *BINARY_CHUNK_LIST.split("/"))):
+                # pods would keep reassembling the binaries of the last chunked publish
+                os.remove(os.path.join(target_path, *BINARY_CHUNK_LIST.split("/")))
+            if bundles or binary_chunks:
+                # bundles rebuilt since the last publish join the pending list
+                if os.path.isfile(os.path.join(target_path, NETWORK_MANIFEST)):
+                    manifest = load_network_manifest(target_path)
+                    record_network_changes(target_path, manifest, manifest["nodes"])
+
+            obj["timings"].phase("upload")
+            pending_path = os.path.join(target_path, PUBLISH_PENDING)
+            pending = read_json(pending_path) if os.path.isfile(pending_path) else None
+            if changed_only and pending is not None:
+                uploads = [
+                    (os.path.join(target_path, *path.split("/")), "/".join([prefix, path]))
+                    for path in pending["changed"]
+                    if os.path.isfile(os.path.join(target_path, *path.split("/")))
+                ]
+                show_val("Changed files", "{} to upload, {} to delete".format(len(uploads), len(pending["removed"])))
+            else:
+                if changed_only:
+                    show_val("Changed files", "no pending list in {}, publishing everything".format(target_path))
+                uploads = collect_uploads(target_path, prefix)
+            if binary_chunks:
+                # the binaries' chunks are in the chunk store already
+                uploads = [(path, key) for path, key in uploads if not key.startswith(prefix + "/staging/bin/")]
+            uploaded, skipped, uploaded_bytes = upload_files(
+                s3, target_s3_bucket, uploads, upload_workers, transfer_config, skip_unchanged, metadata)
+            obj["timings"].add_bytes(uploaded_bytes, "bytes_uploaded")
+            obj["timings"].add_count("objects_uploaded", uploaded)
+            obj["timings"].add_count("objects_skipped", skipped)
+
+            deleted = 0
+            if pending is not None:
+                deleted += delete_objects(s3, target_s3_bucket, ["/".join([prefix, path]) for path in pending["removed"]])
+                # everything pending is published now
+                os.remove(pending_path)
+            # init.sh falls back to the whole binaries without a chunk list, and reassembles
+            # the chunk list's binaries when there is one: only one of them may be published
+            if binary_chunks:
+                stale = list_keys(s3, target_s3_bucket, "/".join([prefix, "staging", "bin", ""]))
+                stale += list_keys(s3, target_s3_bucket, "/".join([prefix, "bundles", "bin.tar.gz"]))
             else:
-                session = boto3.session.Session(profile_name=aws_profile)
-            s3 = session.client('s3')
-
-            for path, subdirs, files in os.walk(target_path):
-                directory_name = path.replace(target_path, "")
-                directory_name = directory_name[:0] + directory_name[0+1:]
-                for file in files:
-                    with open(os.path.join(path, file), "rb") as f:                       
-                        fileObj = os.path.join('networks', network_name, os.path.join(directory_name, file))
-                        s3.upload_fileobj(f, target_s3_bucket, fileObj )
-                        show_val("Uploaded", fileObj)
+                stale = list_keys(s3, target_s3_bucket, "/".join([prefix, BINARY_CHUNK_LIST]))
+            deleted += delete_objects(s3, target_s3_bucket, stale)
+            obj["timings"].add_count("objects_deleted", deleted)
+
+            nodes_path = os.path.join(target_path, "nodes")
+            if os.path.isdir(nodes_path):
+                if changed_only and pending is not None:
+                    mode = "changed-only"
+                elif skip_unchanged:
+                    mode = "skip-unchanged"
+                else:
+                    mode = "full"
+                record_startup_timing(obj, GENESIS_HISTORY, network_name, len(os.listdir(nodes_path)), mode=mode)
 
     except Exception as e:
             print("Error %s" %e)
@@ -264,13 +566,27 @@ def publish_network(
     default="1_0_0",
     help="Release Node Version (default=1_0_0)",
 )
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    default=os.path.join(CACHE_ROOT, "releases"),
+    help="Local release cache, revalidated with ETag/Last-Modified",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Download into the target path instead of the release cache",
+)
 # collect release
 def collect_release(
     obj,
     target_path,
     network_name,
     get_from_url,
-    node_version
+    node_version,
+    cache_dir,
+    no_cache
 ):
 
     if not network_name:
@@ -281,25 +597,28 @@ def collect_release(
     protocol_source_packages_path = os.path.join(source_packages_path, node_version)
     protocol_source_packages_download_path = os.path.join(source_packages_path, node_version, "download")
 
-    Path(protocol_source_packages_download_path).mkdir(parents=True, exist_ok=True)
-
     try:
         # get released packages from url (http)
         if ( get_from_url and node_version ):
 
             show_val("Sourcing Build from", "{}/{}".format(get_from_url, node_version))
-            
-            for file in ['config.tar.gz','bin.tar.gz']: 
 
-                url = os.path.join(get_from_url,node_version,file)
-                connection = requests.get(url, allow_redirects=True, timeout=3)
+            if no_cache:
+                download_path = protocol_source_packages_download_path
+            else:
+                url_key = hashlib.sha256(get_from_url.encode()).hexdigest()[:16]
+                download_path = os.path.join(cache_dir, node_version, url_key)
+                show_val("Release cache", download_path)
+            Path(download_path).mkdir(parents=True, exist_ok=True)
 
-                if connection.status_code == 200:
-                    open(os.path.join(protocol_source_packages_download_path, file), 'wb').write(connection.content)
+            for file in ['config.tar.gz','bin.tar.gz']: 
 
-                f = open(os.path.join(protocol_source_packages_download_path, file), 'rb')
-                tar = tarfile.open(fileobj=f, mode='r:gz')
-                tar.extractall(path=protocol_source_packages_path)
+                url = os.path.join(get_from_url,node_version,file)
+                obj["timings"].phase("download {}".format(file))
+                started = time.monotonic()
+                source = fetch_release_archive(
+                    url, os.path.join(download_path, file), protocol_source_packages_path)
+                show_val(file, "{} in {:.2f}s".format(source, time.monotonic() - started))
 
             show_val("Source Build Artifacts in", "{}/{}".format(source_packages_path, node_version))
 
@@ -354,6 +673,81 @@ def collect_release(
     type=click.Path(exists=True, dir_okay=False, readable=True),
     help="Casper node binary to source from",
 )
+@click.option(
+    "--topology",
+    type=click.Choice(["full-mesh", "random", "ring-chords", "bootstrap-k"]),
+    default="full-mesh",
+    help="How known_addresses are chosen (default=full-mesh: bootstrap and every validator)",
+)
+@click.option(
+    "--topology-degree",
+    type=int,
+    default=8,
+    help="Peers per node for the random, ring-chords and bootstrap-k topologies (default=8)",
+)
+@click.option(
+    "--topology-seed",
+    type=int,
+    default=0,
+    help="Random seed of the topology, the same seed gives the same known_addresses",
+)
+@click.option(
+    "--network-profile",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    help="YAML of regions and the delay, jitter, loss and rate between them, applied with tc netem on each node",
+)
+@click.option(
+    "--extra-accounts",
+    type=int,
+    default=0,
+    help="Number of additional funded genesis accounts, exported with their keys to staging/.accounts.jsonl "
+         "(never published)",
+)
+@click.option(
+    "--delegators",
+    type=int,
+    default=0,
+    help="Number of genesis delegators, spread round robin over the validators",
+)
+@click.option(
+    "--extra-account-balance",
+    type=int,
+    default=10**15,
+    help="Balance in motes of every extra account and delegator (default=10^15)",
+)
+@click.option(
+    "--delegated-amount",
+    type=int,
+    default=10**12,
+    help="Motes every delegator delegates (default=10^12)",
+)
+@click.option(
+    "--adaptive-genesis",
+    is_flag=True,
+    default=False,
+    help="Set the genesis delay from the create, publish and deploy times of earlier runs "
+         "(falls back to --genesis-in without enough history)",
+)
+@click.option(
+    "--genesis-margin",
+    type=float,
+    default=0.25,
+    help="Minimum safety margin added to the adaptive genesis delay, raised to the margin "
+         "recent networks needed by their genesis slack (default=0.25)",
+)
+@click.option(
+    "--genesis-min",
+    type=int,
+    default=120,
+    help="Minimum adaptive genesis delay in seconds (default=120)",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Update an existing network in place: keep existing keys and genesis timestamp, "
+         "generate missing nodes, re-render changed configs and remove nodes no longer in the network",
+)
 # create network
 def create_network(
     obj,
@@ -364,7 +758,19 @@ def create_network(
     node_version,
     source_chainspec,
     source_config,
-    source_casper_node
+    source_casper_node,
+    topology,
+    topology_degree,
+    topology_seed,
+    network_profile,
+    extra_accounts,
+    delegators,
+    extra_account_balance,
+    delegated_amount,
+    adaptive_genesis,
+    genesis_margin,
+    genesis_min,
+    incremental
 ):
 
     if not network_name:
@@ -373,9 +779,12 @@ def create_network(
     # Create the network output directories.
     show_val("Output path", target_path)
 
+    network_path = target_path
     nodes_path = \
         os.path.join(target_path, "nodes")
     sources_path = os.path.join(target_path, "source")
+    shared_path = os.path.join(target_path, "shared")
+    hosts_path = os.path.join(target_path, "hosts.yaml")
     staging_path = os.path.join(target_path, "staging")
     target_path = os.path.join(target_path, "target")
 
@@ -399,12 +808,15 @@ def create_network(
     show_val("Node Count", obj["validator-node-count"] + obj["zero-weight-node-count"])
     
     try:
-        Path(nodes_path).mkdir(parents=True)
-        Path(bin_path).mkdir(parents=True)
-        Path(bin_version_path).mkdir(parents=True)
-        Path(config_path).mkdir(parents=True)
-        Path(target_version_path).mkdir(parents=True)
-        Path(config_version_path).mkdir(parents=True)
+        manifest = load_network_manifest(network_path) if incremental else {"nodes": {}, "files": {}}
+        previous_nodes = manifest["nodes"]
+
+        Path(nodes_path).mkdir(parents=True, exist_ok=incremental)
+        Path(bin_path).mkdir(parents=True, exist_ok=incremental)
+        Path(bin_version_path).mkdir(parents=True, exist_ok=incremental)
+        Path(config_path).mkdir(parents=True, exist_ok=incremental)
+        Path(target_version_path).mkdir(parents=True, exist_ok=incremental)
+        Path(config_version_path).mkdir(parents=True, exist_ok=incremental)
 
         if source_chainspec:
             chainspec_template = source_chainspec
@@ -428,29 +840,56 @@ def create_network(
             raise Exception("no casper_node_bin found")
 
         # Update chainspec values.
+        obj["timings"].phase("chainspec")
+        node_count = obj["validator-node-count"] + obj["zero-weight-node-count"]
+        if hosts_file:
+            node_count = sum(len(nodes) for role, nodes in kube_role_nodes(
+                yaml.load(open(hosts_file), Loader=yaml.FullLoader)))
+        if adaptive_genesis:
+            estimate = estimate_genesis_in(GENESIS_HISTORY, node_count, genesis_margin, genesis_min)
+            if estimate:
+                genesis_in = estimate
+            else:
+                show_val("Adaptive genesis", "not enough history in {}, using {}s".format(GENESIS_HISTORY, genesis_in))
         chainspec = create_chainspec(
             chainspec_template, network_name, genesis_in
         )
 
         # Dump chainspec into staging dir
         chainspec_path = os.path.join(config_version_path, "chainspec.toml")
+        if incremental and os.path.isfile(chainspec_path):
+            activation_point = toml.load(open(chainspec_path))["protocol"]["activation_point"]
+            chainspec["protocol"]["activation_point"] = activation_point
+            show_val("Genesis timestamp", "{} (kept)".format(activation_point))
         toml.dump(chainspec, open(chainspec_path, "w"))
         show_val("Chainspec", chainspec_path)
 
         # Copy casper-node into bin/VERSION/ staging dir
+        obj["timings"].phase("copy-binary")
         node_bin_path = os.path.join(bin_version_path, "casper-node")
-        shutil.copyfile(casper_node_bin, node_bin_path)
+        if incremental and os.path.isfile(node_bin_path) and \
+                file_sha256(node_bin_path) == file_sha256(casper_node_bin):
+            show_val("Casper node", "unchanged")
+        else:
+            shutil.copyfile(casper_node_bin, node_bin_path)
+            obj["timings"].add_bytes(os.path.getsize(node_bin_path))
         os.chmod(node_bin_path, 0o744)
 
+        obj["timings"].phase("hosts")
         if hosts_file:
             # Load validators from ansible yaml inventory
             hosts = yaml.load(open(hosts_file), Loader=yaml.FullLoader)
         else:
             hosts = create_hosts_file(network_name, obj)
 
+        # Keep the hosts used, render-kube builds the manifests from them
+        with open(hosts_path, "w") as f:
+            yaml.safe_dump(hosts, f, sort_keys=False)
+        obj["node-addresses"] = kube_node_addresses(hosts, network_name, obj["workload"])
 
         # Setup each node, collecting all pubkey hashes.
         show_val("Node config template", config_template)
+        renderer = NodeConfigRenderer(config_template, obj)
 
         validator_nodes = list(hosts["all"]["children"]
                             ["validators"]["hosts"].keys())
@@ -460,288 +899,4274 @@ def create_network(
             hosts["all"]["children"]["zero_weight"]["hosts"].keys())
 
         bootstrap_keys = list()
-        validator_keys = list()
-        zero_weight_keys = list()
-
-        for public_address in bootstrap_nodes:
-            show_val("bootstrap node", public_address)
-            key_path = os.path.join(
-                nodes_path, public_address, "etc", "casper", "keys")
-            account = generate_account_key(key_path, public_address, obj)
-            generate_node_config(bootstrap_nodes, config_template, obj, nodes_path,
-                        node_version, public_address, None)
-            validator_keys.append(account)
 
-        initial_known_nodes = bootstrap_nodes
+        faucet_path = os.path.join(staging_path, "faucet")
+
+        # Generate every missing node key and the faucet key in one parallel batch
+        obj["timings"].phase("keygen")
+        all_nodes = bootstrap_nodes + validator_nodes + zero_weight_nodes
+        obj["timings"].set_node_count(len(all_nodes))
+        key_paths = [
+            os.path.join(nodes_path, public_address, "etc", "casper", "keys")
+            for public_address in all_nodes
+        ] + [faucet_path]
+        missing_count = sum(1 for key_path in key_paths if existing_public_key(key_path) is None)
+        show_val("Generating keys", "{} of {} ({} keygen)".format(missing_count, len(key_paths), obj["keygen"]))
+        account_keys = dict(zip(all_nodes + ["faucet"], ensure_account_keys(key_paths, obj, all_nodes + ["faucet"])))
+
+        # Remove the nodes of an earlier run which are no longer part of the network
+        for public_address, node in previous_nodes.items():
+            if node["role"] in ["bootstrap", "validators", "zero_weight"] and public_address not in all_nodes:
+                show_val("removing node", public_address)
+                shutil.rmtree(os.path.join(nodes_path, public_address), ignore_errors=True)
+        nodes = {public_address: node for public_address, node in previous_nodes.items()
+                 if node["role"] not in ["bootstrap", "validators", "zero_weight"]}
+
+        obj["timings"].phase("topology")
+        known_nodes = TOPOLOGIES[topology](
+            bootstrap_nodes, validator_nodes, zero_weight_nodes,
+            topology_degree, random.Random(topology_seed))
+        show_topology(topology, known_nodes)
 
-        for public_address in validator_nodes:
-            show_val("validator node", public_address)
-            key_path = os.path.join(
-                nodes_path, public_address, "etc", "casper", "keys")
-            account = generate_account_key(key_path, public_address, obj)
-            generate_node_config(
-                initial_known_nodes + validator_nodes, config_template,
-                obj, nodes_path, node_version, public_address, None)
-            validator_keys.append(account)
-
-        for public_address in zero_weight_nodes:
-            show_val("zero weight node", public_address)
-            key_path = os.path.join(
-                nodes_path, public_address, "etc", "casper", "keys")
-            account = generate_account_key(key_path, public_address, obj)
-            generate_node_config(
-                initial_known_nodes + validator_nodes, config_template,
-                obj, nodes_path, node_version, public_address, None)
-            zero_weight_keys.append(account)
+        obj["timings"].phase("node-configs")
+        rendered_count = 0
+        for role, role_nodes in [("bootstrap", bootstrap_nodes), ("validators", validator_nodes),
+                                 ("zero_weight", zero_weight_nodes)]:
+            for public_address in role_nodes:
+                config_inputs, rendered = update_node_config(
+                    known_nodes[public_address], renderer, obj, nodes_path,
+                    node_version, public_address, None, previous_nodes.get(public_address))
+                if rendered:
+                    show_val("{} node".format(role.replace("_", " ")), public_address)
+                    rendered_count += 1
+                nodes[public_address] = {
+                    "role": role,
+                    "public_key": account_keys[public_address],
+                    "config_inputs": config_inputs,
+                }
+        show_val("Node configs", "{} of {} rendered".format(rendered_count, len(all_nodes)))
+
+        obj["timings"].phase("network-profile")
+        if network_profile:
+            profile = load_network_profile(network_profile)
+            regions = assign_regions(all_nodes, profile)
+            show_network_profile(profile, regions)
+        for public_address in all_nodes:
+            netem_path = os.path.join(nodes_path, public_address, "etc", "casper", "netem.sh")
+            if network_profile:
+                plan = netem_plan(public_address, regions, profile, obj["node-addresses"])
+                with open(netem_path, "w") as f:
+                    f.write(render_netem_script(plan))
+            elif os.path.isfile(netem_path):
+                os.remove(netem_path)
+
+        initial_known_nodes = bootstrap_nodes
+        validator_keys = [account_keys[n] for n in bootstrap_nodes + validator_nodes]
+        zero_weight_keys = [account_keys[n] for n in zero_weight_nodes]
 
         # config-example.toml
         generate_example_node_config(
-                initial_known_nodes + validator_nodes, config_template,
+                initial_known_nodes + validator_nodes, renderer,
                 obj, config_version_path, node_version, "<EXAMPLE>", None)
 
-        faucet_path = os.path.join(staging_path, "faucet")
-        faucet_key = generate_account_key(faucet_path, "faucet", obj)
+        faucet_key = account_keys["faucet"]
 
         accounts_path = os.path.join(config_version_path, "accounts.toml")
 
         # Copy accounts.toml into staging dir
-        create_accounts_toml(accounts_path, faucet_key,
-                            bootstrap_keys + validator_keys, zero_weight_keys)
+        obj["timings"].phase("accounts")
+        export_path = hide_accounts_export(network_path)
+        reuse_path = None
+        if incremental and os.path.isfile(export_path) and exported_account_counts(export_path) == \
+                {"account": extra_accounts, "delegator": delegators}:
+            reuse_path = export_path
+        with contextlib.ExitStack() as stack:
+            export = None
+            if (extra_accounts or delegators) and not reuse_path:
+                export = stack.enter_context(open(export_path + ".partial", "w"))
+            elif not (extra_accounts or delegators) and os.path.isfile(export_path):
+                os.remove(export_path)
+            bulk_accounts = (
+                (public_key, extra_account_balance)
+                for public_key in generate_bulk_accounts("account", extra_accounts, obj, export, reuse_path))
+            bulk_delegators = delegator_entries(
+                generate_bulk_accounts("delegator", delegators, obj, export, reuse_path),
+                bootstrap_keys + validator_keys, extra_account_balance, delegated_amount)
+            create_accounts_toml(accounts_path, faucet_key,
+                                bootstrap_keys + validator_keys, zero_weight_keys,
+                                bulk_accounts, bulk_delegators if delegators else None)
+        if export:
+            os.replace(export_path + ".partial", export_path)
+        if extra_accounts or delegators:
+            show_val("Extra accounts", "{} accounts, {} delegators{}".format(
+                extra_accounts, delegators, " (reused)" if reuse_path else ""))
+            show_val("Account keys", export_path)
+        obj["timings"].add_bytes(os.path.getsize(accounts_path))
+
+        # Store the files every node shares once, keyed by content digest
+        obj["timings"].phase("shared-files")
+        shared_files = {
+            os.path.join("casper", "keys", "faucet", "secret_key.pem"):
+                store_shared_file(shared_path, os.path.join(faucet_path, "secret_key.pem"))
+        }
+        for filename in os.listdir(config_version_path):
+            shared_files[os.path.join("casper", node_version, filename)] = \
+                store_shared_file(shared_path, os.path.join(config_version_path, filename))
+        show_val("Shared files", "{} in {}".format(len(shared_files), shared_path))
 
         for public_address in bootstrap_nodes + validator_nodes + zero_weight_nodes:
             node_path = os.path.join(nodes_path, public_address)
-            show_val("copying files to ", node_path)
+            show_val("linking files to ", node_path)
 
             # copy the bin and chain into each node's versioned fileset
             node_var_lib_casper = os.path.join(node_path, "var", "lib", "casper")
-            Path(node_var_lib_casper).mkdir(parents=True)
-
-            # should already exist
-            node_config_path = \
-                os.path.join(node_path, "etc", "casper", node_version)
+            Path(node_var_lib_casper).mkdir(parents=True, exist_ok=incremental)
 
-            node_key_path = os.path.join(node_path, "etc", "casper", "keys")
-
-            # copy the faucet's secret_key.pem into each node's config
-            faucet_target_path = os.path.join(node_key_path, "faucet")
-            Path(faucet_target_path).mkdir(parents=True)
-            shutil.copyfile(
-                os.path.join(faucet_path, "secret_key.pem"),
-                os.path.join(faucet_target_path, "secret_key.pem")
-            )
-
-            for filename in os.listdir(config_version_path):
-                shutil.copyfile(
-                    os.path.join(config_version_path, filename),
-                    os.path.join(node_config_path, filename)
-                )
+            # reference the shared network files instead of copying them
+            write_shared_manifest(node_path, shared_files)
 
         # Create config.tar.gz and bin.tar.gz for publishing
+        obj["timings"].phase("package")
         create_protocol_package(network_name, obj, bin_version_path, config_version_path, target_path, node_version)
 
+        obj["timings"].phase("manifest")
+        record_network_changes(network_path, manifest, nodes)
+        record_startup_timing(obj, GENESIS_HISTORY, network_name, node_count,
+                              mode="incremental" if incremental else "full", genesis_in=genesis_in)
+
     except Exception as e:
         print("Error %s" %e)
         raise click.Abort()
 
 
-# get account Public key HEX
-def generate_account_key(key_path, public_address, obj):
-    run_client(obj["casper_client_argv0"], "keygen", key_path)
-    pubkey_hex = open(os.path.join(key_path, "public_key_hex")).read().strip()
-    return pubkey_hex
-
-# create config.toml
-def generate_node_config(known_addresses, config_template, obj, nodes_path, node_version, public_address, trusted_hash):
-    node_path = os.path.join(nodes_path, public_address)
-    node_config_path = \
-        os.path.join(node_path, "etc", "casper", node_version)
-    Path(node_config_path).mkdir(parents=True, exist_ok=True)
-    config = toml.load(open(config_template))
-
-    if trusted_hash:
-        config["node"]["trusted_hash"] = trusted_hash
-
-    config["consensus"]["secret_key_path"] = os.path.join(
-        "..", "keys", "secret_key.pem")
-    # add faucet to the `faucet` subfolder in keys
-    config["logging"]["format"] = "text"
-    config["network"]["public_address"] = "{}:{}".format(
-        public_address, obj["casper-node-port"])
-    config["network"]["bind_address"] = "0.0.0.0:{}".format(obj["casper-node-port"])
-    config["network"]["known_addresses"] = [
-        "{}:{}".format(n, obj["casper-node-port"]) for n in known_addresses]
-    # Setup for volume operation.
-    storage_path = "/storage/{}".format(public_address)
-    config["storage"]["path"] = storage_path
+## RENDER KUBERNETES RESOURCES
+#
+@cli.command("render-kube")
+@click.pass_obj
+@click.argument("target-path", type=click.Path(exists=False, writable=True), default="artifacts/chain-1")
+@click.option(
+    "-k",
+    "--hosts-file",
+    help="Parse an hosts.yaml file (default=hosts.yaml written by create-network)",
+    default=None
+)
+@click.option(
+    "-n",
+    "--network-name",
+    help="The network name (also the kube namespace), defaults to output directory name",
+)
+@click.option(
+    "-v",
+    "--node-version",
+    type=str,
+    help="semver with underscores e.g. 1_0_0",
+    default="1_0_0"
+)
+@click.option("--node-cpu", type=str, default="500m", help="node cpu request (and limit unless --node-cpu-limit)")
+@click.option("--node-mem", type=str, default="500Mi", help="node memory request (and limit unless --node-mem-limit)")
+@click.option("--node-cpu-limit", type=str, help="node cpu limit (default=--node-cpu)")
+@click.option("--node-mem-limit", type=str, help="node memory limit (default=--node-mem)")
+@click.option("--node-storage", type=str, default="1Gi", help="node storage volume size")
+@click.option(
+    "--resources-file",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    help="YAML of per role requests, limits and storage, overriding the --node-* values "
+         "(hosts group vars kube_resources override both)",
+)
+@click.option(
+    "--spread-roles",
+    type=str,
+    default="bootstrap,validator",
+    help="Comma separated roles whose pods are spread across cluster nodes and zones, empty for none "
+         "(default=bootstrap,validator)",
+)
+@click.option(
+    "--spread-mode",
+    type=click.Choice(["soft", "hard"]),
+    default="soft",
+    help="soft prefers one spread pod per cluster node, hard requires it (default=soft)",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Report the resources each role needs instead of writing the manifests",
+)
+@click.option("--storage-class", type=str, default="gp2", help="storage class of node volumes")
+@click.option("--git-hash", type=str, default="", help="casper-node git hash passed to the pods")
+@click.option(
+    "--docker-image",
+    type=str,
+    default="878804750492.dkr.ecr.us-east-2.amazonaws.com/casper-kube-node",
+    help="casper-kube-node image",
+)
+@click.option(
+    "--ingress-domain",
+    type=str,
+    default="k8s.srtip.casperlabs.io",
+    help="Domain of the per node ingress hosts",
+)
+@click.option(
+    "--pod-services/--no-pod-services",
+    default=False,
+    help="statefulset workload: add a Service per pod so each node keeps its own ingress host",
+)
+@click.option(
+    "--artifact-cache/--no-artifact-cache",
+    default=False,
+    help="Run a casper-kube-util artifact cache the nodes fetch their bundles from before S3",
+)
+@click.option(
+    "--util-image",
+    type=str,
+    default="878804750492.dkr.ecr.us-east-2.amazonaws.com/casper-kube-util",
+    help="casper-kube-util image running the artifact cache",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Manifest to write (default=TARGET_PATH/kube_resources.yaml)",
+)
+def render_kube(
+    obj,
+    target_path,
+    hosts_file,
+    network_name,
+    node_version,
+    node_cpu,
+    node_mem,
+    node_cpu_limit,
+    node_mem_limit,
+    node_storage,
+    resources_file,
+    spread_roles,
+    spread_mode,
+    dry_run,
+    storage_class,
+    git_hash,
+    docker_image,
+    ingress_domain,
+    pod_services,
+    artifact_cache,
+    util_image,
+    output
+):
+    """Writes the Kubernetes manifests for a network."""
+    if not network_name:
+        network_name = os.path.basename(os.path.join(target_path))
 
     try:
-        config["consensus"]["highway"]["unit_hashes_folder"] = storage_path
-    except KeyError:
-        config["consensus"]["unit_hashes_folder"] = storage_path
+        if not hosts_file and os.path.isfile(os.path.join(target_path, "hosts.yaml")):
+            hosts_file = os.path.join(target_path, "hosts.yaml")
+        if hosts_file:
+            hosts = yaml.load(open(hosts_file), Loader=yaml.FullLoader)
+        else:
+            hosts = create_hosts_file(network_name, obj)
 
-    toml.dump(config, open(os.path.join(node_config_path, "config.toml", ), "w"))
+        settings = {
+            "network_name": network_name,
+            "node_version": node_version,
+            "node_port": obj["casper-node-port"],
+            "storage_class": storage_class,
+            "git_hash": git_hash,
+            "image": docker_image,
+            "ingress_domain": ingress_domain,
+            "util_image": util_image,
+            "artifact_cache_url": "http://{}:{}".format(ARTIFACT_CACHE_NAME, ARTIFACT_CACHE_PORT) if artifact_cache else None,
+            "profiles": kube_role_profiles(hosts, {
+                "requests": {"cpu": node_cpu, "memory": node_mem},
+                "limits": {"cpu": node_cpu_limit or node_cpu, "memory": node_mem_limit or node_mem},
+                "storage": node_storage,
+            }, yaml.load(open(resources_file), Loader=yaml.FullLoader) if resources_file else {}),
+            "spread_roles": [role for role in spread_roles.split(",") if role],
+            "spread_mode": spread_mode,
+        }
+        if dry_run:
+            kube_resources_report(hosts, settings)
+            return
+        obj["timings"].phase("render-kube")
+        resources = kube_artifact_cache_resources(settings) if artifact_cache else []
+        if obj["workload"] == "statefulset":
+            resources += kube_statefulset_resources(hosts, settings, pod_services)
+        else:
+            resources += kube_deployment_resources(hosts, settings)
+
+        output = output or os.path.join(target_path, "kube_resources.yaml")
+        with open(output, "w") as f:
+            yaml.safe_dump_all(resources, f, sort_keys=False)
+        show_val("Workload", obj["workload"])
+        show_val("Kube objects", len(resources))
+        show_val("Kube resources", output)
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+## DEPLOY NETWORK
+#
+@cli.command("deploy-network")
+@click.pass_obj
+@click.argument("target-path", type=click.Path(exists=False, writable=True), default="artifacts/chain-1")
+@click.option(
+    "-n",
+    "--network-name",
+    help="The network name (also the kube namespace), defaults to output directory name",
+)
+@click.option(
+    "-f",
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    help="Manifest to deploy (default=TARGET_PATH/kube_resources.yaml written by render-kube)",
+)
+@click.option(
+    "--kubeconfig",
+    type=click.Path(dir_okay=False),
+    default=os.environ.get("KUBECONFIG", os.path.join(os.path.expanduser("~"), ".kube", "config")).split(os.pathsep)[0],
+    help="kubeconfig to authenticate with (default=$KUBECONFIG or ~/.kube/config)",
+)
+@click.option("--context", type=str, help="kubeconfig context (default=current-context)")
+@click.option(
+    "--kube-server",
+    type=str,
+    help="API server url, overrides the kubeconfig (e.g. a local fake API server)",
+)
+@click.option("--kube-token", type=str, help="Bearer token used with --kube-server")
+@click.option(
+    "--concurrency",
+    type=int,
+    default=16,
+    help="Objects created in parallel within a batch (default=16)",
+)
+@click.option(
+    "--max-retries",
+    type=int,
+    default=8,
+    help="Retries of a request throttled (429) or failed by the API server (5xx) (default=8)",
+)
+@click.option(
+    "--wait/--no-wait",
+    default=True,
+    help="Watch the pods until every node is ready (default=wait)",
+)
+@click.option(
+    "--timeout",
+    type=int,
+    default=1800,
+    help="Seconds to wait for the pods to be ready (default=1800)",
+)
+@click.option(
+    "--timeline",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the per-pod timeline (scheduled, pulled, started, ready) as JSON",
+)
+def deploy_network(
+    obj,
+    target_path,
+    network_name,
+    manifest,
+    kubeconfig,
+    context,
+    kube_server,
+    kube_token,
+    concurrency,
+    max_retries,
+    wait,
+    timeout,
+    timeline
+):
+    """Creates the network's namespace and Kubernetes objects and tracks pod readiness."""
+    if not network_name:
+        network_name = os.path.basename(os.path.join(target_path))
+    manifest = manifest or os.path.join(target_path, "kube_resources.yaml")
 
-# create config-example.toml
-def generate_example_node_config(known_addresses, config_template, obj, nodes_path, node_version, public_address, trusted_hash):
-    node_config_path = nodes_path
-    Path(node_config_path).mkdir(parents=True, exist_ok=True)
-    config = toml.load(open(config_template))
-
-    if trusted_hash:
-        config["node"]["trusted_hash"] = trusted_hash
-
-    config["consensus"]["secret_key_path"] = os.path.join(
-        "..", "keys", "secret_key.pem")
-    # add faucet to the `faucet` subfolder in keys
-    config["logging"]["format"] = "text"
-    config["network"]["public_address"] = "{}:{}".format(
-        public_address, obj["casper-node-port"])
-    config["network"]["bind_address"] = "0.0.0.0:{}".format(obj["casper-node-port"])
-    config["network"]["known_addresses"] = [
-        "{}:{}".format(n, obj["casper-node-port"]) for n in known_addresses]
-    # Setup for volume operation.
-    storage_path = "/storage/{}".format(public_address)
-    config["storage"]["path"] = storage_path
-    config["network"]["gossip_interval"] = 120000
     try:
-        config["consensus"]["highway"]["unit_hashes_folder"] = storage_path
-    except KeyError:
-        config["consensus"]["unit_hashes_folder"] = storage_path
+        resources = [r for r in yaml.safe_load_all(open(manifest)) if r]
+        if kube_server:
+            kube = KubeClient(kube_server, token=kube_token, max_retries=max_retries, pool_size=concurrency)
+        else:
+            kube = KubeClient.from_kubeconfig(kubeconfig, context, max_retries=max_retries, pool_size=concurrency)
+        show_val("API server", kube.server)
+        show_val("Namespace", network_name)
 
-    toml.dump(config, open(os.path.join(node_config_path, "config-example.toml", ), "w"))
+        tracker = None
+        if wait:
+            # watch from before the first object exists, so no pod transition is missed
+            tracker = PodTracker(kube, network_name, kube_expected_pods(resources))
+            tracker.start()
 
-# create chainspec.toml
-def create_chainspec(template, network_name, genesis_in):
-    """Creates a new chainspec from a template.
-    `contract_path` must be a dictionary mapping the keys of `CONTRACTS` to relative or absolute
-    paths to be put into the new chainspec.
-    Returns a dictionary that can be serialized using `toml`.
-    """
-    show_val("Chainspec template", template)
-    chainspec = toml.load(open(template))
+        obj["timings"].phase("create")
+        namespace = {"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": network_name}}
+        created = kube.create_batches(network_name, [[namespace]] + kube_create_batches(resources), concurrency)
+        obj["timings"].add_count("objects_created", created)
 
-    show_val("Chain name", network_name)
-    genesis_timestamp = (datetime.utcnow() + timedelta(seconds=genesis_in)).isoformat(
-        "T"
-    ) + "Z"
+        if tracker:
+            obj["timings"].phase("ready")
+            ready = tracker.wait(timeout)
+            tracker.report()
+            if timeline:
+                with open(timeline, "w") as f:
+                    json.dump(tracker.timeline(), f, indent=2)
+                show_val("Timeline", timeline)
+            if not ready:
+                raise Exception("{} of {} pods ready after {}s".format(
+                    tracker.ready_count(), tracker.expected, timeout))
+            record_startup_timing(obj, GENESIS_HISTORY, network_name, tracker.expected, mode="full",
+                                  genesis_slack=genesis_slack(target_path))
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+## LOAD
+#
+@cli.command("load")
+@click.pass_obj
+@click.argument("target-path", type=click.Path(exists=False, writable=True), default="artifacts/chain-1")
+@click.option(
+    "-n",
+    "--network-name",
+    help="The network name (the chain name deploys are signed for), defaults to output directory name",
+)
+@click.option(
+    "--rpc-url",
+    multiple=True,
+    help="Node JSON-RPC endpoint, repeatable (default=every node in hosts.yaml on port 7777)",
+)
+@click.option(
+    "--ingress-domain",
+    type=str,
+    help="Reach the nodes through their ingress hosts <node>.<domain>/rpc instead of in-cluster addresses",
+)
+@click.option(
+    "--accounts",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    help="JSON lines of funded accounts with hex public_key and secret_key seed "
+         "(default=staging/.accounts.jsonl when present, else the faucet)",
+)
+@click.option(
+    "--max-senders",
+    type=int,
+    default=10000,
+    help="Use at most this many of the accounts as senders (default=10000)",
+)
+@click.option("--tps", type=float, default=10, help="Deploys submitted per second (default=10)")
+@click.option("--ramp-to", type=float, help="Ramp linearly from --tps to this rate over --ramp-seconds")
+@click.option("--ramp-seconds", type=float, default=60, help="Duration of the ramp (default=60)")
+@click.option("--duration", type=float, default=60, help="Seconds to generate load for (default=60)")
+@click.option(
+    "--connections",
+    type=int,
+    default=4,
+    help="Keep-alive connections per node (default=4)",
+)
+@click.option(
+    "--max-in-flight",
+    type=int,
+    default=1000,
+    help="Submissions awaiting a response before the generator holds back (default=1000)",
+)
+@click.option("--amount", type=int, default=2_500_000_000, help="Motes per transfer (default=2500000000)")
+@click.option("--payment", type=int, default=100_000_000, help="Payment motes per deploy (default=100000000)")
+@click.option("--ttl", type=str, default="30m", help="Deploy time to live (default=30m)")
+@click.option("--report-interval", type=float, default=10, help="Seconds between progress reports (default=10)")
+@click.option(
+    "--results",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the submit counts, error rates and latency percentiles as JSON",
+)
+def load(
+    obj,
+    target_path,
+    network_name,
+    rpc_url,
+    ingress_domain,
+    accounts,
+    max_senders,
+    tps,
+    ramp_to,
+    ramp_seconds,
+    duration,
+    connections,
+    max_in_flight,
+    amount,
+    payment,
+    ttl,
+    report_interval,
+    results
+):
+    """Submits signed transfer deploys to the network's nodes at a target or ramping rate."""
+    if not network_name:
+        network_name = os.path.basename(os.path.join(target_path))
+
+    try:
+        if Ed25519PrivateKey is None:
+            raise Exception("load requires the `cryptography` package to sign deploys")
+
+        urls = list(rpc_url) or load_rpc_urls(target_path, network_name, obj, ingress_domain)
+        if not urls:
+            raise Exception("no nodes found, pass --rpc-url")
+        chain_name = load_chain_name(target_path, network_name)
+        senders = load_senders(target_path, accounts, max_senders)
+        show_val("Chain name", chain_name)
+        show_val("Nodes", len(urls))
+        show_val("Senders", len(senders))
+        show_val("Rate", "{} tps{} for {}s".format(
+            tps, " ramping to {} over {}s".format(ramp_to, ramp_seconds) if ramp_to else "", duration))
+
+        factory = TransferFactory(chain_name, senders, amount, payment, ttl)
+        generator = LoadGenerator(urls, factory, connections, max_in_flight, report_interval)
+        obj["timings"].phase("load")
+        stats = asyncio.run(generator.run(tps, ramp_to, ramp_seconds, duration))
+        obj["timings"].add_count("deploys_submitted", stats["submitted"])
+
+        for key in ["submitted", "accepted", "errors", "error_rate", "achieved_tps"]:
+            show_val(key.replace("_", " ").capitalize(), stats[key])
+        for key, value in stats["latency_ms"].items():
+            show_val("Latency {}".format(key), "{} ms".format(value))
+        for key, value in stats["error_kinds"].items():
+            show_val("Error", "{} x{}".format(key, value))
+        if results:
+            with open(results, "w") as f:
+                json.dump(stats, f, indent=2)
+            show_val("Results", results)
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+@cli.command("watch-network")
+@click.pass_obj
+@click.argument("target-path", type=click.Path(exists=False, writable=True), default="artifacts/chain-1")
+@click.option(
+    "-n",
+    "--network-name",
+    help="The network name, defaults to output directory name",
+)
+@click.option(
+    "--status-url",
+    multiple=True,
+    help="Node REST /status endpoint, repeatable (default=every node in hosts.yaml on port 8888)",
+)
+@click.option(
+    "--ingress-domain",
+    type=str,
+    help="Reach the nodes through their ingress hosts <node>.<domain>/status instead of in-cluster addresses",
+)
+@click.option("--interval", type=float, default=1.0, help="Seconds between polls (default=1)")
+@click.option("--timeout", type=float, help="Per request timeout in seconds (default=80% of --interval)")
+@click.option("--duration", type=float, default=0, help="Seconds to watch for, 0 until interrupted (default=0)")
+@click.option(
+    "--lag-blocks",
+    type=int,
+    default=3,
+    help="Nodes this many blocks behind the highest node count as lagging (default=3)",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="CSV time series of the network, one row per poll (default=<target-path>/status.csv)",
+)
+@click.option(
+    "--node-output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Also write every node's height, era and peer count per poll as CSV",
+)
+@click.option("--report-interval", type=float, default=10, help="Seconds between progress reports (default=10)")
+def watch_network(
+    obj,
+    target_path,
+    network_name,
+    status_url,
+    ingress_domain,
+    interval,
+    timeout,
+    duration,
+    lag_blocks,
+    output,
+    node_output,
+    report_interval
+):
+    """Polls every node's /status and records block height spread, block rate, lagging nodes and peer counts."""
+    if not network_name:
+        network_name = os.path.basename(os.path.join(target_path))
+
+    try:
+        nodes = [(url, url) for url in status_url] or node_urls(
+            target_path, network_name, obj, ingress_domain, 8888, "/status")
+        if not nodes:
+            raise Exception("no nodes found, pass --status-url")
+        if not output:
+            output = os.path.join(target_path, "status.csv")
+        show_val("Nodes", len(nodes))
+        show_val("Interval", "{}s, {}s timeout".format(interval, timeout or interval * 0.8))
+
+        watcher = NetworkWatcher(nodes, interval, timeout or interval * 0.8, lag_blocks, report_interval)
+        obj["timings"].phase("watch")
+        with contextlib.ExitStack() as stack:
+            series = stack.enter_context(open(output, "w", newline=""))
+            node_series = stack.enter_context(open(node_output, "w", newline="")) if node_output else None
+            try:
+                asyncio.run(watcher.run(duration, series, node_series))
+            except KeyboardInterrupt:
+                pass
+        obj["timings"].add_count("polls", watcher.polls)
+        show_val("Polls", "{} ({} overran the interval)".format(watcher.polls, watcher.overruns))
+        show_val("Time series", output)
+        if node_output:
+            show_val("Node series", node_output)
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+@cli.command("watch-events")
+@click.pass_obj
+@click.argument("target-path", type=click.Path(exists=False, writable=True), default="artifacts/chain-1")
+@click.option(
+    "-n",
+    "--network-name",
+    help="The network name, defaults to output directory name",
+)
+@click.option(
+    "--events-url",
+    multiple=True,
+    help="Node event stream URL, repeatable (default=every node in hosts.yaml on port 9999, one per --event-path)",
+)
+@click.option(
+    "--event-path",
+    multiple=True,
+    default=["/events/main", "/events/sigs"],
+    help="Event stream paths opened on every node (default=/events/main and /events/sigs, /events for 1.0 nodes)",
+)
+@click.option(
+    "--ingress-domain",
+    type=str,
+    help="Reach the nodes through their ingress hosts <node>.<domain>/events instead of in-cluster addresses",
+)
+@click.option(
+    "--quorum",
+    type=int,
+    help="Distinct finality signers that finalize a block (default=over 2/3 of the validators in hosts.yaml)",
+)
+@click.option("--duration", type=float, default=0, help="Seconds to watch for, 0 until interrupted (default=0)")
+@click.option(
+    "--window",
+    type=float,
+    default=300,
+    help="Seconds of samples the rolling percentiles cover (default=300)",
+)
+@click.option(
+    "--block-timeout",
+    type=float,
+    default=120,
+    help="Seconds a block is followed for before it is recorded as incomplete (default=120)",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="CSV of rolling percentiles, one row per report (default=<target-path>/events.csv)",
+)
+@click.option("--report-interval", type=float, default=10, help="Seconds between rows and progress reports (default=10)")
+def watch_events(
+    obj,
+    target_path,
+    network_name,
+    events_url,
+    event_path,
+    ingress_domain,
+    quorum,
+    duration,
+    window,
+    block_timeout,
+    output,
+    report_interval
+):
+    """Follows every node's event stream and records block propagation and finality latency percentiles."""
+    if not network_name:
+        network_name = os.path.basename(os.path.join(target_path))
+
+    try:
+        streams = [(url, url) for url in events_url]
+        if not streams:
+            for path in event_path:
+                streams += node_urls(target_path, network_name, obj, ingress_domain, 9999, path)
+        if not streams:
+            raise Exception("no nodes found, pass --events-url")
+        if quorum is None:
+            quorum = network_quorum(target_path)
+        if not output:
+            output = os.path.join(target_path, "events.csv")
+        node_count = len(set(node for node, url in streams))
+        show_val("Streams", "{} on {} nodes".format(len(streams), node_count))
+        show_val("Quorum", "{} signers".format(quorum) if quorum else "unknown, finality is the first signature")
+
+        watcher = EventWatcher(streams, quorum, window, block_timeout, report_interval)
+        obj["timings"].phase("watch")
+        with open(output, "w", newline="") as series:
+            try:
+                asyncio.run(watcher.run(duration, series))
+            except KeyboardInterrupt:
+                pass
+        obj["timings"].add_count("events", watcher.events)
+        show_val("Events", "{} ({} blocks, {} incomplete)".format(
+            watcher.events, watcher.blocks, watcher.incomplete))
+        show_val("Percentiles", output)
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+@cli.command("analyze-logs")
+@click.pass_obj
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, readable=True))
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default="log-summary.json",
+    help="JSON summary per node and for the network (default=log-summary.json)",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Processes analyzing log files in parallel (default=cpu count)",
+)
+@click.option(
+    "--events-file",
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    help="YAML mapping event names to regular expressions (matched ignoring case) or to "
+         "{pattern, keywords}, added to or replacing the built in events",
+)
+@click.option(
+    "--node-from",
+    type=click.Choice(["file", "dir"]),
+    default="file",
+    help="Take the node name from the log file name or its directory (default=file)",
+)
+def analyze_logs(obj, paths, output, workers, events_file, node_from):
+    """Summarizes block, era, gossip, sync and peer events of node logs, plain or gzipped, text or JSON."""
+    try:
+        events = copy.deepcopy(LOG_EVENTS)
+        if events_file:
+            for name, event in (yaml.load(open(events_file), Loader=yaml.FullLoader) or {}).items():
+                events[name] = event if isinstance(event, dict) else {"pattern": event}
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for directory, subdirs, names in os.walk(path):
+                    files += [os.path.join(directory, name) for name in sorted(names) if not name.startswith(".")]
+            else:
+                files.append(path)
+        if not files:
+            raise Exception("no log files found")
+        # largest first, so a big file doesn't start last
+        files.sort(key=os.path.getsize, reverse=True)
+        show_val("Log files", "{} ({:.1f} MiB)".format(len(files), sum(os.path.getsize(f) for f in files) / MiB))
+
+        obj["timings"].phase("analyze")
+        started = time.monotonic()
+        nodes = {}
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(files)))) as pool:
+            for path, result in zip(files, pool.map(analyze_log_file, files, itertools.repeat(events))):
+                node = log_node_name(path, node_from)
+                nodes[node] = merge_log_stats(nodes[node], result) if node in nodes else result
+        seconds = time.monotonic() - started
+        total_bytes = sum(stats["bytes"] for stats in nodes.values())
+        obj["timings"].add_bytes(total_bytes, "bytes_read")
+        show_val("Analyzed", "{:.1f} MiB in {:.1f}s ({:.1f} MiB/s)".format(
+            total_bytes / MiB, seconds, total_bytes / MiB / seconds if seconds else 0))
+
+        network = None
+        for stats in nodes.values():
+            network = merge_log_stats(network, stats) if network else copy.deepcopy(stats)
+        summary = {
+            "network": summarize_log_stats(network, len(nodes)),
+            "nodes": {node: summarize_log_stats(stats) for node, stats in sorted(nodes.items())},
+        }
+        with open(output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+        network_summary = summary["network"]
+        show_val("Nodes", len(nodes))
+        show_val("Lines", "{} ({} text, {} json)".format(
+            network_summary["lines"], network_summary["formats"]["text"], network_summary["formats"]["json"]))
+        show_val("Levels", ", ".join("{} {}".format(level, count) for level, count in network_summary["levels"].items()))
+        for name, event in network_summary["events"].items():
+            durations = event.get("duration_ms")
+            show_val(name, "{} events{}".format(event["count"], ", p50 {} / p99 {} / max {} ms".format(
+                durations["p50"], durations["p99"], durations["max"]) if durations else ""))
+        show_val("Summary", output)
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+## SNAPSHOTS
+#
+@cli.command("snapshot-network")
+@click.pass_obj
+@click.argument("target-path", type=click.Path(exists=True, file_okay=False, writable=True), default="artifacts/chain-1")
+@click.option(
+    "--storage-dir",
+    type=click.Path(exists=True, file_okay=False, readable=True),
+    required=True,
+    help="Directory with a copy of each node's storage in <node>/, e.g. the nodes' /storage volumes",
+)
+@click.option("--name", type=str, required=True, help="Snapshot name")
+@click.option("--chunk-size", type=int, default=4, help="Chunk size in MiB (default=4)")
+@click.option("--compression-level", type=int, default=6, help="gzip level of stored chunks (default=6)")
+@click.option(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="Threads hashing and compressing chunks (default=cpu count)",
+)
+def snapshot_network(obj, target_path, storage_dir, name, chunk_size, compression_level, workers):
+    """Stores node storage as deduplicated, compressed chunks in <target-path>/snapshots, published with the network."""
+    try:
+        snapshots_path = os.path.join(target_path, "snapshots")
+        node_names = sorted(d for d in os.listdir(storage_dir) if os.path.isdir(os.path.join(storage_dir, d)))
+        hosts_path = os.path.join(target_path, "hosts.yaml")
+        if os.path.isfile(hosts_path):
+            hosts = yaml.load(open(hosts_path), Loader=yaml.FullLoader)
+            network_nodes = set(node for role, nodes in kube_role_nodes(hosts) for node in nodes)
+            node_names = [node for node in node_names if node in network_nodes]
+        if not node_names:
+            raise Exception("no node storage found in {}".format(storage_dir))
+        show_val("Snapshot", "{} of {} nodes".format(name, len(node_names)))
+
+        obj["timings"].phase("snapshot")
+        started = time.monotonic()
+        store = SnapshotStore(snapshots_path, chunk_size * MiB, compression_level)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for node in node_names:
+                manifest = store.snapshot(os.path.join(storage_dir, node), pool)
+                manifest["node"] = node
+                write_snapshot_manifest(os.path.join(snapshots_path, name, "{}.json".format(node)), manifest)
+        seconds = time.monotonic() - started
+        obj["timings"].add_bytes(store.stats["stored_bytes"])
+
+        stats = store.stats
+        show_val("Node storage", "{:.1f} MiB in {} chunks ({} empty)".format(
+            stats["bytes"] / MiB, stats["chunks"], stats["zero_chunks"]))
+        show_val("Unique chunks", "{} ({} new, {:.1f} MiB stored)".format(
+            stats["unique_chunks"], stats["new_chunks"], stats["stored_bytes"] / MiB))
+        show_val("Throughput", "{:.1f} MiB/s".format(stats["bytes"] / MiB / seconds if seconds else 0))
+
+        if os.path.isfile(os.path.join(target_path, NETWORK_MANIFEST)):
+            manifest = load_network_manifest(target_path)
+            record_network_changes(target_path, manifest, manifest["nodes"])
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+@cli.command("restore-network")
+@click.pass_obj
+@click.argument("target-path", type=click.Path(exists=True, file_okay=False, writable=True), default="artifacts/chain-1")
+@click.option("--name", type=str, help="Snapshot name")
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help="Restore each node's storage into <output-dir>/<node>/ here, instead of at node start",
+)
+@click.option(
+    "--clear",
+    is_flag=True,
+    default=False,
+    help="Start the nodes from genesis again, without restoring a snapshot",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=16,
+    help="Chunks restored in parallel (default=16)",
+)
+def restore_network(obj, target_path, name, output_dir, clear, workers):
+    """Has every node restore its storage from a snapshot before the launcher starts, or restores it locally."""
+    try:
+        nodes_path = os.path.join(target_path, "nodes")
+        snapshots_path = os.path.join(target_path, "snapshots")
+        if clear:
+            for node in sorted(os.listdir(nodes_path)):
+                restore_path = os.path.join(nodes_path, node, "etc", "casper", "snapshot.json")
+                if os.path.isfile(restore_path):
+                    os.remove(restore_path)
+            show_val("Snapshot", "cleared, nodes wipe restored storage and start from genesis")
+        else:
+            if not name:
+                raise Exception("pass --name or --clear")
+            snapshot_path = os.path.join(snapshots_path, name)
+            if not os.path.isdir(snapshot_path):
+                raise Exception("no snapshot {} in {}".format(name, snapshots_path))
+            node_manifests = sorted(f[:-len(".json")] for f in os.listdir(snapshot_path) if f.endswith(".json"))
+
+            obj["timings"].phase("restore")
+            if output_dir:
+                started = time.monotonic()
+                store = SnapshotStore(snapshots_path)
+                restored = 0
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for node in node_manifests:
+                        manifest = read_json(os.path.join(snapshot_path, "{}.json".format(node)))
+                        restored += store.restore(manifest, os.path.join(output_dir, node), pool)
+                seconds = time.monotonic() - started
+                show_val("Restored", "{} nodes, {:.1f} MiB in {:.1f}s".format(len(node_manifests), restored / MiB, seconds))
+                return
+
+            for node in node_manifests:
+                etc_casper_path = os.path.join(nodes_path, node, "etc", "casper")
+                if not os.path.isdir(etc_casper_path):
+                    show_val("Skipping", "{} is not part of the network".format(node))
+                    continue
+                with open(os.path.join(etc_casper_path, "snapshot.json"), "w") as f:
+                    json.dump({
+                        "snapshot": name,
+                        "manifest": "snapshots/{}/{}.json".format(name, node),
+                        "chunks": "snapshots/chunks",
+                    }, f, indent=2)
+            show_val("Snapshot", "{} restored by {} nodes at start".format(name, len(node_manifests)))
+
+        if os.path.isfile(os.path.join(target_path, NETWORK_MANIFEST)):
+            manifest = load_network_manifest(target_path)
+            record_network_changes(target_path, manifest, manifest["nodes"])
+
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+## KEY POOL
+#
+@cli.group("keypool")
+def keypool():
+    """Pre-generated account keys, claimed by create-network and add-joiners."""
+
+@keypool.command("fill")
+@click.pass_obj
+@click.option(
+    "-c",
+    "--count",
+    type=int,
+    default=1000,
+    help="Number of available keys to fill the pool up to (default=1000)",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=1000,
+    help="Keys generated per batch (default=1000)",
+)
+def keypool_fill(obj, count, batch_size):
+    pool_path = obj["keypool"]
+    if not pool_path:
+        raise click.UsageError("--no-keypool given")
+    show_val("Key pool", pool_path)
+
+    try:
+        available = len(pool_public_keys(pool_path))
+        missing = max(0, count - available)
+        show_val("Generating keys", "{} ({} available, {} keygen)".format(missing, available, obj["keygen"]))
+        obj["timings"].phase("keygen")
+        generating_path = os.path.join(pool_path, "generating", str(os.getpid()))
+        for start in range(0, missing, batch_size):
+            key_paths = [os.path.join(generating_path, str(index))
+                         for index in range(start, min(missing, start + batch_size))]
+            public_keys = generate_keys(key_paths, obj)
+            add_pool_keys(pool_path, key_paths, public_keys)
+            show_val("Key pool", "{} available".format(available + start + len(key_paths)))
+        shutil.rmtree(generating_path, ignore_errors=True)
+    except Exception as e:
+        print("Error %s" %e)
+        raise click.Abort()
+
+@keypool.command("status")
+@click.pass_obj
+def keypool_status(obj):
+    pool_path = obj["keypool"]
+    if not pool_path:
+        raise click.UsageError("--no-keypool given")
+    show_val("Key pool", pool_path)
+    show_val("Available", len(pool_public_keys(pool_path)))
+    claimed = 0
+    index_path = os.path.join(pool_path, "index.jsonl")
+    if os.path.isfile(index_path):
+        with open(index_path) as f:
+            claimed = sum(1 for line in f if json.loads(line)["event"] == "claimed")
+    show_val("Claimed", claimed)
+
+# the pool keeps each key triple in available/<public key hex>/, and an index.jsonl of
+# generated and claimed keys
+def pool_public_keys(pool_path):
+    available_path = os.path.join(pool_path, "available")
+    if not os.path.isdir(available_path):
+        return []
+    return sorted(os.listdir(available_path))
+
+def add_pool_keys(pool_path, key_paths, public_keys):
+    available_path = os.path.join(pool_path, "available")
+    Path(available_path).mkdir(parents=True, exist_ok=True)
+    for key_path, public_key in zip(key_paths, public_keys):
+        os.rename(key_path, os.path.join(available_path, public_key))
+    append_pool_index(pool_path, [
+        {"event": "generated", "public_key": public_key} for public_key in public_keys])
+
+# move up to len(key_paths) pool keys into key_paths, returning their Public key HEX
+def claim_pool_keys(pool_path, key_paths):
+    claimed_path = os.path.join(pool_path, "claimed")
+    candidates = iter(pool_public_keys(pool_path))
+    claimed = []
+    for key_path in key_paths:
+        for public_key in candidates:
+            # the rename is the atomic claim, a concurrent run claiming
+            # the same key makes it fail and we move on to the next one
+            Path(claimed_path).mkdir(parents=True, exist_ok=True)
+            claim_path = os.path.join(claimed_path, public_key)
+            try:
+                os.rename(os.path.join(pool_path, "available", public_key), claim_path)
+            except FileNotFoundError:
+                continue
+            break
+        else:
+            break
+        # a key directory without the full key triple is replaced
+        shutil.rmtree(key_path, ignore_errors=True)
+        Path(os.path.dirname(key_path)).mkdir(parents=True, exist_ok=True)
+        shutil.move(claim_path, key_path)
+        claimed.append(public_key)
+    append_pool_index(pool_path, [
+        {"event": "claimed", "public_key": public_key, "key_path": os.path.abspath(key_path)}
+        for public_key, key_path in zip(claimed, key_paths)])
+    return claimed
+
+def append_pool_index(pool_path, entries):
+    if not entries:
+        return
+    now = datetime.utcnow().isoformat("T") + "Z"
+    with open(os.path.join(pool_path, "index.jsonl"), "a") as f:
+        f.write("".join(json.dumps(dict(entry, time=now)) + "\n" for entry in entries))
+
+# get account Public key HEX
+def generate_account_key(key_path, public_address, obj):
+    return generate_account_keys([key_path], obj, [public_address])[0]
+
+# generate a batch of account keys, returning Public key HEX in order. With the
+# names of the nodes the keys belong to, each node's keygen time is recorded.
+def generate_account_keys(key_paths, obj, nodes=None):
+    if not key_paths:
+        return []
+    keys = []
+    if obj["keypool"]:
+        started = time.monotonic()
+        keys = claim_pool_keys(obj["keypool"], key_paths)
+        show_val("Key pool", "{} of {} keys claimed".format(len(keys), len(key_paths)))
+        # claims are a rename each, every claimed key is charged an equal share
+        if nodes and keys:
+            seconds = (time.monotonic() - started) / len(keys)
+            for node in nodes[:len(keys)]:
+                obj["timings"].node(node, "keygen", seconds)
+    if len(keys) < len(key_paths):
+        keys += generate_keys(key_paths[len(keys):], obj, nodes[len(keys):] if nodes else None)
+    obj["timings"].add_bytes(sum(
+        os.path.getsize(os.path.join(key_path, name))
+        for key_path in key_paths
+        for name in ["secret_key.pem", "public_key.pem", "public_key_hex"]))
+    return keys
+
+# generate the keys missing from key_paths, reusing the Public key HEX of existing ones
+def ensure_account_keys(key_paths, obj, nodes=None):
+    keys = [existing_public_key(key_path) for key_path in key_paths]
+    missing = [key_path for key_path, key in zip(key_paths, keys) if key is None]
+    missing_nodes = [node for node, key in zip(nodes, keys) if key is None] if nodes else None
+    generated = iter(generate_account_keys(missing, obj, missing_nodes))
+    return [key if key is not None else next(generated) for key in keys]
+
+def existing_public_key(key_path):
+    names = ["secret_key.pem", "public_key.pem", "public_key_hex"]
+    if not all(os.path.isfile(os.path.join(key_path, name)) for name in names):
+        return None
+    return open(os.path.join(key_path, "public_key_hex")).read().strip()
+
+def generate_keys(key_paths, obj, nodes=None):
+    workers = min(obj["keygen-workers"], len(key_paths))
+
+    if obj["keygen"] == "native":
+        if Ed25519PrivateKey is None:
+            raise Exception("native keygen requires the `cryptography` package, use --keygen client")
+        if workers == 1:
+            results = [timed_native_keygen(key_path) for key_path in key_paths]
+        else:
+            chunksize = max(1, len(key_paths) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(timed_native_keygen, key_paths, chunksize=chunksize))
+    else:
+        if not os.path.isfile(obj["casper_client_argv0"][0]):
+            raise Exception("casper-client not found at {}".format(obj["casper_client_argv0"][0]))
+
+        def client_keygen(key_path):
+            started = time.monotonic()
+            run_client(obj["casper_client_argv0"], "keygen", key_path)
+            public_key = open(os.path.join(key_path, "public_key_hex")).read().strip()
+            return public_key, time.monotonic() - started
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(client_keygen, key_paths))
+
+    for node, (_, seconds) in zip(nodes or [], results):
+        obj["timings"].node(node, "keygen", seconds)
+    return [public_key for public_key, _ in results]
+
+# (Public key HEX, seconds) of native_keygen, timed in the worker process
+def timed_native_keygen(key_path):
+    started = time.monotonic()
+    public_key = native_keygen(key_path)
+    return public_key, time.monotonic() - started
+
+# write an ed25519 key triple in the same layout as `casper-client keygen`
+def native_keygen(key_path):
+    secret_key = Ed25519PrivateKey.generate()
+    secret_der = secret_key.private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_key = secret_key.public_key()
+    public_der = public_key.public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    public_raw = public_key.public_bytes(
+        serialization.Encoding.Raw,
+        serialization.PublicFormat.Raw,
+    )
+    # ed25519 keys are tagged 01
+    pubkey_hex = "01" + public_raw.hex()
+
+    Path(key_path).mkdir(parents=True, exist_ok=True)
+    with open(os.path.join(key_path, "secret_key.pem"), "w", newline="") as f:
+        f.write(pem_encode("PRIVATE KEY", secret_der))
+    with open(os.path.join(key_path, "public_key.pem"), "w", newline="") as f:
+        f.write(pem_encode("PUBLIC KEY", public_der))
+    with open(os.path.join(key_path, "public_key_hex"), "w") as f:
+        f.write(pubkey_hex)
+    return pubkey_hex
+
+def pem_encode(tag, der):
+    """PEM encode the way the casper-client does: 64 column base64, CRLF line endings."""
+    contents = base64.b64encode(der).decode("ascii")
+    lines = ["-----BEGIN {}-----".format(tag)]
+    lines += [contents[i:i + 64] for i in range(0, len(contents), 64)]
+    lines.append("-----END {}-----".format(tag))
+    return "\r\n".join(lines) + "\r\n"
+
+# copy a file into the content addressed shared store, returning its digest
+def store_shared_file(shared_path, source_path):
+    digest = file_sha256(source_path)
+    Path(shared_path).mkdir(parents=True, exist_ok=True)
+    shared_file_path = os.path.join(shared_path, digest)
+    if not os.path.isfile(shared_file_path):
+        shutil.copyfile(source_path, shared_file_path)
+    return digest
+
+# write the node's reference manifest, mapping paths below etc/ to shared digests
+def write_shared_manifest(node_path, shared_files):
+    manifest_path = os.path.join(node_path, "etc", "casper", SHARED_MANIFEST)
+    Path(os.path.dirname(manifest_path)).mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump({path.replace(os.sep, "/"): digest for path, digest in sorted(shared_files.items())}, f, indent=2)
+
+def hide_accounts_export(network_path):
+    """Path of the account keys export, moving one an earlier version left in the published
+    tree. Its removal from the manifest deletes the published copy on the next publish."""
+    export_path = os.path.join(network_path, *ACCOUNTS_EXPORT.split("/"))
+    legacy_export_path = os.path.join(network_path, *LEGACY_ACCOUNTS_EXPORT.split("/"))
+    if os.path.isfile(legacy_export_path):
+        os.replace(legacy_export_path, export_path)
+    return export_path
+
+def load_network_manifest(network_path):
+    manifest_path = os.path.join(network_path, NETWORK_MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return {"nodes": {}, "files": {}}
+    return read_json(manifest_path)
+
+# hash the network tree, add the files changed since the manifest to the publish
+# pending list and store the new manifest
+def record_network_changes(network_path, manifest, nodes):
+    previous_files = manifest.get("files", {})
+    files = {}
+    for root, dirs, filenames in os.walk(network_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for filename in sorted(filenames):
+            # hidden files are local bookkeeping and never published
+            if filename.startswith("."):
+                continue
+            path = os.path.join(root, filename)
+            relative_path = os.path.relpath(path, network_path).replace(os.sep, "/")
+            entry = file_entry(path, previous_files.get(relative_path))
+            files[relative_path] = {k: entry[k] for k in ["size", "mtime_ns", "sha256"]}
+
+    changed = [p for p, entry in files.items() if previous_files.get(p, {}).get("sha256") != entry["sha256"]]
+    removed = [p for p in previous_files if p not in files]
+
+    pending_path = os.path.join(network_path, PUBLISH_PENDING)
+    pending = read_json(pending_path) if os.path.isfile(pending_path) else {"changed": [], "removed": []}
+    pending_changed = set(pending["changed"]) - set(removed) | set(changed)
+    pending_removed = set(pending["removed"]) - set(changed) | set(removed)
+    with open(pending_path, "w") as f:
+        json.dump({"changed": sorted(pending_changed), "removed": sorted(pending_removed)}, f, indent=2)
+
+    with open(os.path.join(network_path, NETWORK_MANIFEST), "w") as f:
+        json.dump({"nodes": nodes, "files": files}, f, indent=2, sort_keys=True)
+    show_val("Changed files", "{} changed, {} removed, {} pending publish".format(
+        len(changed), len(removed), len(pending_changed) + len(pending_removed)))
+    return changed, removed
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(MiB), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+class NodeConfigRenderer:
+    """Renders node config files from a template that is parsed only once.
+
+    Settings shared by every node are applied to the parsed template up front
+    and every section without per-node values is serialized once. Rendering a
+    node then only formats its delta (public_address, known_addresses, storage
+    path, unit_hashes_folder and trusted_hash) and joins the precomputed text.
+    """
+
+    def __init__(self, config_template, obj, overrides=None):
+        if isinstance(config_template, dict):
+            self.template = config_template
+        else:
+            self.template = toml.load(open(config_template))
+        self.obj = obj
+        self.port = obj["casper-node-port"]
+        self.addresses = obj.get("node-addresses", {})
+        config = copy.deepcopy(self.template)
+
+        config["consensus"]["secret_key_path"] = os.path.join(
+            "..", "keys", "secret_key.pem")
+        # add faucet to the `faucet` subfolder in keys
+        config["logging"]["format"] = "text"
+        config["network"]["bind_address"] = "0.0.0.0:{}".format(self.port)
+        for section, values in (overrides or {}).items():
+            config[section].update(values)
+        if "storage" not in config:
+            raise Exception("config template has no [storage] section for the node's storage path")
+
+        unit_hashes_section = "consensus"
+        if isinstance(config["consensus"].get("highway"), dict):
+            unit_hashes_section = "consensus.highway"
+
+        # section -> keys which are rendered per node
+        self.delta_keys = {
+            "node": ["trusted_hash"],
+            "network": ["public_address", "known_addresses"],
+            "storage": ["path"],
+            unit_hashes_section: ["unit_hashes_folder"],
+        }
+        self.default_trusted_hash = config.get("node", {}).get("trusted_hash")
+
+        self.encoder = toml.TomlEncoder()
+        self.fragments = self.precompute(config)
+
+    def with_overrides(self, overrides):
+        """A renderer for the same parsed template with extra settings applied."""
+        return NodeConfigRenderer(self.template, self.obj, overrides)
+
+    def precompute(self, config):
+        """Walk the template the way `toml.dumps` does, leaving a slot for each delta section."""
+        fragments = []
+        body, sections = self.encoder.dump_sections(config, "")
+        fragments.append(body)
+        while sections:
+            next_sections = self.encoder.get_empty_table()
+            for section, table in sections.items():
+                delta = self.delta_keys.get(section, [])
+                if delta:
+                    table = {k: v for k, v in table.items() if k not in delta}
+                body, subsections = self.encoder.dump_sections(table, section)
+                if delta:
+                    fragments.append("\n[{}]\n".format(section))
+                    fragments.append(section)
+                    fragments.append(body)
+                elif body or not subsections:
+                    fragments.append("\n[{}]\n{}".format(section, body))
+                for subsection in subsections:
+                    next_sections[section + "." + subsection] = subsections[subsection]
+            sections = next_sections
+        if fragments[0] == "" and len(fragments) > 1:
+            fragments[1] = fragments[1].lstrip("\n")
+        return fragments
+
+    def inputs_digest(self, public_address, known_addresses, trusted_hash=None):
+        """Digest of everything a node's rendered config depends on."""
+        digest = hashlib.sha256("".join(f for f in self.fragments if f not in self.delta_keys).encode())
+        digest.update(json.dumps(self.values(public_address, known_addresses, trusted_hash), sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def values(self, public_address, known_addresses, trusted_hash=None):
+        storage_path = "/storage/{}".format(public_address)
+        return {
+            "trusted_hash": trusted_hash or self.default_trusted_hash,
+            "public_address": "{}:{}".format(
+                self.addresses.get(public_address, public_address), self.port),
+            "known_addresses": [
+                "{}:{}".format(self.addresses.get(n, n), self.port) for n in known_addresses],
+            "path": storage_path,
+            "unit_hashes_folder": storage_path,
+        }
+
+    def render(self, public_address, known_addresses, trusted_hash=None):
+        if trusted_hash and "node" not in self.fragments:
+            raise Exception("config template has no [node] section for trusted_hash")
+        values = self.values(public_address, known_addresses, trusted_hash)
+        out = []
+        for fragment in self.fragments:
+            delta = self.delta_keys.get(fragment)
+            if delta is None:
+                out.append(fragment)
+                continue
+            for key in delta:
+                if values[key] is not None:
+                    out.append("{} = {}\n".format(key, self.encoder.dump_value(values[key])))
+        return "".join(out)
+
+# known_addresses topologies: each maps (bootstrap, validator, zero weight nodes,
+# degree, rng) to the nodes every node is configured to dial
+def full_mesh_topology(bootstrap_nodes, validator_nodes, zero_weight_nodes, degree, rng):
+    known_nodes = {node: list(bootstrap_nodes) for node in bootstrap_nodes}
+    for node in validator_nodes + zero_weight_nodes:
+        known_nodes[node] = bootstrap_nodes + validator_nodes
+    return known_nodes
+
+def random_topology(bootstrap_nodes, validator_nodes, zero_weight_nodes, degree, rng):
+    """`degree` random peers from the whole network, bootstrap nodes included."""
+    nodes = bootstrap_nodes + validator_nodes + zero_weight_nodes
+    known_nodes = {node: list(bootstrap_nodes) for node in bootstrap_nodes}
+    for node in validator_nodes + zero_weight_nodes:
+        known_nodes[node] = sample_peers(rng, nodes, node, [], degree)
+    return known_nodes
+
+def ring_chords_topology(bootstrap_nodes, validator_nodes, zero_weight_nodes, degree, rng):
+    """The next node on a ring, which keeps the graph connected, and `degree - 1` random chords."""
+    nodes = bootstrap_nodes + validator_nodes + zero_weight_nodes
+    known_nodes = {node: list(bootstrap_nodes) for node in bootstrap_nodes}
+    for index, node in enumerate(nodes):
+        if node in bootstrap_nodes:
+            continue
+        successor = nodes[(index + 1) % len(nodes)]
+        known_nodes[node] = [successor] + sample_peers(rng, nodes, node, [successor], degree - 1)
+    return known_nodes
+
+def bootstrap_k_topology(bootstrap_nodes, validator_nodes, zero_weight_nodes, degree, rng):
+    """The bootstrap nodes plus `degree` random validators."""
+    known_nodes = {node: list(bootstrap_nodes) for node in bootstrap_nodes}
+    for node in validator_nodes + zero_weight_nodes:
+        known_nodes[node] = bootstrap_nodes + sample_peers(rng, validator_nodes, node, bootstrap_nodes, degree)
+    return known_nodes
+
+def sample_peers(rng, nodes, node, exclude, count):
+    candidates = [n for n in nodes if n != node and n not in exclude]
+    return rng.sample(candidates, min(max(count, 0), len(candidates)))
+
+TOPOLOGIES = {
+    "full-mesh": full_mesh_topology,
+    "random": random_topology,
+    "ring-chords": ring_chords_topology,
+    "bootstrap-k": bootstrap_k_topology,
+}
+
+def topology_stats(known_nodes, max_bfs_work=20_000_000, samples=32):
+    """Degree and diameter of the undirected graph of known_addresses.
+
+    The diameter is exact while one BFS per node fits in max_bfs_work edge
+    visits, otherwise it is the largest eccentricity of sampled nodes (a lower bound).
+    """
+    index = {node: i for i, node in enumerate(known_nodes)}
+    neighbours = [set() for _ in index]
+    for node, known in known_nodes.items():
+        for peer in known:
+            if peer != node and peer in index:
+                neighbours[index[node]].add(index[peer])
+                neighbours[index[peer]].add(index[node])
+    degrees = [len(n) for n in neighbours]
+    edges = sum(degrees) // 2
+
+    def eccentricity(source):
+        seen = {source}
+        frontier = [source]
+        depth = -1
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for i in frontier:
+                for j in neighbours[i]:
+                    if j not in seen:
+                        seen.add(j)
+                        next_frontier.append(j)
+            frontier = next_frontier
+        return depth if len(seen) == len(neighbours) else None
+
+    exact = len(neighbours) * max(edges, 1) <= max_bfs_work
+    sources = range(len(neighbours)) if exact else \
+        random.Random(0).sample(range(len(neighbours)), min(samples, len(neighbours)))
+    diameter = 0
+    for source in sources:
+        e = eccentricity(source)
+        if e is None:
+            diameter = None
+            break
+        diameter = max(diameter, e)
+    return {
+        "nodes": len(neighbours),
+        "edges": edges,
+        "degree_min": min(degrees) if degrees else 0,
+        "degree_mean": sum(degrees) / len(degrees) if degrees else 0,
+        "degree_max": max(degrees) if degrees else 0,
+        "diameter": diameter,
+        "diameter_exact": exact,
+    }
+
+# netem parameters of a link, each optional
+NETEM_PATTERNS = {
+    "delay": r"^\d+(\.\d+)?(us|ms|s)$",
+    "jitter": r"^\d+(\.\d+)?(us|ms|s)$",
+    "loss": r"^\d+(\.\d+)?%$",
+    "rate": r"^\d+(\.\d+)?(bit|kbit|mbit|gbit|tbit|bps|kbps|mbps|gbps|tbps)$",
+}
+
+def load_network_profile(path):
+    """A network profile: regions with weights, the default link, links between
+    regions, the uplink rate of every node and explicit node regions.
+
+        regions: {us-east: 3, eu-west: 2}
+        default: {delay: 1ms}
+        links:
+          - between: [us-east, eu-west]
+            delay: 40ms
+            jitter: 5ms
+            loss: 0.1%
+            rate: 200mbit
+        uplink: 1gbit
+        nodes: {casper-node-x-001: us-east}
+    """
+    profile = yaml.load(open(path), Loader=yaml.FullLoader) or {}
+    unknown = set(profile) - {"regions", "default", "links", "uplink", "nodes"}
+    if unknown:
+        raise Exception("unknown network profile keys {}".format(", ".join(sorted(unknown))))
+    if not profile.get("regions"):
+        raise Exception("network profile {} has no regions".format(path))
+    profile.setdefault("default", {})
+    profile.setdefault("links", [])
+    profile.setdefault("uplink", "10gbit")
+    profile.setdefault("nodes", {})
+
+    check_netem_link(profile["default"], "default")
+    check_netem_link({"rate": profile["uplink"]}, "uplink")
+    for link in profile["links"]:
+        regions = link.get("between") or []
+        if len(regions) != 2 or any(region not in profile["regions"] for region in regions):
+            raise Exception("link between {} must name two of the profile's regions".format(regions))
+        check_netem_link({key: value for key, value in link.items() if key != "between"}, " - ".join(regions))
+    for node, region in profile["nodes"].items():
+        if region not in profile["regions"]:
+            raise Exception("node {} is in unknown region {}".format(node, region))
+    return profile
+
+def check_netem_link(link, name):
+    for key, value in link.items():
+        if key not in NETEM_PATTERNS:
+            raise Exception("unknown link setting {} in {}".format(key, name))
+        if not re.match(NETEM_PATTERNS[key], str(value)):
+            raise Exception("invalid {} {} in {}".format(key, value, name))
+    if "jitter" in link and "delay" not in link:
+        raise Exception("jitter without delay in {}".format(name))
+
+def assign_regions(nodes, profile):
+    """The region of every node: explicit ones from the profile, the rest
+    spread by smooth weighted round robin in node order."""
+    weights = {region: float(weight) for region, weight in profile["regions"].items()}
+    current = {region: 0.0 for region in weights}
+    total = sum(weights.values())
+    regions = {}
+    for node in nodes:
+        if node in profile["nodes"]:
+            regions[node] = profile["nodes"][node]
+            continue
+        for region in current:
+            current[region] += weights[region]
+        region = max(current, key=lambda name: current[name])
+        current[region] -= total
+        regions[node] = region
+    return regions
+
+def netem_link(profile, region, peer_region):
+    """Settings of the link from region to peer_region: the default overridden by a matching link."""
+    link = dict(profile["default"])
+    for candidate in profile["links"]:
+        if sorted(candidate["between"]) == sorted([region, peer_region]):
+            link.update({key: value for key, value in candidate.items() if key != "between"})
+    return link
+
+def netem_plan(node, regions, profile, addresses):
+    """The tc setup of one node: an htb root limited to the uplink rate with one class and
+    netem qdisc per peer region, and the peers whose traffic goes through each class.
+
+    Peers are listed by host name; the script resolves them to filters once they exist."""
+    region = regions[node]
+    peers = {}
+    for peer, peer_region in regions.items():
+        if peer != node:
+            peers.setdefault(peer_region, []).append(addresses.get(peer, peer))
+
+    commands = [
+        ["tc", "qdisc", "add", "dev", "$dev", "root", "handle", "1:", "htb", "default", "10"],
+        ["tc", "class", "add", "dev", "$dev", "parent", "1:", "classid", "1:1", "htb", "rate", str(profile["uplink"])],
+    ]
+    classes = [("1:10", "default", profile["default"], [])]
+    for index, peer_region in enumerate(sorted(peers)):
+        classes.append(("1:{}".format(11 + index), peer_region, netem_link(profile, region, peer_region), peers[peer_region]))
+    for classid, name, link, hosts in classes:
+        rate = str(link.get("rate", profile["uplink"]))
+        commands.append(["tc", "class", "add", "dev", "$dev", "parent", "1:1", "classid", classid,
+                         "htb", "rate", rate, "ceil", rate])
+        netem = []
+        if "delay" in link:
+            netem += ["delay", str(link["delay"])] + ([str(link["jitter"]), "distribution", "normal"] if "jitter" in link else [])
+        if "loss" in link:
+            netem += ["loss", str(link["loss"])]
+        if netem:
+            commands.append(["tc", "qdisc", "add", "dev", "$dev", "parent", classid,
+                             "handle", "{}:".format(classid.split(":")[1]), "netem"] + netem)
+    return {
+        "node": node,
+        "region": region,
+        "commands": commands,
+        "filters": [(classid, name, hosts) for classid, name, link, hosts in classes if hosts],
+    }
+
+def render_netem_script(plan):
+    """Shell script applying a netem plan, run by the node's init.sh before the launcher."""
+    lines = [
+        "#!/bin/bash",
+        "#network profile of {}, region {}".format(plan["node"], plan["region"]),
+        "dev=${NETEM_DEVICE:-eth0}",
+        "tc qdisc del dev $dev root 2>/dev/null",
+        "set -e",
+    ]
+    lines += [" ".join(command) for command in plan["commands"]]
+    lines += [
+        "set +e",
+        "",
+        "#peers get a filter once their host name resolves, for up to NETEM_RESOLVE_SECONDS",
+        "resolve_peers() {",
+        "    local classid=$1; shift",
+        "    local pending=\"$*\" deadline=$(( $(date +%s) + ${NETEM_RESOLVE_SECONDS:-900} ))",
+        "    while [ -n \"$pending\" ] && [ $(date +%s) -lt $deadline ]",
+        "    do",
+        "        local unresolved=\"\"",
+        "        for host in $pending",
+        "        do",
+        "            local ips=$(getent ahostsv4 $host | awk '{print $1}' | sort -u)",
+        "            if [ -z \"$ips\" ]; then unresolved=\"$unresolved $host\"; continue; fi",
+        "            for ip in $ips",
+        "            do",
+        "                tc filter add dev $dev parent 1: protocol ip prio 1 u32 match ip dst $ip/32 flowid $classid",
+        "            done",
+        "        done",
+        "        pending=$unresolved",
+        "        [ -n \"$pending\" ] && sleep 5",
+        "    done",
+        "}",
+        "",
+    ]
+    for classid, name, hosts in plan["filters"]:
+        lines.append("#{}".format(name))
+        lines.append("resolve_peers {} {} &".format(classid, " ".join(hosts)))
+    return "\n".join(lines) + "\n"
+
+def show_network_profile(profile, regions):
+    counts = collections.Counter(regions.values())
+    show_val("Network profile", ", ".join("{} {}".format(region, counts[region]) for region in profile["regions"]))
+    for link in profile["links"]:
+        show_val(" - ".join(link["between"]), ", ".join(
+            "{} {}".format(key, value) for key, value in link.items() if key != "between"))
+
+def show_topology(topology, known_nodes):
+    stats = topology_stats(known_nodes)
+    show_val("Topology", "{} ({} nodes, {} edges)".format(topology, stats["nodes"], stats["edges"]))
+    show_val("Degree", "min {} / mean {:.1f} / max {}".format(
+        stats["degree_min"], stats["degree_mean"], stats["degree_max"]))
+    if stats["diameter"] is None:
+        show_val("Diameter", "disconnected")
+    else:
+        show_val("Diameter", "{}{}".format(
+            stats["diameter"], "" if stats["diameter_exact"] else " (sampled lower bound)"))
+    return stats
+
+# create config.toml
+def generate_node_config(known_addresses, renderer, obj, nodes_path, node_version, public_address, trusted_hash):
+    node_path = os.path.join(nodes_path, public_address)
+    node_config_path = \
+        os.path.join(node_path, "etc", "casper", node_version)
+    Path(node_config_path).mkdir(parents=True, exist_ok=True)
+
+    started = time.monotonic()
+    config = renderer.render(public_address, known_addresses, trusted_hash)
+    with open(os.path.join(node_config_path, "config.toml"), "w") as f:
+        f.write(config)
+    obj["timings"].add_bytes(len(config))
+    obj["timings"].node(public_address, "config", time.monotonic() - started)
+
+# create config.toml unless its inputs are unchanged since the recorded `previous` node entry
+def update_node_config(known_addresses, renderer, obj, nodes_path, node_version, public_address, trusted_hash, previous):
+    inputs = renderer.inputs_digest(public_address, known_addresses, trusted_hash)
+    config_path = os.path.join(nodes_path, public_address, "etc", "casper", node_version, "config.toml")
+    if (previous or {}).get("config_inputs") == inputs and os.path.isfile(config_path):
+        return inputs, False
+    generate_node_config(known_addresses, renderer, obj, nodes_path, node_version, public_address, trusted_hash)
+    return inputs, True
+
+# create config-example.toml
+def generate_example_node_config(known_addresses, renderer, obj, nodes_path, node_version, public_address, trusted_hash):
+    node_config_path = nodes_path
+    Path(node_config_path).mkdir(parents=True, exist_ok=True)
+    renderer = renderer.with_overrides({"network": {"gossip_interval": 120000}})
+
+    with open(os.path.join(node_config_path, "config-example.toml"), "w") as f:
+        f.write(renderer.render(public_address, known_addresses, trusted_hash))
+
+# create chainspec.toml
+def create_chainspec(template, network_name, genesis_in):
+    """Creates a new chainspec from a template.
+    `contract_path` must be a dictionary mapping the keys of `CONTRACTS` to relative or absolute
+    paths to be put into the new chainspec.
+    Returns a dictionary that can be serialized using `toml`.
+    """
+    show_val("Chainspec template", template)
+    chainspec = toml.load(open(template))
+
+    show_val("Chain name", network_name)
+    genesis_timestamp = (datetime.utcnow() + timedelta(seconds=genesis_in)).isoformat(
+        "T"
+    ) + "Z"
     show_val("Genesis timestamp", "{} (in {} seconds)".format(
         genesis_timestamp, genesis_in))
     chainspec["network"]["name"] = network_name
     chainspec["protocol"]["activation_point"] = genesis_timestamp
 
-    chainspec["core"]["unbonding_delay"] = 7 # normally 14
-    chainspec["core"]["auction_delay"] = 1 # normally 3
-    chainspec["core"]["era_duration"] = "15min" # normally 30min
-    chainspec["deploys"]["block_max_transfer_count"] = 500
-    return chainspec
+    chainspec["core"]["unbonding_delay"] = 7 # normally 14
+    chainspec["core"]["auction_delay"] = 1 # normally 3
+    chainspec["core"]["era_duration"] = "15min" # normally 30min
+    chainspec["deploys"]["block_max_transfer_count"] = 500
+    return chainspec
+
+
+def create_accounts_toml(accounts_path, faucet, validators, zero_weight_ops, extra_accounts=(), delegators=None):
+    """
+    :param output_file: accounts.toml
+    :param faucet: public key of faucet account
+    :param validators: public keys of validators with weight
+    :param zero_weight_ops: public keys of zero weight operators
+    :param extra_accounts: iterable of (public key, balance) of additional funded accounts
+    :param delegators: iterable of (delegator public key, validator public key, balance, delegated amount),
+        None for a network without delegators
+    :return: output_file will be an appropriately formatted csv
+
+    Entries are written as they are produced, so the iterables can be
+    generators over any number of accounts. The delegators are only pulled
+    once every account is written, so two generators never produce at once.
+    """
+    encoder = toml.TomlEncoder()
+
+    def write_table(f, header, table):
+        f.write(header + "\n")
+        for key, value in table.items():
+            f.write("{} = {}\n".format(key, encoder.dump_value(value)))
+        f.write("\n")
+
+    with open(accounts_path, "w", buffering=MiB) as f:
+        if delegators is None:
+            # top level keys go before the first table
+            f.write("delegators = []\n\n")
+        write_table(f, "[[accounts]]", {
+            "public_key": faucet,
+            "balance": str(10**32),
+            "bonded_amount": str(0),
+        })
+
+        for index, key_hex in enumerate(validators):
+            motes = 10**32
+            staking_weight = 10**13 + index
+            write_table(f, "[[accounts]]", {
+                "public_key": key_hex,
+                "balance": str(motes),
+            })
+            write_table(f, "[accounts.validator]", {"bonded_amount": str(staking_weight)})
+
+        for key_hex in zero_weight_ops:
+            motes = 10**32
+            staking_weight = 0
+            write_table(f, "[[accounts]]", {
+                "public_key": key_hex,
+                "balance": str(motes),
+                "bonded_amount": str(staking_weight),
+            })
+
+        for key_hex, balance in extra_accounts:
+            write_table(f, "[[accounts]]", {
+                "public_key": key_hex,
+                "balance": str(balance),
+            })
+
+        for delegator_key, validator_key, balance, delegated_amount in delegators or ():
+            write_table(f, "[[delegators]]", {
+                "validator_public_key": validator_key,
+                "delegator_public_key": delegator_key,
+                "balance": str(balance),
+                "delegated_amount": str(delegated_amount),
+            })
+
+def delegator_entries(delegator_keys, validators, balance, delegated_amount):
+    """Delegators spread round robin over the validators."""
+    for index, delegator_key in enumerate(delegator_keys):
+        if not validators:
+            raise Exception("delegators need at least one validator")
+        yield delegator_key, validators[index % len(validators)], balance, delegated_amount
+
+# yield the public keys of count bulk generated accounts, writing each key pair to
+# the export as a JSON line; reuse_path reads the keys of an earlier export instead
+def generate_bulk_accounts(role, count, obj, export, reuse_path=None):
+    if reuse_path:
+        keys = read_exported_accounts(reuse_path, role)
+    else:
+        keys = generate_raw_keys(count, obj["keygen-workers"])
+    for public_key, secret_key in keys:
+        if export:
+            export.write('{{"role": "{}", "public_key": "{}", "secret_key": "{}"}}\n'.format(
+                role, public_key, secret_key))
+        yield public_key
+
+def read_exported_accounts(path, role):
+    with open(path) as f:
+        for line in f:
+            account = json.loads(line)
+            if account["role"] == role:
+                yield account["public_key"], account["secret_key"]
+
+def exported_account_counts(path):
+    counts = {"account": 0, "delegator": 0}
+    with open(path) as f:
+        for line in f:
+            counts[json.loads(line)["role"]] += 1
+    return counts
+
+def generate_raw_keys(count, workers, batch_size=10000):
+    """(public key hex, secret key seed hex) of count new ed25519 keys, generated in
+    batches on a process pool with a bounded number of batches in flight."""
+    if Ed25519PrivateKey is None:
+        raise Exception("bulk account generation requires the `cryptography` package")
+    batches = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    if workers == 1 or len(batches) <= 1:
+        for size in batches:
+            yield from raw_keygen_batch(size)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for size in batches:
+            pending.append(pool.submit(raw_keygen_batch, size))
+            if len(pending) > workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def raw_keygen_batch(size):
+    keys = []
+    for _ in range(size):
+        secret_key = Ed25519PrivateKey.generate()
+        seed = secret_key.private_bytes(
+            serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption())
+        public_raw = secret_key.public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        keys.append(("01" + public_raw.hex(), seed.hex()))
+    return keys
+
+def create_hosts_file(network_name, obj):
+
+    validator_count = obj["validator-node-count"]
+    zero_weight_count = obj["zero-weight-node-count"]
+    total_node_count = validator_count + zero_weight_count
+    #show_val("Total Node Count", total_node_count)
+
+    # default hosts count list
+    hosts_file = {
+        "all": {
+            "children": {
+                "bootstrap": {
+                    "hosts": {}
+                },
+                "validators": {
+                    "hosts": {}
+                },
+                "zero_weight": {
+                    "hosts": {}
+                }
+            }
+        }
+    }
+
+    for node_index in range(1,2):
+        hosts_file["all"]["children"]["bootstrap"]["hosts"].update({ "{}-{}".format("casper-node-" + network_name, str(node_index).zfill(3)): ""})
+    for node_index in range(2, total_node_count - zero_weight_count + 1):
+        hosts_file["all"]["children"]["validators"]["hosts"].update({ "{}-{}".format("casper-node-" + network_name, str(node_index).zfill(3)): ""})
+    for node_index in range(validator_count + 1, total_node_count + 1):
+        hosts_file["all"]["children"]["zero_weight"]["hosts"].update({ "{}-{}".format("casper-node-" + network_name, str(node_index).zfill(3)): ""})
+
+    return(hosts_file)
+
+# hosts groups in network order, with the short role names used in kube object names
+KUBE_ROLES = [
+    ("bootstrap", "bootstrap"),
+    ("validators", "validator"),
+    ("zero_weight", "zero-weight"),
+    ("joiners", "joiner"),
+]
+
+def kube_role_nodes(hosts):
+    """(role, node names) for each hosts group, in network order."""
+    children = hosts["all"]["children"]
+    return [
+        (role, list(children[group]["hosts"].keys()))
+        for group, role in KUBE_ROLES
+        if group in children and children[group].get("hosts")
+    ]
+
+def kube_node_index(node_name):
+    """The zero padded index at the end of a node name, e.g. 001."""
+    index = node_name.rsplit("-", 1)[-1]
+    if not index.isdigit():
+        raise Exception("node name {} does not end in an index".format(node_name))
+    return index
+
+def kube_statefulset_layout(hosts, network_name):
+    """(role, statefulset name, first node index, nodes) for each role.
+
+    A StatefulSet names its pods <name>-<ordinal>, so each role's nodes must
+    have contiguous indexes; the pod ordinal plus the first index is the node index."""
+    layout = []
+    for role, nodes in kube_role_nodes(hosts):
+        indexes = [int(kube_node_index(node)) for node in nodes]
+        if indexes != list(range(indexes[0], indexes[0] + len(indexes))):
+            raise Exception("statefulset workload needs contiguous node indexes for {}".format(role))
+        layout.append((role, "casper-node-{}-{}".format(network_name, role), indexes[0], nodes))
+    return layout
+
+# the address each node is reached at inside the cluster
+def kube_node_addresses(hosts, network_name, workload):
+    if workload != "statefulset":
+        return {}
+    addresses = {}
+    for role, statefulset, first_index, nodes in kube_statefulset_layout(hosts, network_name):
+        for ordinal, node in enumerate(nodes):
+            # <pod>.<headless service>
+            addresses[node] = "{}-{}.casper-node-{}".format(statefulset, ordinal, network_name)
+    return addresses
+
+def kube_service_ports(node_port):
+    return [
+        {"name": "rest", "protocol": "TCP", "port": 8888, "targetPort": 8888},
+        {"name": "rpc", "protocol": "TCP", "port": 7777, "targetPort": 7777},
+        {"name": "events", "protocol": "TCP", "port": 9999, "targetPort": 9999},
+        {"name": "casper-node", "protocol": "TCP", "port": node_port, "targetPort": node_port},
+    ]
+
+# requests, limits and storage of each role's pods: the defaults, overridden by a
+# profile keyed by role or hosts group, overridden by the group's kube_resources vars
+def kube_role_profiles(hosts, defaults, profiles):
+    children = hosts["all"]["children"]
+    role_profiles = {}
+    for group, role in KUBE_ROLES:
+        profile = copy.deepcopy(defaults)
+        group_vars = (children.get(group) or {}).get("vars") or {}
+        for override in [profiles.get(group), profiles.get(role), group_vars.get("kube_resources")]:
+            for key, value in (override or {}).items():
+                if key not in ["requests", "limits", "storage"]:
+                    raise Exception("unknown resource key {} for {}".format(key, role))
+                if isinstance(value, dict):
+                    profile[key].update({name: str(quantity) for name, quantity in value.items()})
+                else:
+                    profile[key] = str(value)
+        for name in ["cpu", "memory"]:
+            if parse_quantity(profile["requests"][name]) > parse_quantity(profile["limits"][name]):
+                raise Exception("{} {} request {} is above its limit {}".format(
+                    role, name, profile["requests"][name], profile["limits"][name]))
+        role_profiles[role] = profile
+    return role_profiles
+
+QUANTITY_SUFFIXES = {
+    "m": 10**-3, "": 1, "k": 10**3, "M": 10**6, "G": 10**9, "T": 10**12, "P": 10**15, "E": 10**18,
+    "Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40, "Pi": 2**50, "Ei": 2**60,
+}
+
+def parse_quantity(value):
+    """A Kubernetes quantity such as 500m, 2 or 4Gi as a number."""
+    match = re.match(r"^([0-9.]+)([a-zA-Z]*)$", str(value).strip())
+    if not match or match.group(2) not in QUANTITY_SUFFIXES:
+        raise Exception("invalid quantity {}".format(value))
+    return float(match.group(1)) * QUANTITY_SUFFIXES[match.group(2)]
+
+# spread a role's pods over cluster nodes and zones, when it is one of the spread roles
+def kube_pod_placement(settings, role):
+    if role not in settings["spread_roles"]:
+        return {}
+    selector = {
+        "matchLabels": {"casper-network": settings["network_name"]},
+        "matchExpressions": [{"key": "casper-role", "operator": "In", "values": list(settings["spread_roles"])}],
+    }
+    hard = settings["spread_mode"] == "hard"
+    anti_affinity = {"labelSelector": selector, "topologyKey": "kubernetes.io/hostname"}
+    return {
+        "topologySpreadConstraints": [{
+            "maxSkew": 1,
+            "topologyKey": topology_key,
+            "whenUnsatisfiable": "DoNotSchedule" if hard and topology_key == "kubernetes.io/hostname" else "ScheduleAnyway",
+            "labelSelector": copy.deepcopy(selector),
+        } for topology_key in ["kubernetes.io/hostname", "topology.kubernetes.io/zone"]],
+        "affinity": {"podAntiAffinity": {
+            "requiredDuringSchedulingIgnoredDuringExecution": [anti_affinity]
+        } if hard else {
+            "preferredDuringSchedulingIgnoredDuringExecution": [{"weight": 100, "podAffinityTerm": anti_affinity}]
+        }},
+    }
+
+def kube_resources_report(hosts, settings):
+    """Show the requests, limits and storage of each role and of the whole network."""
+    totals = collections.Counter()
+    spread_pods = 0
+    for role, nodes in kube_role_nodes(hosts):
+        profile = settings["profiles"][role]
+        role_totals = {
+            "requests.cpu": parse_quantity(profile["requests"]["cpu"]) * len(nodes),
+            "requests.memory": parse_quantity(profile["requests"]["memory"]) * len(nodes),
+            "limits.cpu": parse_quantity(profile["limits"]["cpu"]) * len(nodes),
+            "limits.memory": parse_quantity(profile["limits"]["memory"]) * len(nodes),
+            "storage": parse_quantity(profile["storage"]) * len(nodes),
+        }
+        totals.update(role_totals)
+        if role in settings["spread_roles"]:
+            spread_pods += len(nodes)
+        show_val(role, "{} nodes x requests {} cpu / {} mem, limits {} cpu / {} mem, {} storage".format(
+            len(nodes), profile["requests"]["cpu"], profile["requests"]["memory"],
+            profile["limits"]["cpu"], profile["limits"]["memory"], profile["storage"]))
+        show_val("{} total".format(role), format_resources(role_totals))
+    show_val("Total", format_resources(totals))
+    if spread_pods:
+        show_val("Spread", "{} pods of {} across cluster nodes ({}){}".format(
+            spread_pods, ", ".join(settings["spread_roles"]), settings["spread_mode"],
+            ", needs {} cluster nodes".format(spread_pods) if settings["spread_mode"] == "hard" else ""))
+
+def format_resources(totals):
+    return "requests {:g} cpu / {:.1f}Gi mem, limits {:g} cpu / {:.1f}Gi mem, {:.1f}Gi storage".format(
+        round(totals["requests.cpu"], 3), totals["requests.memory"] / 2**30,
+        round(totals["limits.cpu"], 3), totals["limits.memory"] / 2**30, totals["storage"] / 2**30)
+
+def kube_node_container(name, settings, env, profile):
+    if settings.get("artifact_cache_url"):
+        env = env + [{"name": "ARTIFACT_CACHE_URL", "value": settings["artifact_cache_url"]}]
+    return {
+        "name": name,
+        "image": settings["image"],
+        "env": [
+            {"name": "CASPER_NODE_GIT_HASH", "value": settings["git_hash"]},
+        ] + env + [
+            {"name": "NETWORK_NAME", "value": settings["network_name"]},
+            {"name": "CASPER_NODE_VERSION", "value": settings["node_version"]},
+            {"name": "RUST_LOG", "value": "info"},
+            {"name": "RUST_BACKTRACE", "value": "1"},
+        ],
+        "resources": {
+            "limits": dict(profile["limits"]),
+            "requests": dict(profile["requests"]),
+        },
+        "volumeMounts": [{"mountPath": "/storage", "name": "storage"}],
+        "securityContext": {"capabilities": {"add": ["NET_ADMIN"]}},
+        # ready once the node itself serves /status, not when init.sh starts downloading
+        "readinessProbe": {
+            "httpGet": {"path": "/status", "port": 8888},
+            "periodSeconds": 5,
+            "timeoutSeconds": 3,
+        },
+    }
+
+# the in-cluster artifact cache, reached by the nodes of the network namespace by its Service name
+ARTIFACT_CACHE_NAME = "artifact-cache"
+ARTIFACT_CACHE_PORT = 8080
+
+def kube_artifact_cache_resources(settings):
+    """A Deployment of casper-kube-util in artifact-cache mode and its Service."""
+    labels = {"app": ARTIFACT_CACHE_NAME}
+    return [{
+        "kind": "Service",
+        "apiVersion": "v1",
+        "metadata": {"name": ARTIFACT_CACHE_NAME},
+        "spec": {
+            "selector": dict(labels),
+            "ports": [{"name": "http", "protocol": "TCP", "port": ARTIFACT_CACHE_PORT, "targetPort": ARTIFACT_CACHE_PORT}],
+        },
+    }, {
+        "kind": "Deployment",
+        "apiVersion": "apps/v1",
+        "metadata": {"name": ARTIFACT_CACHE_NAME, "labels": dict(labels)},
+        "spec": {
+            "replicas": 1,
+            "selector": {"matchLabels": dict(labels)},
+            "template": {
+                "metadata": {"labels": dict(labels)},
+                "spec": {
+                    "containers": [{
+                        "name": ARTIFACT_CACHE_NAME,
+                        "image": settings["util_image"],
+                        "env": [
+                            {"name": "CASPER_KUBE_UTIL_MODE", "value": "artifact-cache"},
+                            {"name": "NETWORK_NAME", "value": settings["network_name"]},
+                            {"name": "ARTIFACT_CACHE_PORT", "value": str(ARTIFACT_CACHE_PORT)},
+                        ],
+                        "ports": [{"containerPort": ARTIFACT_CACHE_PORT}],
+                        "readinessProbe": {
+                            "httpGet": {"path": "/healthz", "port": ARTIFACT_CACHE_PORT},
+                            "periodSeconds": 5,
+                        },
+                        "resources": {
+                            "requests": {"cpu": "500m", "memory": "256Mi"},
+                            "limits": {"cpu": "2", "memory": "512Mi"},
+                        },
+                    }],
+                },
+            },
+        },
+    }]
+
+def kube_ingress(settings, hosts):
+    """Ingress routing /status, /rpc and /events of each (host, service) pair."""
+    rules = []
+    for host, service in hosts:
+        rules.append({
+            "host": "{}.{}".format(host, settings["ingress_domain"]),
+            "http": {"paths": [
+                {"path": path, "backend": {"serviceName": service, "servicePort": port}}
+                for path, port in [("/status", 8888), ("/rpc", 7777), ("/events", 9999)]
+            ]},
+        })
+    return {
+        "apiVersion": "extensions/v1beta1",
+        "kind": "Ingress",
+        "metadata": {"name": "casper-ingress"},
+        "spec": {"rules": rules},
+    }
+
+def kube_deployment_resources(hosts, settings):
+    """A PersistentVolumeClaim, Service and Deployment per node, and the Ingress."""
+    resources = []
+    nodes = [(role, node) for role, role_nodes in kube_role_nodes(hosts) for node in role_nodes]
+    for role, node in nodes:
+        profile = settings["profiles"][role]
+        resources.append({
+            "apiVersion": "v1",
+            "kind": "PersistentVolumeClaim",
+            "metadata": {"name": "{}-pv-claim".format(node)},
+            "spec": {
+                "storageClassName": settings["storage_class"],
+                "accessModes": ["ReadWriteOnce"],
+                "resources": {"requests": {"storage": profile["storage"]}},
+            },
+        })
+        resources.append({
+            "kind": "Service",
+            "apiVersion": "v1",
+            "metadata": {"name": node},
+            "spec": {
+                "selector": {"app": node},
+                "ports": kube_service_ports(settings["node_port"]),
+                # peers dial the node through its Service before the readiness probe passes
+                "publishNotReadyAddresses": True,
+            },
+        })
+        container = kube_node_container(node, settings, [
+            {"name": "CASPER_NODE_INDEX", "value": kube_node_index(node)},
+        ], profile)
+        container["volumeMounts"][0]["name"] = "{}-pv".format(node)
+        resources.append({
+            "kind": "Deployment",
+            "apiVersion": "apps/v1",
+            "metadata": {"name": node, "labels": {"app": node}},
+            "spec": {
+                "replicas": 1,
+                "selector": {"matchLabels": {"app": node}},
+                "template": {
+                    "metadata": {"labels": {
+                        "app": node, "casper-network": settings["network_name"], "casper-role": role,
+                    }},
+                    "spec": dict(kube_pod_placement(settings, role), **{
+                        "containers": [container],
+                        "volumes": [{
+                            "name": "{}-pv".format(node),
+                            "persistentVolumeClaim": {"claimName": "{}-pv-claim".format(node)},
+                        }],
+                    }),
+                },
+            },
+        })
+    resources.append(kube_ingress(settings, [(node, node) for role, node in nodes]))
+    return resources
+
+def kube_statefulset_resources(hosts, settings, pod_services):
+    """A headless Service and a StatefulSet per role, with volumeClaimTemplates for storage."""
+    network_name = settings["network_name"]
+    app = "casper-node-{}".format(network_name)
+    layout = kube_statefulset_layout(hosts, network_name)
+
+    resources = [{
+        "kind": "Service",
+        "apiVersion": "v1",
+        "metadata": {"name": app},
+        "spec": {
+            "clusterIP": "None",
+            "publishNotReadyAddresses": True,
+            "selector": {"app": app},
+            "ports": kube_service_ports(settings["node_port"]),
+        },
+    }]
+    for role, statefulset, first_index, nodes in layout:
+        labels = {"app": app, "casper-role": role}
+        resources.append({
+            "kind": "StatefulSet",
+            "apiVersion": "apps/v1",
+            "metadata": {"name": statefulset, "labels": dict(labels)},
+            "spec": {
+                "serviceName": app,
+                "replicas": len(nodes),
+                "podManagementPolicy": "Parallel",
+                "selector": {"matchLabels": dict(labels)},
+                "template": {
+                    "metadata": {"labels": dict(labels, **{"casper-network": network_name})},
+                    "spec": dict(kube_pod_placement(settings, role), **{
+                        "containers": [kube_node_container(statefulset, settings, [
+                            {"name": "CASPER_NODE_INDEX_OFFSET", "value": str(first_index)},
+                        ], settings["profiles"][role])],
+                    }),
+                },
+                "volumeClaimTemplates": [{
+                    "metadata": {"name": "storage"},
+                    "spec": {
+                        "storageClassName": settings["storage_class"],
+                        "accessModes": ["ReadWriteOnce"],
+                        "resources": {"requests": {"storage": settings["profiles"][role]["storage"]}},
+                    },
+                }],
+            },
+        })
+
+    if pod_services:
+        # a Service per pod keeps one ingress host per node
+        ingress_hosts = []
+        for role, statefulset, first_index, nodes in layout:
+            for ordinal, node in enumerate(nodes):
+                resources.append({
+                    "kind": "Service",
+                    "apiVersion": "v1",
+                    "metadata": {"name": node},
+                    "spec": {
+                        "selector": {"statefulset.kubernetes.io/pod-name": "{}-{}".format(statefulset, ordinal)},
+                        "ports": kube_service_ports(settings["node_port"]),
+                    },
+                })
+                ingress_hosts.append((node, node))
+    else:
+        # one ingress host balanced across every node
+        api_service = "{}-api".format(app)
+        resources.append({
+            "kind": "Service",
+            "apiVersion": "v1",
+            "metadata": {"name": api_service},
+            "spec": {"selector": {"app": app}, "ports": kube_service_ports(settings["node_port"])},
+        })
+        ingress_hosts = [(app, api_service)]
+    resources.append(kube_ingress(settings, ingress_hosts))
+    return resources
+
+# append a successful run of a startup command to the genesis history, with its mode:
+# "full", or the incremental, changed-only or skip-unchanged run that did less work
+def record_startup_timing(obj, history_path, network_name, node_count, **extra):
+    report = obj["timings"].report()
+    record = {
+        "command": report["command"],
+        "network": network_name,
+        "nodes": node_count,
+        "seconds": round(report["seconds"], 3),
+        "time": datetime.utcnow().isoformat("T") + "Z",
+    }
+    record.update({key: value for key, value in extra.items() if value is not None})
+    Path(os.path.dirname(history_path)).mkdir(parents=True, exist_ok=True)
+    with open(history_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def genesis_slack(target_path):
+    """Seconds left until the network's genesis, negative once it has passed."""
+    chainspecs = sorted(Path(target_path, "staging", "config").glob("*/chainspec.toml"))
+    if not chainspecs:
+        return None
+    activation_point = toml.load(open(chainspecs[-1]))["protocol"]["activation_point"]
+    genesis = datetime.strptime(activation_point[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    slack = round(genesis.timestamp() - time.time(), 1)
+    show_val("Genesis slack", "{}s {}".format(abs(slack), "before genesis" if slack >= 0 else "after genesis"))
+    return slack
+
+def observed_genesis_margins(records):
+    """The margin each recorded network needed: the time from its create-network
+    to its nodes being ready (its genesis delay less the slack deploy-network saw),
+    less the idle time between its commands, over the time its create, publish
+    and deploy runs took. A command started `seconds` before its record's time."""
+    margins = []
+    runs = {}
+    for record in records:
+        if record.get("mode") != "full":
+            continue
+        run = runs.setdefault(record["network"], {})
+        if record["command"] == "create-network":
+            runs[record["network"]] = run = {}
+        run[record["command"]] = record
+        if record["command"] != "deploy-network" or record.get("genesis_slack") is None:
+            continue
+        if not all(command in run for command in STARTUP_COMMANDS) or run["create-network"].get("genesis_in") is None:
+            continue
+        idle = 0
+        for previous, command in zip(STARTUP_COMMANDS, STARTUP_COMMANDS[1:]):
+            if "time" in run[previous] and "time" in run[command]:
+                started = record_time(run[command]) - run[command]["seconds"]
+                idle += max(0, started - record_time(run[previous]))
+        elapsed = run["create-network"]["genesis_in"] - record["genesis_slack"] - idle
+        work = sum(run[command]["seconds"] for command in STARTUP_COMMANDS)
+        if work > 0:
+            margins.append(elapsed / work - 1)
+    return margins
+
+def record_time(record):
+    """Seconds of a startup record's time, when its command finished."""
+    return datetime.strptime(record["time"][:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp() + \
+        float("0" + record["time"][19:].rstrip("Z"))
+
+def estimate_genesis_in(history_path, node_count, margin, minimum, max_samples=50, max_margin_runs=10):
+    """Genesis delay for node_count nodes: each startup command's predicted
+    duration, from a least squares fit of its recent full runs, plus the margin,
+    raised to the largest margin one of the recent networks needed.
+    None when a command has no recorded runs."""
+    if not os.path.isfile(history_path):
+        return None
+    with open(history_path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    total = 0
+    for command in STARTUP_COMMANDS:
+        # incremental and changed-only runs do a fraction of the work for the same node count
+        samples = [(r["nodes"], r["seconds"]) for r in records
+                   if r["command"] == command and r["nodes"] and r.get("mode") == "full"]
+        samples = samples[-max_samples:]
+        if not samples:
+            return None
+        predicted = linear_estimate(samples, node_count)
+        show_val(command, "{:.0f}s predicted for {} nodes ({} runs)".format(predicted, node_count, len(samples)))
+        total += predicted
+    observed = observed_genesis_margins(records)[-max_margin_runs:]
+    if observed and max(observed) > margin:
+        show_val("Observed margin", "{:.0%} needed by the last {} networks, {:.0%} configured".format(
+            max(observed), len(observed), margin))
+        margin = max(observed)
+    genesis_in = max(minimum, int(total * (1 + margin)))
+    show_val("Adaptive genesis", "{}s ({:.0f}s predicted, {:.0%} margin)".format(genesis_in, total, margin))
+    return genesis_in
+
+def linear_estimate(samples, x):
+    """Least squares seconds = a + b * nodes over (nodes, seconds) samples, evaluated at x.
+    With a single node count the time is scaled by node count instead."""
+    xs = [float(n) for n, _ in samples]
+    ys = [float(seconds) for _, seconds in samples]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((n - mean_x) ** 2 for n in xs)
+    if variance == 0:
+        return mean_y * x / mean_x
+    slope = max(0.0, sum((n - mean_x) * (y - mean_y) for n, y in zip(xs, ys)) / variance)
+    intercept = mean_y - slope * mean_x
+    return max(0.0, intercept + slope * x)
+
+# object kinds created together, each batch after the previous one completed
+KUBE_CREATE_ORDER = [
+    ["ConfigMap", "Secret", "Service", "PersistentVolumeClaim"],
+    ["Deployment", "StatefulSet"],
+]
+
+def kube_create_batches(resources):
+    """Batches of the manifest's objects: storage and services, then workloads, then the rest."""
+    batches = [[r for r in resources if r["kind"] in kinds] for kinds in KUBE_CREATE_ORDER]
+    ordered = [kind for kinds in KUBE_CREATE_ORDER for kind in kinds]
+    batches.append([r for r in resources if r["kind"] not in ordered])
+    return [batch for batch in batches if batch]
+
+def kube_expected_pods(resources):
+    return sum(r["spec"].get("replicas", 1) for r in resources if r["kind"] in ["Deployment", "StatefulSet"])
+
+class KubeClient:
+    """Just enough of the Kubernetes API to create objects and watch them, over requests."""
+
+    def __init__(self, server, token=None, verify=True, cert=None, token_command=None, max_retries=8, pool_size=16):
+        self.server = server.rstrip("/")
+        self.token = token
+        self.token_command = token_command
+        self.token_expires = None
+        self.token_lock = threading.Lock()
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.cert = cert
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size + 2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_kubeconfig(cls, kubeconfig, context=None, **kwargs):
+        """Server and credentials of a kubeconfig context: token, client certificate or exec plugin."""
+        config = yaml.safe_load(open(kubeconfig))
+        context_name = context or config["current-context"]
+        context = next(c["context"] for c in config["contexts"] if c["name"] == context_name)
+        cluster = next(c["cluster"] for c in config["clusters"] if c["name"] == context["cluster"])
+        user = next((u["user"] for u in config.get("users", []) if u["name"] == context.get("user")), {})
+        base_path = os.path.dirname(os.path.abspath(kubeconfig))
+
+        def config_file(entry, name):
+            """Path of a `name` file or inline `name-data`, written to a private temp file."""
+            if entry.get(name + "-data"):
+                f = tempfile.NamedTemporaryFile(prefix="casper-kube-", delete=False)
+                f.write(base64.b64decode(entry[name + "-data"]))
+                f.close()
+                atexit.register(os.remove, f.name)
+                return f.name
+            if entry.get(name):
+                return os.path.join(base_path, entry[name])
+            return None
+
+        verify = True
+        if cluster.get("insecure-skip-tls-verify"):
+            verify = False
+        elif config_file(cluster, "certificate-authority"):
+            verify = config_file(cluster, "certificate-authority")
+
+        cert = None
+        certificate = config_file(user, "client-certificate")
+        if certificate:
+            cert = (certificate, config_file(user, "client-key"))
+
+        token = user.get("token")
+        if not token and user.get("tokenFile"):
+            token = open(user["tokenFile"]).read().strip()
+
+        token_command = None
+        if user.get("exec"):
+            exec_config = user["exec"]
+            env = dict(os.environ)
+            env.update({e["name"]: e["value"] for e in exec_config.get("env") or []})
+            token_command = ([exec_config["command"]] + list(exec_config.get("args") or []), env)
 
+        return cls(cluster["server"], token=token, verify=verify, cert=cert, token_command=token_command, **kwargs)
 
-def create_accounts_toml(accounts_path, faucet, validators, zero_weight_ops):
-    """
-    :param output_file: accounts.toml
-    :param faucet: public key of faucet account
-    :param validators: public keys of validators with weight
-    :param zero_weight_ops: public keys of zero weight operators
-    :return: output_file will be an appropriately formatted csv
-    """
-    accounts = {"accounts": [
-        {
-            "public_key": faucet,
-            "balance": str(10**32),
-            "bonded_amount": str(0),
-        }
-    ], "delegators": []}
-
-    for index, key_hex in enumerate(validators):
-        motes = 10**32
-        staking_weight = 10**13 + index
-        account = {
-            "public_key": key_hex,
-            "balance": str(motes),
-            "validator" : { "bonded_amount": str(staking_weight) },
-        }
-        accounts["accounts"].append(account)
-
-    for key_hex in zero_weight_ops:
-        motes = 10**32
-        staking_weight = 0
-        account = {
-            "public_key": key_hex,
-            "balance": str(motes),
-            "bonded_amount": str(staking_weight),
-        }
-        accounts["accounts"].append(account)
+    def headers(self):
+        if self.token_command:
+            with self.token_lock:
+                if not self.token or (self.token_expires and time.time() > self.token_expires - 60):
+                    argv, env = self.token_command
+                    status = json.loads(subprocess.check_output(argv, env=env))["status"]
+                    self.token = status["token"]
+                    self.token_expires = None
+                    if status.get("expirationTimestamp"):
+                        self.token_expires = datetime.strptime(
+                            status["expirationTimestamp"][:19], "%Y-%m-%dT%H:%M:%S"
+                        ).replace(tzinfo=timezone.utc).timestamp()
+        return {"Authorization": "Bearer {}".format(self.token)} if self.token else {}
 
-    toml.dump(accounts, open(accounts_path, "w"))
+    @staticmethod
+    def path(namespace, resource):
+        """Collection path of a resource's kind in namespace."""
+        api_version = resource["apiVersion"]
+        kind = resource["kind"]
+        plural = kind.lower() + ("es" if kind.lower().endswith("s") else "s")
+        base = "/api/v1" if api_version == "v1" else "/apis/{}".format(api_version)
+        if kind == "Namespace":
+            return "{}/namespaces".format(base)
+        return "{}/namespaces/{}/{}".format(base, namespace, plural)
 
-def create_hosts_file(network_name, obj):
+    def request(self, method, path, **kwargs):
+        """A request retried with backoff while the API server throttles (429) or fails (5xx)."""
+        extra_headers = kwargs.pop("headers", {})
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(
+                    method, self.server + path, headers=dict(self.headers(), **extra_headers), **kwargs)
+            except requests.exceptions.ConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                response = None
+            if response is not None and response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == self.max_retries:
+                return response
+            delay = min(30, 0.25 * 2 ** attempt) * (0.5 + random.random())
+            if response is not None and response.headers.get("Retry-After", "").isdigit():
+                delay = int(response.headers["Retry-After"])
+            time.sleep(delay)
 
-    validator_count = obj["validator-node-count"]
-    zero_weight_count = obj["zero-weight-node-count"]
-    total_node_count = validator_count + zero_weight_count
-    #show_val("Total Node Count", total_node_count)
+    def create(self, namespace, resource):
+        """Create an object, or update it with a merge patch like `kubectl apply` when it
+        already exists. Returns True when it was created."""
+        response = self.request("POST", self.path(namespace, resource), json=resource)
+        created = response.status_code != 409
+        if not created:
+            response = self.request(
+                "PATCH", "{}/{}".format(self.path(namespace, resource), resource["metadata"]["name"]),
+                data=json.dumps(resource), headers={"Content-Type": "application/merge-patch+json"})
+        if response.status_code >= 300:
+            raise Exception("{} {} {} failed: {} {}".format(
+                "creating" if created else "updating", resource["kind"], resource["metadata"]["name"],
+                response.status_code, response.text[:200]))
+        return created
 
-    # default hosts count list
-    hosts_file = {
-        "all": {
-            "children": {
-                "bootstrap": {
-                    "hosts": {}
-                },
-                "validators": {
-                    "hosts": {}
-                },
-                "zero_weight": {
-                    "hosts": {}
-                }
-            }
-        }
-    }
+    def create_batches(self, namespace, batches, concurrency):
+        """Create each batch with bounded parallelism, a batch only once the previous one is done."""
+        created = 0
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            for batch in batches:
+                started = time.monotonic()
+                results = list(pool.map(lambda resource: self.create(namespace, resource), batch))
+                created += sum(results)
+                kinds = sorted({resource["kind"] for resource in batch})
+                show_val("Created", "{} of {} {}, {} updated, in {:.2f}s".format(
+                    sum(results), len(batch), "/".join(kinds), len(batch) - sum(results), time.monotonic() - started))
+        return created
 
-    for node_index in range(1,2):
-        hosts_file["all"]["children"]["bootstrap"]["hosts"].update({ "{}-{}".format("casper-node-" + network_name, str(node_index).zfill(3)): ""})
-    for node_index in range(2, total_node_count - zero_weight_count + 1):
-        hosts_file["all"]["children"]["validators"]["hosts"].update({ "{}-{}".format("casper-node-" + network_name, str(node_index).zfill(3)): ""})
-    for node_index in range(validator_count + 1, total_node_count + 1):
-        hosts_file["all"]["children"]["zero_weight"]["hosts"].update({ "{}-{}".format("casper-node-" + network_name, str(node_index).zfill(3)): ""})
+    def watch(self, path, stop):
+        """Yield (type, object) of a collection: the current objects, then a watch stream,
+        relisting when the stream ends or its resourceVersion expires."""
+        while not stop.is_set():
+            response = self.request("GET", path)
+            if response.status_code >= 300:
+                raise Exception("listing {} failed: {}".format(path, response.status_code))
+            listing = response.json()
+            for item in listing.get("items") or []:
+                yield "ADDED", item
+            resource_version = listing["metadata"].get("resourceVersion")
+            while not stop.is_set():
+                params = {"watch": "1", "resourceVersion": resource_version,
+                          "timeoutSeconds": 60, "allowWatchBookmarks": "true"}
+                with self.session.get(self.server + path, params=params, headers=self.headers(),
+                                      stream=True, timeout=(10, 90)) as stream:
+                    if stream.status_code == 410:
+                        break
+                    expired = False
+                    for line in stream.iter_lines():
+                        if stop.is_set():
+                            return
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        if event["type"] == "ERROR":
+                            expired = event["object"].get("code") == 410
+                            break
+                        resource_version = event["object"]["metadata"].get("resourceVersion", resource_version)
+                        if event["type"] != "BOOKMARK":
+                            yield event["type"], event["object"]
+                    if expired:
+                        break
 
-    return(hosts_file)
+class PodTracker:
+    """Follows the pods and events of a namespace with watch streams and records,
+    relative to the start, when each pod was scheduled, pulled its image, started and became ready."""
+
+    STAGES = ["scheduled", "pulled", "started", "ready"]
+    EVENT_STAGES = {"Scheduled": "scheduled", "Pulled": "pulled", "Started": "started"}
+
+    def __init__(self, kube, namespace, expected):
+        self.kube = kube
+        self.namespace = namespace
+        self.expected = expected
+        self.started = time.monotonic()
+        self.pods = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.stop = threading.Event()
+        self.errors = []
+
+    def start(self):
+        for target in [self.watch_pods, self.watch_events]:
+            threading.Thread(target=self.run, args=(target,), daemon=True).start()
+
+    def run(self, target):
+        while not self.stop.is_set():
+            try:
+                target()
+            except Exception as e:
+                # the namespace may not exist yet, retry until stopped
+                self.errors.append(str(e))
+                time.sleep(1)
+
+    def mark(self, pod_name, stage):
+        with self.changed:
+            stages = self.pods.setdefault(pod_name, {})
+            if stage not in stages:
+                stages[stage] = round(time.monotonic() - self.started, 3)
+                if stage == "ready":
+                    show_val("Pod ready", "{} ({}/{}) after {:.1f}s".format(
+                        pod_name, self.ready_count(), self.expected, stages[stage]))
+                self.changed.notify_all()
+
+    def watch_pods(self):
+        for event_type, pod in self.kube.watch("/api/v1/namespaces/{}/pods".format(self.namespace), self.stop):
+            name = pod["metadata"]["name"]
+            conditions = {c["type"]: c["status"] for c in pod.get("status", {}).get("conditions") or []}
+            if conditions.get("PodScheduled") == "True":
+                self.mark(name, "scheduled")
+            if conditions.get("Ready") == "True":
+                self.mark(name, "ready")
+
+    def watch_events(self):
+        for event_type, event in self.kube.watch("/api/v1/namespaces/{}/events".format(self.namespace), self.stop):
+            involved = event.get("involvedObject", {})
+            stage = self.EVENT_STAGES.get(event.get("reason"))
+            if involved.get("kind") == "Pod" and stage:
+                self.mark(involved["name"], stage)
+
+    def ready_count(self):
+        return sum(1 for stages in self.pods.values() if "ready" in stages)
+
+    def wait(self, timeout):
+        """True once the expected number of pods are ready, False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while self.ready_count() < self.expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.changed.wait(min(remaining, 5))
+        self.stop.set()
+        return self.ready_count() >= self.expected
+
+    def timeline(self):
+        return {name: {stage: stages.get(stage) for stage in self.STAGES}
+                for name, stages in sorted(self.pods.items())}
+
+    def report(self):
+        for stage in self.STAGES:
+            values = sorted(stages[stage] for stages in self.pods.values() if stage in stages)
+            if values:
+                show_val(stage.capitalize(), "{} pods, p50 {:.1f}s, p90 {:.1f}s, last {:.1f}s".format(
+                    len(values), values[len(values) // 2], values[int(len(values) * 0.9)], values[-1]))
 
 def create_protocol_package(network_name, obj, staging_bin_path, staging_config_path, target_path, node_version):
-    
-    current_path = os.path.dirname(os.path.abspath(__file__))
-    staging_bin_full_path = os.path.join(current_path, staging_bin_path)
 
     # write protocol_versions file in target_path
-    protocol_file_path = os.path.join(current_path, target_path, 'protocol_versions')
+    protocol_file_path = os.path.join(target_path, 'protocol_versions')
     with open(protocol_file_path, 'w+') as f:
         f.write(node_version)
-    show_val("Protocol_versions file", os.path.join(current_path, target_path, 'protocol_versions'))
+    show_val("Protocol_versions file", protocol_file_path)
 
     # create bin.tar.gz in target_path/node_version
-    tar_path = os.path.join(current_path, target_path, node_version)
-    os.chdir(staging_bin_full_path)
-    with tarfile.open(os.path.join(tar_path,'bin.tar.gz'), "w:gz") as tar:
-        for file in ["casper-node"]:
-            tar.add(os.path.basename(file))
+    tar_path = os.path.join(target_path, node_version)
+    create_archive(os.path.join(tar_path, 'bin.tar.gz'), [
+        (file, os.path.join(staging_bin_path, file)) for file in ["casper-node"]
+    ], obj)
     show_val("Binary archive", os.path.join(tar_path,'bin.tar.gz'))
 
     # create config.tar.gz in target_path/node_version
-    staging_config_full_path = os.path.join(current_path, staging_config_path)
-    tar_path = os.path.join(current_path, target_path, node_version)
-    os.chdir(staging_config_full_path)
-    with tarfile.open(os.path.join(tar_path, 'config.tar.gz'), "w:gz") as tar:
-        for file in ["chainspec.toml","config-example.toml","accounts.toml"]:
-            tar.add(os.path.basename(file))
+    create_archive(os.path.join(tar_path, 'config.tar.gz'), [
+        (file, os.path.join(staging_config_path, file))
+        for file in ["chainspec.toml","config-example.toml","accounts.toml"]
+    ], obj)
     show_val("Config archive", os.path.join(tar_path, 'config.tar.gz'))
 
-    os.chdir(current_path)
+def create_archive(archive_path, members, obj, compression="gz", quiet=False):
+    """Write a reproducible, compressed tar of (arcname, path) members.
+
+    Entries are sorted and their owner and mtime fixed, so the same content always
+    gives the same bytes. Compression runs on a thread pool. A hidden `.<name>.inputs`
+    file next to the archive records the member digests, and when they match the
+    existing archive is reused. Returns True if the archive was written, False if reused.
+    """
+    inputs_path = os.path.join(os.path.dirname(archive_path), "." + os.path.basename(archive_path) + ".inputs")
+    previous = read_json(inputs_path) if os.path.isfile(inputs_path) else {}
+    entries = archive_entries(members, previous.get("files", {}))
+    inputs = {
+        "compression": compression,
+        "files": {arcname: entry for arcname, path, entry in entries},
+    }
+    inputs["digest"] = hashlib.sha256(json.dumps(
+        [compression] + [[arcname, entry["mode"], entry.get("sha256")] for arcname, path, entry in entries]
+    ).encode()).hexdigest()
+
+    if os.path.isfile(archive_path) and previous.get("digest") == inputs["digest"]:
+        if not quiet:
+            show_val("Unchanged archive", archive_path)
+        return False
+
+    partial_path = inputs_path[:-len(".inputs")] + ".partial"
+    with open(partial_path, "wb") as f:
+        with ParallelCompressor(f, compression, obj.get("package-workers")) as compressor:
+            with tarfile.open(fileobj=compressor, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for arcname, path, entry in entries:
+                    info = tarfile.TarInfo(arcname)
+                    info.mtime = ARCHIVE_MTIME
+                    info.mode = entry["mode"]
+                    if path is None:
+                        info.type = tarfile.DIRTYPE
+                        tar.addfile(info)
+                        continue
+                    info.size = entry["size"]
+                    with open(path, "rb") as member:
+                        tar.addfile(info, member)
+    os.replace(partial_path, archive_path)
+    with open(inputs_path, "w") as f:
+        json.dump(inputs, f, indent=2)
+    obj["timings"].add_bytes(os.path.getsize(archive_path))
+    return True
+
+# bundle each node's etc/, the shared files the nodes reference and the staged
+# binaries into bundles/, returning the sha256 of every bundle by its path in the network
+def create_bundles(network_path, obj, binary_bundle=True):
+    nodes_path = os.path.join(network_path, "nodes")
+    bundles_path = os.path.join(network_path, "bundles")
+    Path(os.path.join(bundles_path, "nodes")).mkdir(parents=True, exist_ok=True)
+
+    bundles = {}
+    node_names = sorted(os.listdir(nodes_path)) if os.path.isdir(nodes_path) else []
+    written = 0
+    shared_digests = set()
+    for node_name in node_names:
+        etc_path = os.path.join(nodes_path, node_name, "etc")
+        # shared files stay out of the node bundles, every node gets them from the shared bundle
+        members = [(name, os.path.join(etc_path, name)) for name in sorted(os.listdir(etc_path))]
+        bundle_path = os.path.join(bundles_path, "nodes", node_name + ".tar.gz")
+        written += create_archive(bundle_path, members, obj, quiet=True)
+        bundles["bundles/nodes/{}.tar.gz".format(node_name)] = file_sha256(bundle_path)
+        manifest_path = os.path.join(etc_path, "casper", SHARED_MANIFEST)
+        if os.path.isfile(manifest_path):
+            shared_digests.update(read_json(manifest_path).values())
+    # drop the bundles of nodes an incremental create-network removed, with their hidden inputs
+    bundle_names = set(node_name + ".tar.gz" for node_name in node_names)
+    for name in os.listdir(os.path.join(bundles_path, "nodes")):
+        if name.lstrip(".").replace(".tar.gz.inputs", ".tar.gz") not in bundle_names:
+            os.remove(os.path.join(bundles_path, "nodes", name))
+    show_val("Node bundles", "{} ({} rebuilt)".format(len(node_names), written))
+
+    # the shared files any node references, named by digest, for pods to fetch in a single GET
+    bundle_path = os.path.join(bundles_path, SHARED_BUNDLE)
+    if shared_digests:
+        shared_path = os.path.join(network_path, "shared")
+        create_archive(bundle_path, [(digest, os.path.join(shared_path, digest)) for digest in sorted(shared_digests)],
+                       obj)
+        bundles["bundles/" + SHARED_BUNDLE] = file_sha256(bundle_path)
+    elif os.path.isfile(bundle_path):
+        os.remove(bundle_path)
+
+    bin_path = os.path.join(network_path, "staging", "bin")
+    bundle_path = os.path.join(bundles_path, "bin.tar.gz")
+    if not binary_bundle:
+        # the binaries are published as chunks instead
+        if os.path.isfile(bundle_path):
+            os.remove(bundle_path)
+    elif os.path.isdir(bin_path):
+        create_archive(bundle_path, [(name, os.path.join(bin_path, name)) for name in sorted(os.listdir(bin_path))], obj)
+        bundles["bundles/bin.tar.gz"] = file_sha256(bundle_path)
+        show_val("Binary bundle", bundle_path)
+    return bundles
+
+def create_binary_chunk_list(network_path, workers):
+    """Chunks the binaries of staging/bin and writes their chunk list, returning it.
+
+    Files whose digest matches the previous list keep their chunks without being read again."""
+    bin_path = os.path.join(network_path, "staging", "bin")
+    list_path = os.path.join(network_path, *BINARY_CHUNK_LIST.split("/"))
+    previous_files = read_json(list_path)["files"] if os.path.isfile(list_path) else {}
+
+    files = {}
+    members = [(name, os.path.join(bin_path, name)) for name in sorted(os.listdir(bin_path))]
+    for arcname, path, entry in archive_entries(members, previous_files):
+        if path is None:
+            continue
+        known = previous_files.get(arcname, {})
+        if known.get("sha256") == entry["sha256"] and "chunks" in known:
+            entry["chunks"] = known["chunks"]
+        else:
+            entry["chunks"] = binary_chunks(path, workers)
+        files[arcname] = entry
+
+    chunk_list = {"chunk_store": BINARY_CHUNK_STORE, "files": files}
+    Path(os.path.dirname(list_path)).mkdir(parents=True, exist_ok=True)
+    with open(list_path, "w") as f:
+        json.dump(chunk_list, f, indent=2, sort_keys=True)
+    return chunk_list
+
+def binary_chunks(path, workers, segment_size=16 * MiB):
+    """[sha256, size] of the content defined chunks of a file.
+
+    Cut points only depend on the bytes before them, so segments of the file are
+    scanned in parallel; the chunk size limits are applied afterwards."""
+    size = os.path.getsize(path)
+    starts = list(range(0, size, segment_size))
+    ends = [min(size, start + segment_size) for start in starts]
+    if len(starts) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+            cut_points = list(itertools.chain.from_iterable(
+                pool.map(gear_cut_points, itertools.repeat(path), starts, ends)))
+    else:
+        cut_points = list(itertools.chain.from_iterable(map(gear_cut_points, itertools.repeat(path), starts, ends)))
+
+    chunks = []
+    offset = 0
+    with open(path, "rb") as f:
+        while offset < size:
+            index = bisect.bisect_left(cut_points, offset + BINARY_CHUNK_MIN)
+            end = min(cut_points[index] if index < len(cut_points) else size, offset + BINARY_CHUNK_MAX)
+            chunks.append([hashlib.sha256(f.read(end - offset)).hexdigest(), end - offset])
+            offset = end
+    return chunks
+
+def gear_cut_points(path, start, end, block_size=64 * 1024):
+    """Offsets in (start, end] of a file where the gear hash of the preceding bytes is zero."""
+    window = BINARY_CHUNK_BITS
+    cut_points = []
+    with open(path, "rb") as f:
+        for block_start in range(start, end, block_size):
+            # the window of the first offsets reaches back into the previous block
+            read_start = max(0, block_start - window + 1)
+            f.seek(read_start)
+            data = f.read(min(end, block_start + block_size) - read_start)
+            cut_points += [read_start + position + 1 for position in gear_zero_positions(data)]
+    return cut_points
+
+def gear_zero_positions(data):
+    """Positions of data after which the gear hash of the last BINARY_CHUNK_BITS bytes is zero.
+
+    The hash h = (h << 1) + GEAR[byte], taken mod 2**BINARY_CHUNK_BITS, only depends on that
+    many bytes, so instead of looping over bytes it is summed for every position at once: one
+    big integer holds GEAR[byte] in a 40 bit lane per byte, and shifting it by a lane and a bit
+    adds the previous byte's term. 40 bits hold the sum without carrying into the next lane."""
+    window = BINARY_CHUNK_BITS
+    lane_bytes = 5
+    lane_shift = 8 * lane_bytes + 1
+    count = len(data)
+    lanes = bytearray(lane_bytes * count)
+    for plane, table in enumerate(GEAR_PLANES):
+        lanes[plane::lane_bytes] = data.translate(table)
+    terms = int.from_bytes(lanes, "little")
+
+    # sums of 1, 2, 4, ... consecutive terms, combined into a sum of `window` terms
+    sums = {1: terms}
+    width = 1
+    while width * 2 <= window:
+        sums[width * 2] = sums[width] + (sums[width] << (lane_shift * width))
+        width *= 2
+    hashes, summed = sums[width], width
+    for width in sorted(sums, reverse=True):
+        if summed + width <= window:
+            hashes += sums[width] << (lane_shift * summed)
+            summed += width
+
+    hashes = (hashes & gear_lane_mask(count)).to_bytes(lane_bytes * count, "little")
+    zeros = 0
+    for plane in range(3):
+        zeros |= int.from_bytes(hashes[plane::lane_bytes], "little")
+    zeros = zeros.to_bytes(count, "little")
+    # the first window - 1 positions don't have a full window of bytes
+    return [match.start() for match in re.finditer(b"\x00", zeros) if match.start() >= window - 1]
+
+@functools.lru_cache(maxsize=4)
+def gear_lane_mask(count):
+    return int.from_bytes(((1 << BINARY_CHUNK_BITS) - 1).to_bytes(5, "little") * count, "little")
+
+# fixed mtime of archive entries, so archives only change with their content
+ARCHIVE_MTIME = 0
+
+def archive_entries(members, previous_files):
+    """Sorted (arcname, path, entry) of members, directories expanded.
+
+    File digests are reused from previous_files while size and mtime are unchanged."""
+    entries = []
+    for arcname, path in members:
+        if os.path.isdir(path):
+            entries.append((arcname, None, {"mode": 0o755}))
+            for root, dirs, files in os.walk(path):
+                for name in dirs:
+                    entries.append((os.path.join(arcname, os.path.relpath(os.path.join(root, name), path)), None, {"mode": 0o755}))
+                for name in files:
+                    entries.append((os.path.join(arcname, os.path.relpath(os.path.join(root, name), path)), os.path.join(root, name), None))
+        else:
+            entries.append((arcname, path, None))
+
+    result = []
+    for arcname, path, entry in sorted(entries, key=lambda e: e[0]):
+        if entry is None:
+            entry = file_entry(path, previous_files.get(arcname))
+        result.append((arcname, path, entry))
+    return result
+
+def file_entry(path, known=None):
+    """Mode, size, mtime and sha256 of a file, reusing the digest of `known` while size and mtime match."""
+    stat = os.stat(path)
+    entry = {
+        "mode": 0o755 if stat.st_mode & 0o100 else 0o644,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    known = known or {}
+    if known.get("size") == entry["size"] and known.get("mtime_ns") == entry["mtime_ns"]:
+        entry["sha256"] = known["sha256"]
+    else:
+        entry["sha256"] = file_sha256(path)
+    return entry
+
+class ParallelCompressor:
+    """Write-only file object compressing fixed size blocks on a thread pool.
+
+    Every block becomes its own gzip member (or bzip2 stream); gzip, bzip2 and
+    tarfile all read the concatenation as one stream. zlib and bz2 release the
+    GIL, so blocks compress in parallel. Output is written in order.
+    """
+
+    BLOCK_SIZE = 4 * MiB
+
+    def __init__(self, fileobj, compression, workers=None):
+        if compression == "gz":
+            self.compress = ParallelCompressor.gzip_block
+        elif compression == "bz2":
+            self.compress = bz2.compress
+        else:
+            raise Exception("unsupported compression {}".format(compression))
+        self.fileobj = fileobj
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.pending = collections.deque()
+        self.buffer = bytearray()
+
+    @staticmethod
+    def gzip_block(block):
+        # wbits 31: gzip header with a zero mtime
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+        return compressor.compress(block) + compressor.flush()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.BLOCK_SIZE:
+            self.submit(bytes(self.buffer[:self.BLOCK_SIZE]))
+            del self.buffer[:self.BLOCK_SIZE]
+        return len(data)
+
+    def submit(self, block):
+        self.pending.append(self.pool.submit(self.compress, block))
+        while len(self.pending) > self.workers * 2:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buffer:
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self.fileobj.write(self.pending.popleft().result())
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def fetch_release_archive(url, archive_path, extract_path):
+    """Make archive_path a current copy of url, extracting it into extract_path.
+
+    A cached archive is revalidated with its ETag/Last-Modified and extracted
+    locally when unchanged. Otherwise the response is streamed to disk in chunks
+    and extracted as it arrives. An interrupted download is kept as a `.part`
+    file and resumed with an HTTP Range request on the next call.
+    """
+    meta_path = archive_path + ".json"
+    part_path = archive_path + ".part"
+    part_meta_path = part_path + ".json"
+    meta = read_json(meta_path) if os.path.isfile(archive_path) else None
+    part_meta = read_json(part_meta_path) if os.path.isfile(part_path) else None
+
+    headers = {}
+    if meta and meta["url"] == url:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    offset = 0
+    validator = part_meta and (part_meta.get("etag") or part_meta.get("last_modified"))
+    if validator and part_meta["url"] == url:
+        offset = os.path.getsize(part_path)
+        headers["Range"] = "bytes={}-".format(offset)
+        headers["If-Range"] = validator
+
+    try:
+        response = requests.get(url, headers=headers, stream=True,
+                                allow_redirects=True, timeout=(3, 30))
+    except requests.exceptions.RequestException:
+        if meta is None:
+            raise
+        response = None
+
+    if response is not None and response.status_code == 416 and "Range" in headers:
+        # the .part file is complete already (interrupted before the rename) or longer than
+        # the archive: start over instead of resuming
+        response.close()
+        os.remove(part_path)
+        os.remove(part_meta_path)
+        return fetch_release_archive(url, archive_path, extract_path)
+
+    with contextlib.ExitStack() as stack:
+        if response is not None:
+            stack.enter_context(response)
+        if response is None or response.status_code == 304 or (
+                response.status_code != 200 and response.status_code != 206 and meta is not None):
+            with tarfile.open(archive_path, mode="r:gz") as tar:
+                tar.extractall(path=extract_path)
+            return "cached" if response is not None else "cached (offline)"
+        response.raise_for_status()
+
+        if response.status_code != 206:
+            offset = 0
+        with open(part_meta_path, "w") as f:
+            json.dump({
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }, f)
+        with open(part_path, "ab" if offset else "wb") as part:
+            reader = TeeReader(response, part, part_path if offset else None, offset)
+            with tarfile.open(fileobj=reader, mode="r|gz") as tar:
+                tar.extractall(path=extract_path)
+            reader.drain()
+
+    os.replace(part_path, archive_path)
+    os.replace(part_meta_path, meta_path)
+    return "downloaded" if not offset else "resumed at {:.1f} MiB".format(offset / MiB)
+
+class TeeReader:
+    """Read-only file object over a streamed response that appends each chunk to sink.
+
+    When resuming, the bytes already in prefix_path are read back first, so the
+    reader always yields the archive from its start."""
+
+    def __init__(self, response, sink, prefix_path=None, prefix_size=0):
+        self.chunks = response.iter_content(chunk_size=MiB)
+        self.sink = sink
+        self.prefix = open(prefix_path, "rb") if prefix_path else None
+        self.prefix_left = prefix_size
+        self.chunk = b""
+        self.offset = 0
+
+    def next_chunk(self):
+        if self.prefix:
+            chunk = self.prefix.read(min(MiB, self.prefix_left))
+            self.prefix_left -= len(chunk)
+            if chunk:
+                return chunk
+            self.prefix.close()
+            self.prefix = None
+        chunk = next(self.chunks, b"")
+        self.sink.write(chunk)
+        return chunk
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self.offset >= len(self.chunk):
+                self.chunk = self.next_chunk()
+                self.offset = 0
+                if not self.chunk:
+                    break
+            end = len(self.chunk) if size < 0 else min(len(self.chunk), self.offset + size)
+            parts.append(self.chunk[self.offset:end])
+            if size > 0:
+                size -= end - self.offset
+            self.offset = end
+        return b"".join(parts)
+
+    def drain(self):
+        """Consume whatever the archive reader left unread, so the copy on disk is complete."""
+        while self.next_chunk():
+            pass
+
+class SnapshotStore:
+    """Node storage as fixed size chunks, gzip compressed and stored once under
+    chunks/<sha256> however many files and nodes contain them. Chunks of zeros
+    (including holes of sparse files) are not stored at all."""
+
+    def __init__(self, snapshots_path, chunk_size=4 * MiB, compression_level=6):
+        self.chunks_path = os.path.join(snapshots_path, "chunks")
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.seen = set()
+
+    def snapshot(self, storage_path, pool):
+        """The manifest of a storage directory, storing the chunks it needs."""
+        Path(self.chunks_path).mkdir(parents=True, exist_ok=True)
+        files = []
+        dirs = []
+        for root, subdirs, filenames in os.walk(storage_path):
+            subdirs.sort()
+            relative_root = os.path.relpath(root, storage_path)
+            if relative_root != ".":
+                dirs.append(relative_root.replace(os.sep, "/"))
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                if os.path.islink(path) or not os.path.isfile(path):
+                    continue
+                size = os.path.getsize(path)
+                offsets = range(0, size, self.chunk_size)
+                files.append({
+                    "path": os.path.relpath(path, storage_path).replace(os.sep, "/"),
+                    "size": size,
+                    "mode": os.stat(path).st_mode & 0o7777,
+                    "chunks": bounded_map(pool, lambda offset, path=path: self.store_chunk(path, offset), offsets),
+                })
+        return {"chunk_size": self.chunk_size, "dirs": dirs, "files": files}
+
+    def store_chunk(self, path, offset):
+        """sha256 of the chunk at offset, None when it is all zeros."""
+        with open(path, "rb") as f:
+            try:
+                # a hole up to the chunk's end reads as zeros
+                if os.lseek(f.fileno(), offset, os.SEEK_DATA) >= offset + self.chunk_size:
+                    data = None
+                else:
+                    data = os.pread(f.fileno(), self.chunk_size, offset)
+            except OSError:
+                # ENXIO: only a hole is left, or SEEK_DATA is unsupported
+                data = os.pread(f.fileno(), self.chunk_size, offset) if offset < os.fstat(f.fileno()).st_size else None
+        self.count("chunks")
+        if data is None or not data.strip(b"\0"):
+            self.count("zero_chunks")
+            self.count("bytes", min(self.chunk_size, os.path.getsize(path) - offset))
+            return None
+        self.count("bytes", len(data))
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            new = digest not in self.seen
+            self.seen.add(digest)
+        if new:
+            self.count("unique_chunks")
+            chunk_path = os.path.join(self.chunks_path, digest)
+            if not os.path.isfile(chunk_path):
+                compressed = gzip.compress(data, self.compression_level, mtime=0)
+                partial_path = "{}.{}.partial".format(chunk_path, threading.get_ident())
+                with open(partial_path, "wb") as f:
+                    f.write(compressed)
+                os.replace(partial_path, chunk_path)
+                self.count("new_chunks")
+                self.count("stored_bytes", len(compressed))
+        return digest
+
+    def restore(self, manifest, storage_path, pool):
+        """Write a node's storage from its manifest, returning the bytes restored."""
+        for directory in manifest["dirs"]:
+            Path(storage_path, directory).mkdir(parents=True, exist_ok=True)
+        chunk_size = manifest["chunk_size"]
+        restored = 0
+        for entry in manifest["files"]:
+            path = os.path.join(storage_path, *entry["path"].split("/"))
+            Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                # zero chunks stay holes
+                f.truncate(entry["size"])
+                fd = f.fileno()
+                chunks = [(index * chunk_size, digest) for index, digest in enumerate(entry["chunks"]) if digest]
+                restored += sum(bounded_map(pool, lambda chunk: self.restore_chunk(fd, *chunk), chunks))
+            os.chmod(path, entry["mode"])
+        return restored
+
+    def restore_chunk(self, fd, offset, digest):
+        with open(os.path.join(self.chunks_path, digest), "rb") as f:
+            data = gzip.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise Exception("chunk {} is corrupt".format(digest))
+        os.pwrite(fd, data, offset)
+        return len(data)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+def bounded_map(pool, function, items, window=64):
+    """pool.map with at most window items in flight, results in order."""
+    results = []
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= window:
+            results.append(pending.popleft().result())
+    while pending:
+        results.append(pending.popleft().result())
+    return results
+
+def write_snapshot_manifest(path, manifest):
+    Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def create_s3_client(aws_profile, endpoint_url, max_connections):
+    """One S3 client, shared by every upload thread, with a pool sized to match."""
+    if aws_profile=="None":
+        session = boto3.session.Session()
+    else:
+        session = boto3.session.Session(profile_name=aws_profile)
+    return session.client(
+        's3',
+        endpoint_url=endpoint_url,
+        config=botocore.config.Config(max_pool_connections=max(10, max_connections)),
+    )
+
+# list (local path, s3 key) pairs for every file below local_root
+def collect_uploads(local_root, prefix):
+    uploads = []
+    for path, subdirs, files in os.walk(local_root):
+        directory_name = os.path.relpath(path, local_root)
+        for file in sorted(files):
+            # hidden files are local bookkeeping, e.g. archive inputs
+            if file.startswith("."):
+                continue
+            key_path = file if directory_name == "." else os.path.join(directory_name, file)
+            uploads.append((os.path.join(path, file), "/".join([prefix] + key_path.split(os.sep))))
+    return uploads
+
+def upload_files(s3, bucket, uploads, workers, transfer_config, skip_unchanged, metadata=None):
+    """Upload (local path, s3 key) pairs on a bounded worker pool and report throughput.
+
+    `metadata` maps keys to the user metadata stored with their object."""
+    started = time.monotonic()
+    metadata = metadata or {}
+
+    def upload(item):
+        local_path, key = item
+        size = os.path.getsize(local_path)
+        if skip_unchanged and remote_etag(s3, bucket, key) == local_etag(local_path, transfer_config):
+            return key, size, 0, True
+        file_started = time.monotonic()
+        extra_args = {"Metadata": metadata[key]} if key in metadata else None
+        s3.upload_file(local_path, bucket, key, ExtraArgs=extra_args, Config=transfer_config)
+        return key, size, time.monotonic() - file_started, False
+
+    uploaded_count = uploaded_bytes = skipped_count = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for key, size, seconds, skipped in pool.map(upload, uploads):
+            if skipped:
+                skipped_count += 1
+                show_val("Unchanged", key)
+                continue
+            uploaded_count += 1
+            uploaded_bytes += size
+            show_val("Uploaded", "{} ({})".format(key, format_throughput(size, seconds)))
+
+    elapsed = time.monotonic() - started
+    show_val("Upload total", "{} files, {} skipped, {}".format(
+        uploaded_count, skipped_count, format_throughput(uploaded_bytes, elapsed)))
+    return uploaded_count, skipped_count, uploaded_bytes
+
+def upload_binary_chunks(s3, bucket, network_path, chunk_list, workers):
+    """Upload the chunks of chunk_list missing from the bucket's chunk store, gzipped."""
+    bin_path = os.path.join(network_path, "staging", "bin")
+    chunks = {}
+    for arcname, entry in chunk_list["files"].items():
+        offset = 0
+        for digest, size in entry["chunks"]:
+            chunks.setdefault(digest, (os.path.join(bin_path, *arcname.split("/")), offset, size))
+            offset += size
+
+    def upload(item):
+        digest, (path, offset, size) = item
+        key = "/".join([chunk_list["chunk_store"], digest])
+        if remote_etag(s3, bucket, key) is not None:
+            return 0, 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            body = gzip.compress(f.read(size), mtime=0)
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+        return size, len(body)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        uploaded = [result for result in pool.map(upload, chunks.items()) if result[0]]
+    uploaded_bytes = sum(compressed for size, compressed in uploaded)
+    show_val("Binary chunks", "{} ({:.1f} MiB), {} new ({:.1f} MiB), uploaded {} gzipped".format(
+        len(chunks), sum(size for path, offset, size in chunks.values()) / MiB, len(uploaded),
+        sum(size for size, compressed in uploaded) / MiB, format_throughput(uploaded_bytes, time.monotonic() - started)))
+    return len(uploaded), uploaded_bytes
+
+def list_keys(s3, bucket, prefix):
+    """Keys of the objects starting with prefix."""
+    return [item["Key"] for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix)
+            for item in page.get("Contents", [])]
+
+def delete_objects(s3, bucket, keys):
+    """Delete keys in batches of the 1000 keys a DeleteObjects request allows."""
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key} for key in keys[start:start + 1000]],
+            "Quiet": True,
+        })
+    if keys:
+        show_val("Deleted", "{} objects".format(len(keys)))
+    return len(keys)
+
+def remote_etag(s3, bucket, key):
+    try:
+        return s3.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+def local_etag(local_path, transfer_config):
+    """The ETag S3 reports for local_path when uploaded with transfer_config.
+
+    Single part uploads use the MD5 of the content, multipart uploads the MD5
+    of the concatenated part MD5s followed by the part count."""
+    size = os.path.getsize(local_path)
+    chunksize = transfer_config.multipart_chunksize
+    with open(local_path, "rb") as f:
+        if size < transfer_config.multipart_threshold:
+            return hashlib.md5(f.read()).hexdigest()
+        digests = [hashlib.md5(chunk).digest() for chunk in iter(lambda: f.read(chunksize), b"")]
+    return "{}-{}".format(hashlib.md5(b"".join(digests)).hexdigest(), len(digests))
+
+def format_throughput(size, seconds):
+    return "{:.1f} MiB in {:.2f}s, {:.1f} MiB/s".format(
+        size / MiB, seconds, size / MiB / seconds if seconds > 0 else 0)
+
+# json-rpc endpoints of every node in the network's hosts.yaml
+def load_rpc_urls(target_path, network_name, obj, ingress_domain):
+    return [url for node, url in node_urls(target_path, network_name, obj, ingress_domain, 7777, "/rpc")]
+
+# (node, url) of an endpoint of every node in hosts.yaml, in-cluster or through the ingress
+def node_urls(target_path, network_name, obj, ingress_domain, port, path):
+    hosts_path = os.path.join(target_path, "hosts.yaml")
+    if not os.path.isfile(hosts_path):
+        return []
+    hosts = yaml.load(open(hosts_path), Loader=yaml.FullLoader)
+    nodes = [node for role, role_nodes in kube_role_nodes(hosts) for node in role_nodes]
+    if ingress_domain:
+        return [(node, "http://{}.{}{}".format(node, ingress_domain, path)) for node in nodes]
+    addresses = kube_node_addresses(hosts, network_name, obj["workload"])
+    return [(node, "http://{}:{}{}".format(addresses.get(node, node), port, path)) for node in nodes]
+
+def load_chain_name(target_path, network_name):
+    chainspecs = sorted(Path(target_path, "staging", "config").glob("*/chainspec.toml"))
+    if chainspecs:
+        return toml.load(open(chainspecs[-1]))["network"]["name"]
+    return network_name
+
+# (public key hex, private key) of the accounts deploys are sent from
+def load_senders(target_path, accounts_path, limit):
+    if not accounts_path and os.path.isfile(os.path.join(target_path, *ACCOUNTS_EXPORT.split("/"))):
+        accounts_path = os.path.join(target_path, *ACCOUNTS_EXPORT.split("/"))
+    if accounts_path:
+        senders = []
+        with open(accounts_path) as f:
+            for line in f:
+                if len(senders) >= limit:
+                    break
+                if line.strip():
+                    account = json.loads(line)
+                    senders.append((account["public_key"],
+                                    Ed25519PrivateKey.from_private_bytes(bytes.fromhex(account["secret_key"]))))
+        return senders
+    faucet_path = os.path.join(target_path, "staging", "faucet")
+    secret_key = serialization.load_pem_private_key(
+        open(os.path.join(faucet_path, "secret_key.pem"), "rb").read(), password=None)
+    return [(open(os.path.join(faucet_path, "public_key_hex")).read().strip(), secret_key)]
+
+def parse_duration_millis(value):
+    """Milliseconds of a humantime duration such as 30m, 1h or 90s."""
+    units = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+    total = 0
+    for number, unit in re.findall(r"(\d+)\s*(ms|s|m|h|d)", value):
+        total += int(number) * units[unit]
+    if not total:
+        raise Exception("invalid duration {}".format(value))
+    return total
+
+# casper bytesrepr encoding of the values a transfer deploy is made of
+def bytesrepr_u32(value):
+    return value.to_bytes(4, "little")
+
+def bytesrepr_u64(value):
+    return value.to_bytes(8, "little")
+
+def bytesrepr_bytes(value):
+    return bytesrepr_u32(len(value)) + value
+
+def bytesrepr_string(value):
+    return bytesrepr_bytes(value.encode("utf-8"))
+
+def bytesrepr_u512(value):
+    # length prefixed little endian with trailing zero bytes trimmed
+    data = value.to_bytes(64, "little").rstrip(b"\0")
+    return bytes([len(data)]) + data
+
+# CLType tags
+CL_TYPE_U64 = 5
+CL_TYPE_U512 = 8
+CL_TYPE_OPTION = 13
+CL_TYPE_PUBLIC_KEY = 22
+
+def cl_value(cl_type_bytes, value_bytes, json_type, parsed):
+    return {"bytes": value_bytes, "cl_type_bytes": cl_type_bytes, "json_type": json_type, "parsed": parsed}
+
+def cl_u512(value):
+    return cl_value(bytes([CL_TYPE_U512]), bytesrepr_u512(value), "U512", str(value))
+
+def cl_option_u64(value):
+    return cl_value(bytes([CL_TYPE_OPTION, CL_TYPE_U64]), b"\1" + bytesrepr_u64(value), {"Option": "U64"}, value)
+
+def cl_public_key(public_key_hex):
+    return cl_value(bytes([CL_TYPE_PUBLIC_KEY]), bytes.fromhex(public_key_hex), "PublicKey", public_key_hex)
+
+def bytesrepr_runtime_args(args):
+    data = bytesrepr_u32(len(args))
+    for name, value in args:
+        data += bytesrepr_string(name) + bytesrepr_bytes(value["bytes"]) + value["cl_type_bytes"]
+    return data
+
+def json_runtime_args(args):
+    return [[name, {"cl_type": value["json_type"], "bytes": value["bytes"].hex(), "parsed": value["parsed"]}]
+            for name, value in args]
+
+def blake2b256(data):
+    return hashlib.blake2b(data, digest_size=32).digest()
+
+class TransferFactory:
+    """Signed native transfer deploys, cycling through the senders and a set of recipients."""
+
+    def __init__(self, chain_name, senders, amount, payment, ttl, recipients=64):
+        self.chain_name = chain_name
+        self.senders = senders
+        self.amount = amount
+        self.ttl = ttl
+        self.ttl_millis = parse_duration_millis(ttl)
+        self.payment_args = [("amount", cl_u512(payment))]
+        # payment: empty module bytes, paid from the account's main purse
+        self.payment_bytes = b"\0" + bytesrepr_bytes(b"") + bytesrepr_runtime_args(self.payment_args)
+        self.recipients = [
+            "01" + Ed25519PrivateKey.generate().public_key().public_bytes(
+                serialization.Encoding.Raw, serialization.PublicFormat.Raw).hex()
+            for _ in range(recipients)
+        ]
+        self.counter = 0
+
+    def deploy(self, transfer_id, timestamp_millis):
+        public_key_hex, secret_key = self.senders[transfer_id % len(self.senders)]
+        session_args = [
+            ("amount", cl_u512(self.amount)),
+            ("target", cl_public_key(self.recipients[transfer_id % len(self.recipients)])),
+            ("id", cl_option_u64(transfer_id)),
+        ]
+        # session: the Transfer variant (tag 5)
+        session_bytes = b"\5" + bytesrepr_runtime_args(session_args)
+        body_hash = blake2b256(self.payment_bytes + session_bytes)
+
+        header_bytes = (
+            bytes.fromhex(public_key_hex)
+            + bytesrepr_u64(timestamp_millis)
+            + bytesrepr_u64(self.ttl_millis)
+            + bytesrepr_u64(1)  # gas price
+            + body_hash
+            + bytesrepr_u32(0)  # dependencies
+            + bytesrepr_string(self.chain_name)
+        )
+        deploy_hash = blake2b256(header_bytes)
+        signature = secret_key.sign(deploy_hash)
+
+        timestamp = datetime.fromtimestamp(timestamp_millis / 1000, timezone.utc)
+        return {
+            "hash": deploy_hash.hex(),
+            "header": {
+                "account": public_key_hex,
+                "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%S.") + "{:03d}Z".format(timestamp_millis % 1000),
+                "ttl": self.ttl,
+                "gas_price": 1,
+                "body_hash": body_hash.hex(),
+                "dependencies": [],
+                "chain_name": self.chain_name,
+            },
+            "payment": {"ModuleBytes": {"module_bytes": "", "args": json_runtime_args(self.payment_args)}},
+            "session": {"Transfer": {"args": json_runtime_args(session_args)}},
+            "approvals": [{"signer": public_key_hex, "signature": "01" + signature.hex()}],
+        }
+
+    def batch(self, size):
+        """size account_put_deploy request bodies, signed now."""
+        timestamp_millis = int(time.time() * 1000)
+        bodies = []
+        for _ in range(size):
+            self.counter += 1
+            bodies.append(json.dumps({
+                "jsonrpc": "2.0",
+                "id": self.counter,
+                "method": "account_put_deploy",
+                "params": {"deploy": self.deploy(self.counter, timestamp_millis)},
+            }).encode())
+        return bodies
+
+class HttpConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one endpoint, for asyncio."""
+
+    def __init__(self, url, size):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = parts.scheme == "https"
+        self.path = parts.path or "/"
+        self.idle = asyncio.Queue()
+        self.slots = asyncio.Semaphore(size)
+
+    async def post(self, body):
+        """(status, response body) of a POST, reusing an idle connection when there is one."""
+        return await self.request((
+            "POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n"
+            "Content-Length: {}\r\n\r\n".format(self.path, self.host, len(body))
+        ).encode() + body)
+
+    async def get(self):
+        """(status, response body) of a GET of the pool's path."""
+        return await self.request(
+            "GET {} HTTP/1.1\r\nHost: {}\r\nAccept: application/json\r\n\r\n".format(self.path, self.host).encode())
+
+    async def request(self, message):
+        async with self.slots:
+            connection = self.idle.get_nowait() if not self.idle.empty() else None
+            for attempt in range(2):
+                if connection is None:
+                    connection = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+                reader, writer = connection
+                try:
+                    writer.write(message)
+                    await writer.drain()
+                    status, headers, data = await self.read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    writer.close()
+                    connection = None
+                    # a reused connection may have been closed by the server, retry once on a new one
+                    if attempt == 1:
+                        raise
+                    continue
+                except BaseException:
+                    # e.g. cancelled by a timeout half way through a response
+                    writer.close()
+                    raise
+                if headers.get("connection", "").lower() == "close":
+                    writer.close()
+                else:
+                    self.idle.put_nowait(connection)
+                return status, data
+
+    @staticmethod
+    async def read_response(reader):
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # trailers end with an empty line
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            return status, headers, b"".join(chunks)
+        return status, headers, await reader.readexactly(int(headers.get("content-length", 0)))
+
+    def close(self):
+        while not self.idle.empty():
+            reader, writer = self.idle.get_nowait()
+            writer.close()
+
+class LoadGenerator:
+    """Submits pre-signed deploys round robin over the nodes at a scheduled rate,
+    recording submit latencies and errors."""
+
+    BATCH_SIZE = 256
+
+    def __init__(self, urls, factory, connections, max_in_flight, report_interval):
+        self.urls = urls
+        self.factory = factory
+        self.connections = connections
+        self.max_in_flight = max_in_flight
+        self.report_interval = report_interval
+        self.latencies = []
+        self.errors = collections.Counter()
+        self.submitted = 0
+
+    @staticmethod
+    def scheduled(elapsed, tps, ramp_to, ramp_seconds):
+        """Deploys due after elapsed seconds: the integral of the (ramping) rate."""
+        if not ramp_to:
+            return tps * elapsed
+        ramp = min(elapsed, ramp_seconds)
+        due = tps * ramp + (ramp_to - tps) * ramp * ramp / (2 * ramp_seconds)
+        return due + ramp_to * max(0, elapsed - ramp_seconds)
+
+    async def run(self, tps, ramp_to, ramp_seconds, duration):
+        loop = asyncio.get_running_loop()
+        self.pools = [HttpConnectionPool(url, self.connections) for url in self.urls]
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        # deploys are signed a batch ahead on a worker thread, off the submit path
+        signed = asyncio.Queue(maxsize=4)
+        signer = asyncio.ensure_future(self.sign(loop, signed))
+
+        started = loop.time()
+        next_report = started + self.report_interval
+        bodies = []
+        tasks = set()
+        while True:
+            elapsed = loop.time() - started
+            if elapsed >= duration:
+                break
+            due = int(self.scheduled(elapsed, tps, ramp_to, ramp_seconds)) - self.submitted
+            for _ in range(due):
+                if not bodies:
+                    bodies = await signed.get()
+                await self.in_flight.acquire()
+                pool = self.pools[self.submitted % len(self.pools)]
+                task = asyncio.ensure_future(self.submit(pool, bodies.pop()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                self.submitted += 1
+            if loop.time() >= next_report:
+                self.report(loop.time() - started)
+                next_report += self.report_interval
+            await asyncio.sleep(0.005)
+
+        signer.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+        for pool in self.pools:
+            pool.close()
+        return self.stats(loop.time() - started)
+
+    async def sign(self, loop, signed):
+        while True:
+            await signed.put(await loop.run_in_executor(None, self.factory.batch, self.BATCH_SIZE))
+
+    async def submit(self, pool, body):
+        started = time.monotonic()
+        try:
+            status, data = await pool.post(body)
+            if status != 200:
+                self.errors["http {}".format(status)] += 1
+                return
+            response = json.loads(data)
+            if "error" in response:
+                self.errors["rpc {}".format(response["error"].get("code"))] += 1
+                return
+            self.latencies.append(time.monotonic() - started)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            self.errors[type(e).__name__] += 1
+        finally:
+            self.in_flight.release()
+
+    def report(self, elapsed):
+        show_val("{:.0f}s".format(elapsed), "{} submitted, {} accepted, {} errors, p90 {} ms".format(
+            self.submitted, len(self.latencies), sum(self.errors.values()),
+            self.percentiles().get("p90", "-")))
+
+    def percentiles(self):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {}
+        return {
+            name: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2)
+            for name, q in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)]
+        }
+
+    def stats(self, elapsed):
+        errors = sum(self.errors.values())
+        return {
+            "submitted": self.submitted,
+            "accepted": len(self.latencies),
+            "errors": errors,
+            "error_rate": round(errors / self.submitted, 4) if self.submitted else 0,
+            "achieved_tps": round(len(self.latencies) / elapsed, 2) if elapsed else 0,
+            "seconds": round(elapsed, 3),
+            "latency_ms": self.percentiles(),
+            "error_kinds": dict(self.errors),
+        }
+
+class NetworkWatcher:
+    """Polls /status of every node on a fixed cadence, one keep-alive connection per
+    node, and aggregates each poll into a row of the network's time series."""
+
+    COLUMNS = [
+        "time", "elapsed", "nodes", "up", "errors", "height_min", "height_p50", "height_max",
+        "height_spread", "era_max", "blocks_per_minute", "lagging", "peers_min", "peers_p50",
+        "peers_max", "latency_p50_ms", "latency_max_ms", "poll_ms",
+    ]
+    NODE_COLUMNS = ["time", "node", "height", "era", "peers", "latency_ms", "error"]
+
+    def __init__(self, nodes, interval, timeout, lag_blocks, report_interval, rate_window=60):
+        self.nodes = nodes
+        self.interval = interval
+        self.timeout = timeout
+        self.lag_blocks = lag_blocks
+        self.report_interval = report_interval
+        # (elapsed, highest block) of the last rate_window seconds, for blocks per minute
+        self.heights = collections.deque()
+        self.rate_window = rate_window
+        self.polls = 0
+        self.overruns = 0
+
+    async def run(self, duration, series, node_series):
+        raise_open_file_limit(len(self.nodes) + 64)
+        loop = asyncio.get_running_loop()
+        pools = [(node, HttpConnectionPool(url, 1)) for node, url in self.nodes]
+        writer = csv.writer(series)
+        writer.writerow(self.COLUMNS)
+        node_writer = csv.writer(node_series) if node_series else None
+        if node_writer:
+            node_writer.writerow(self.NODE_COLUMNS)
+
+        started = loop.time()
+        next_report = started + self.report_interval
+        try:
+            while not duration or loop.time() - started < duration:
+                poll_started = loop.time()
+                now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+                results = await asyncio.gather(*[self.poll(pool) for node, pool in pools])
+                row = self.aggregate(now, poll_started - started, results)
+                row["poll_ms"] = round((loop.time() - poll_started) * 1000, 1)
+                writer.writerow([row[column] for column in self.COLUMNS])
+                series.flush()
+                if node_writer:
+                    for (node, _), result in zip(pools, results):
+                        node_writer.writerow([now, node] + [result.get(column, "") for column in self.NODE_COLUMNS[2:]])
+                self.polls += 1
+                if loop.time() >= next_report:
+                    self.report(row, results)
+                    next_report += self.report_interval
+
+                # stay on the fixed cadence, skipping slots a slow poll ran into
+                next_poll = started + self.interval * (int((poll_started - started) / self.interval) + 1)
+                if loop.time() > next_poll:
+                    self.overruns += 1
+                    next_poll = started + self.interval * (int((loop.time() - started) / self.interval) + 1)
+                await asyncio.sleep(max(0, next_poll - loop.time()))
+        finally:
+            for node, pool in pools:
+                pool.close()
+
+    async def poll(self, pool):
+        started = time.monotonic()
+        try:
+            status, data = await asyncio.wait_for(pool.get(), self.timeout)
+            if status != 200:
+                return {"error": "http {}".format(status)}
+            info = json.loads(data)
+            block = info.get("last_added_block_info") or {}
+            return {
+                "height": block.get("height", ""),
+                "era": block.get("era_id", ""),
+                "peers": len(info.get("peers") or []),
+                "latency_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+        except asyncio.TimeoutError:
+            return {"error": "timeout"}
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            return {"error": type(e).__name__}
+
+    def aggregate(self, now, elapsed, results):
+        up = [result for result in results if "error" not in result]
+        heights = sorted(result["height"] for result in up if result["height"] != "")
+        peers = sorted(result["peers"] for result in up)
+        latencies = sorted(result["latency_ms"] for result in up)
+        eras = [result["era"] for result in up if result["era"] != ""]
+        row = {
+            "time": now,
+            "elapsed": round(elapsed, 3),
+            "nodes": len(results),
+            "up": len(up),
+            "errors": len(results) - len(up),
+            "height_min": heights[0] if heights else "",
+            "height_p50": median(heights),
+            "height_max": heights[-1] if heights else "",
+            "height_spread": heights[-1] - heights[0] if heights else "",
+            "era_max": max(eras) if eras else "",
+            "blocks_per_minute": "",
+            "lagging": sum(1 for height in heights if height < heights[-1] - self.lag_blocks) if heights else "",
+            "peers_min": peers[0] if peers else "",
+            "peers_p50": median(peers),
+            "peers_max": peers[-1] if peers else "",
+            "latency_p50_ms": median(latencies),
+            "latency_max_ms": latencies[-1] if latencies else "",
+        }
+        if heights:
+            self.heights.append((elapsed, heights[-1]))
+            while self.heights[0][0] < elapsed - self.rate_window:
+                self.heights.popleft()
+            first_elapsed, first_height = self.heights[0]
+            if elapsed > first_elapsed:
+                row["blocks_per_minute"] = round((heights[-1] - first_height) * 60 / (elapsed - first_elapsed), 2)
+        return row
+
+    def report(self, row, results):
+        lagging = [
+            node for (node, _), result in zip(self.nodes, results)
+            if "error" in result or (row["height_max"] != "" and result["height"] != ""
+                                     and result["height"] < row["height_max"] - self.lag_blocks)
+        ]
+        show_val("{:.0f}s".format(row["elapsed"]), "{}/{} up, height {}..{}, {} blocks/min, peers {}..{}, poll {} ms".format(
+            row["up"], row["nodes"], row["height_min"], row["height_max"], row["blocks_per_minute"] or "-",
+            row["peers_min"], row["peers_max"], row["poll_ms"]))
+        if lagging:
+            show_val("Behind or down", ", ".join(lagging[:10]) + (" and {} more".format(len(lagging) - 10) if len(lagging) > 10 else ""))
+
+# signers needed to finalize a block: over 2/3 of the weighted validators in hosts.yaml
+def network_quorum(target_path):
+    hosts_path = os.path.join(target_path, "hosts.yaml")
+    if not os.path.isfile(hosts_path):
+        return 0
+    hosts = yaml.load(open(hosts_path), Loader=yaml.FullLoader)
+    validators = sum(len(nodes) for role, nodes in kube_role_nodes(hosts) if role in ["bootstrap", "validator"])
+    return validators * 2 // 3 + 1
+
+async def read_event_stream(reader, headers):
+    """(event name, payload) of each server-sent event of a response as it arrives."""
+    chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+    pending = b""
+    data = []
+    while True:
+        if chunked:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                return
+            piece = await reader.readexactly(size)
+            await reader.readexactly(2)
+        else:
+            piece = await reader.read(64 * 1024)
+            if not piece:
+                return
+        lines = (pending + piece).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line.startswith(b"data:"):
+                data.append(line[5:])
+            elif not line and data:
+                # the event's payload is a JSON object keyed by the event name
+                payload = json.loads(b"\n".join(data))
+                data = []
+                for name, value in payload.items():
+                    yield name, value
+
+class RollingSamples:
+    """Samples of the last window seconds, at most max_samples of them."""
+
+    def __init__(self, window, max_samples=100000):
+        self.window = window
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def add(self, now, value):
+        self.samples.append((now, value))
+
+    def percentiles(self, now):
+        while self.samples and self.samples[0][0] < now - self.window:
+            self.samples.popleft()
+        values = sorted(value for _, value in self.samples)
+        return {
+            name: round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1) if values else ""
+            for name, q in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)]
+        }
+
+class EventWatcher:
+    """Follows the event streams of every node, tracking each block from the first to
+    the last node that added it and until a quorum of finality signatures arrived.
+
+    Memory is bounded by the blocks in flight: blocks are dropped once complete or
+    after block_timeout, and percentiles cover the last window seconds."""
+
+    SERIES = [("spread", "block spread"), ("arrival", "block arrival"), ("finality", "finality")]
+    COLUMNS = ["time", "elapsed", "streams_up", "reconnects", "events", "blocks", "incomplete", "in_flight"] + [
+        "{}_{}_ms".format(series, name) for series, _ in SERIES for name in ["p50", "p90", "p99", "max"]]
+
+    def __init__(self, streams, quorum, window, block_timeout, report_interval):
+        self.streams = streams
+        self.nodes = sorted(set(node for node, url in streams))
+        self.quorum = quorum
+        self.block_timeout = block_timeout
+        self.report_interval = report_interval
+        self.samples = {series: RollingSamples(window) for series, _ in self.SERIES}
+        # block hash -> [first seen, last seen, nodes, signers, finalized at]
+        self.in_flight = collections.OrderedDict()
+        # recently finished blocks, so late events don't start them again
+        self.finished = collections.OrderedDict()
+        self.streams_up = 0
+        self.reconnects = 0
+        self.events = 0
+        self.blocks = 0
+        self.incomplete = 0
+
+    async def run(self, duration, series):
+        raise_open_file_limit(len(self.streams) + 64)
+        loop = asyncio.get_running_loop()
+        writer = csv.writer(series)
+        writer.writerow(self.COLUMNS)
+        tasks = [asyncio.ensure_future(self.follow(node, url)) for node, url in self.streams]
+        started = loop.time()
+        try:
+            while not duration or loop.time() - started < duration:
+                await asyncio.sleep(min(self.report_interval, duration - (loop.time() - started))
+                                    if duration else self.report_interval)
+                row = self.row(loop.time() - started)
+                writer.writerow([row[column] for column in self.COLUMNS])
+                series.flush()
+                self.report(row)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def follow(self, node, url):
+        """Consume one stream, reconnecting with backoff when it ends or fails."""
+        parts = urlsplit(url)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        delay = 1
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(
+                    parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                    ssl=parts.scheme == "https" or None, limit=16 * MiB)
+                writer.write("GET {} HTTP/1.1\r\nHost: {}\r\nAccept: text/event-stream\r\n\r\n".format(
+                    path, parts.hostname).encode())
+                await writer.drain()
+                status_line = await reader.readuntil(b"\r\n")
+                headers = {}
+                while True:
+                    line = await reader.readuntil(b"\r\n")
+                    if line == b"\r\n":
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if int(status_line.split()[1]) != 200:
+                    raise ValueError("http {}".format(status_line.split()[1].decode()))
+                self.streams_up += 1
+                try:
+                    async for name, value in read_event_stream(reader, headers):
+                        delay = 1
+                        self.on_event(node, name, value, time.monotonic())
+                finally:
+                    self.streams_up -= 1
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                pass
+            finally:
+                if writer:
+                    writer.close()
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def on_event(self, node, name, value, now):
+        self.events += 1
+        if name == "BlockAdded":
+            block_hash = value["block_hash"]
+            header = (value.get("block") or {}).get("header") or {}
+            block = self.block(block_hash, now)
+            if block is None:
+                return
+            block[1] = now
+            block[2].add(node)
+            if len(block[2]) == 1 and header.get("timestamp"):
+                proposed = datetime.strptime(header["timestamp"][:19], "%Y-%m-%dT%H:%M:%S").replace(
+                    tzinfo=timezone.utc).timestamp() + float("0" + header["timestamp"][19:].rstrip("Z"))
+                self.samples["arrival"].add(now, time.time() - proposed)
+        elif name == "FinalitySignature":
+            block = self.block(value["block_hash"], now)
+            if block is None:
+                return
+            block[3].add(value["public_key"])
+            if block[4] is None and len(block[3]) >= max(1, self.quorum):
+                block[4] = now
+        else:
+            return
+        if len(block[2]) == len(self.nodes) and block[4] is not None:
+            self.finish(value["block_hash"], now)
+        self.expire(now)
+
+    def block(self, block_hash, now):
+        if block_hash in self.finished:
+            return None
+        if block_hash not in self.in_flight:
+            self.in_flight[block_hash] = [now, now, set(), set(), None]
+        return self.in_flight[block_hash]
+
+    def finish(self, block_hash, now):
+        first_seen, last_seen, nodes, signers, finalized = self.in_flight.pop(block_hash)
+        self.blocks += 1
+        if len(nodes) == len(self.nodes):
+            self.samples["spread"].add(now, last_seen - first_seen)
+        else:
+            self.incomplete += 1
+        if finalized is not None:
+            self.samples["finality"].add(now, finalized - first_seen)
+        self.finished[block_hash] = True
+        while len(self.finished) > 10000:
+            self.finished.popitem(last=False)
+
+    def expire(self, now):
+        # blocks are in first seen order
+        while self.in_flight:
+            block_hash, block = next(iter(self.in_flight.items()))
+            if block[0] > now - self.block_timeout:
+                break
+            self.finish(block_hash, now)
+
+    def row(self, elapsed):
+        now = time.monotonic()
+        self.expire(now)
+        row = {
+            "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "elapsed": round(elapsed, 1),
+            "streams_up": self.streams_up,
+            "reconnects": self.reconnects,
+            "events": self.events,
+            "blocks": self.blocks,
+            "incomplete": self.incomplete,
+            "in_flight": len(self.in_flight),
+        }
+        for series, _ in self.SERIES:
+            for name, value in self.samples[series].percentiles(now).items():
+                row["{}_{}_ms".format(series, name)] = value
+        return row
+
+    def report(self, row):
+        show_val("{:.0f}s".format(row["elapsed"]), "{}/{} streams, {} events, {} blocks ({} incomplete)".format(
+            row["streams_up"], len(self.streams), row["events"], row["blocks"], row["incomplete"]))
+        for series, label in self.SERIES:
+            show_val(label.capitalize(), "p50 {} / p90 {} / p99 {} ms".format(
+                *[row["{}_{}_ms".format(series, name)] or "-" for name in ["p50", "p90", "p99"]]))
+
+def median(values):
+    """Middle value of sorted values, empty when there are none."""
+    return values[len(values) // 2] if values else ""
+
+# performance events of the node logs, matched ignoring case; the first matching
+# pattern names a line's event. A pattern is only tried on lines containing one of
+# its keywords, which keeps the pass over multi-GB logs cheap.
+LOG_EVENTS = {
+    "block_added": {"keywords": ["block"], "pattern": r"\b(added|stored) (a )?(finalized )?block\b|\bblock added\b"},
+    "block_executed": {"keywords": ["execut"], "pattern": r"\bexecut(ed|ing) (finalized )?block\b|\bexecution results\b"},
+    "era_transition": {"keywords": ["new era", "era end", "starting era", "switch block"], "pattern": r"\b(new era|era end(ed)?|starting era|switch block)\b"},
+    "gossip": {"keywords": ["gossip"], "pattern": r"\bgossip"},
+    "sync": {"keywords": ["sync", "joining", "catching up"], "pattern": r"\b(fast sync|sync(ed|ing)|joining|catching up)\b"},
+    "peer_connected": {
+        "keywords": ["connect", "peer"],
+        "pattern": r"\b(established (incoming |outgoing )?connection|connection established|new peer|peer connected)\b",
+    },
+    "peer_disconnected": {
+        "keywords": ["connect", "disconnect", "peer"],
+        "pattern": r"\b(connection (closed|lost|dropped)|dropped connection|peer disconnected|disconnected from)\b",
+    },
+}
+LOG_LEVEL = re.compile(rb"\b(ERROR|WARN|INFO|DEBUG|TRACE)\b")
+LOG_DURATION = re.compile(
+    rb"\b(took|elapsed|duration|time)(_(ns|us|ms|s))?[\"']?\s*[=:]?\s*[\"']?(\d+(?:\.\d+)?)\s*(ns|\xc2\xb5s|us|ms|s)?\b")
+LOG_HEIGHT = re.compile(rb"\bheight[\"']?\s*[=:]\s*(\d+)")
+LOG_ISO_TIMESTAMP = re.compile(rb"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d(?:\.\d+)?)")
+LOG_SHORT_TIMESTAMP = re.compile(rb"\b([A-Z][a-z]{2}) (\d\d) (\d\d):(\d\d):(\d\d(?:\.\d+)?)")
+DURATION_MS = {b"ns": 1e-6, b"\xc2\xb5s": 1e-3, b"us": 1e-3, b"ms": 1, b"s": 1000}
+MONTHS = {name.encode(): index for index, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1)}
+
+def analyze_log_file(path, events):
+    """Stats of one log file in a single streaming pass, in memory independent of its size."""
+    matchers = [
+        (name, [keyword.lower().encode() for keyword in event.get("keywords", [])],
+         re.compile(event["pattern"].encode(), re.IGNORECASE))
+        for name, event in events.items()
+    ]
+    # one search for any keyword rules out most lines, unless an event has no keywords
+    prefilter = None
+    if all(keywords for name, keywords, pattern in matchers):
+        prefilter = re.compile(b"|".join(re.escape(keyword) for name, keywords, pattern in matchers for keyword in keywords))
+    stats = {
+        "files": 1, "bytes": os.path.getsize(path), "lines": 0, "formats": {"text": 0, "json": 0},
+        "levels": {}, "events": {}, "first": None, "last": None, "height_max": None,
+        "eras": {"count": 0, "last": None, "seconds": 0.0},
+    }
+    levels = collections.Counter()
+    last_line = None
+    with open(path, "rb") as raw:
+        compressed = raw.read(2) == b"\x1f\x8b"
+    with (gzip.open(path, "rb") if compressed else open(path, "rb")) as f:
+        for line in f:
+            stats["lines"] += 1
+            stats["formats"]["json" if line.startswith(b"{") else "text"] += 1
+            level = LOG_LEVEL.search(line, 0, 160)
+            if level:
+                levels[level.group(1).decode()] += 1
+            if stats["first"] is None:
+                stats["first"] = log_timestamp(line)
+            last_line = line
+            name = log_event(line, matchers, prefilter)
+            if name is None:
+                continue
+            event = stats["events"].setdefault(name, {"count": 0, "durations": {}})
+            event["count"] += 1
+            duration = LOG_DURATION.search(line)
+            if duration:
+                unit = duration.group(5) or duration.group(3)
+                if unit:
+                    histogram_add(event["durations"], float(duration.group(4)) * DURATION_MS[unit])
+            height = LOG_HEIGHT.search(line)
+            if height and name.startswith("block"):
+                stats["height_max"] = max(stats["height_max"] or 0, int(height.group(1)))
+            if name == "era_transition":
+                at = log_timestamp(line)
+                if at is not None:
+                    if stats["eras"]["last"] is not None:
+                        stats["eras"]["count"] += 1
+                        stats["eras"]["seconds"] += at - stats["eras"]["last"]
+                    stats["eras"]["last"] = at
+    if last_line is not None:
+        stats["last"] = log_timestamp(last_line)
+    stats["levels"] = dict(levels)
+    return stats
+
+def log_event(line, matchers, prefilter):
+    lowered = line.lower()
+    if prefilter and not prefilter.search(lowered):
+        return None
+    for name, keywords, pattern in matchers:
+        if keywords:
+            for keyword in keywords:
+                if keyword in lowered:
+                    break
+            else:
+                continue
+        if pattern.search(line):
+            return name
+    return None
+
+def log_timestamp(line):
+    """Seconds of a log line's timestamp, ISO or the short `Apr 01 12:00:00.123` form
+    (which has no year, so only differences within a year are meaningful)."""
+    match = LOG_ISO_TIMESTAMP.search(line, 0, 200)
+    if match:
+        year, month, day, hour, minute, second = match.groups()
+        return datetime(int(year), int(month), int(day), int(hour), int(minute), tzinfo=timezone.utc).timestamp() + float(second)
+    match = LOG_SHORT_TIMESTAMP.search(line, 0, 200)
+    if match and match.group(1) in MONTHS:
+        month, day, hour, minute, second = match.groups()
+        return datetime(2000, MONTHS[month], int(day), int(hour), int(minute), tzinfo=timezone.utc).timestamp() + float(second)
+    return None
+
+# durations in log scale buckets, a quarter of a doubling wide, so percentiles
+# stay within ~19% whatever the number of samples and histograms can be merged
+def histogram_add(histogram, ms):
+    bucket = str(int(math.floor(math.log2(max(ms, 1e-6)) * 4)))
+    histogram[bucket] = histogram.get(bucket, 0) + 1
+    histogram["max"] = max(histogram.get("max", 0), ms)
+
+def histogram_percentiles(histogram):
+    buckets = sorted((int(bucket), count) for bucket, count in histogram.items() if bucket != "max")
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    percentiles = {}
+    for name, q in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99)]:
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= total * q:
+                # the bucket's upper bound
+                percentiles[name] = round(min(2 ** ((bucket + 1) / 4), histogram["max"]), 3)
+                break
+    percentiles["max"] = round(histogram["max"], 3)
+    return percentiles
+
+def merge_log_stats(stats, other):
+    """Stats of two logs, e.g. rotated files of a node or the nodes of a network."""
+    merged = copy.deepcopy(stats)
+    for key in ["files", "bytes", "lines"]:
+        merged[key] += other[key]
+    for key in ["formats", "levels"]:
+        for name, count in other[key].items():
+            merged[key][name] = merged[key].get(name, 0) + count
+    for name, event in other["events"].items():
+        target = merged["events"].setdefault(name, {"count": 0, "durations": {}})
+        target["count"] += event["count"]
+        for bucket, count in event["durations"].items():
+            target["durations"][bucket] = max(target["durations"].get(bucket, 0), count) if bucket == "max" else \
+                target["durations"].get(bucket, 0) + count
+    merged["first"] = min([t for t in [stats["first"], other["first"]] if t is not None], default=None)
+    merged["last"] = max([t for t in [stats["last"], other["last"]] if t is not None], default=None)
+    merged["height_max"] = max([h for h in [stats["height_max"], other["height_max"]] if h is not None], default=None)
+    merged["eras"]["count"] += other["eras"]["count"]
+    merged["eras"]["seconds"] += other["eras"]["seconds"]
+    return merged
+
+def summarize_log_stats(stats, node_count=1):
+    span = stats["last"] - stats["first"] if stats["first"] is not None and stats["last"] is not None else None
+    events = {}
+    for name, event in sorted(stats["events"].items()):
+        events[name] = {"count": event["count"]}
+        if span:
+            events[name]["per_minute"] = round(event["count"] * 60 / span / node_count, 2)
+        durations = histogram_percentiles(event["durations"])
+        if durations:
+            events[name]["duration_ms"] = durations
+    churn = sum(stats["events"].get(name, {"count": 0})["count"] for name in ["peer_connected", "peer_disconnected"])
+    return {
+        "files": stats["files"],
+        "bytes": stats["bytes"],
+        "lines": stats["lines"],
+        "formats": stats["formats"],
+        "levels": dict(sorted(stats["levels"].items())),
+        "span_seconds": round(span, 3) if span is not None else None,
+        "height_max": stats["height_max"],
+        "era_seconds_mean": round(stats["eras"]["seconds"] / stats["eras"]["count"], 1) if stats["eras"]["count"] else None,
+        "peer_churn_per_hour": round(churn * 3600 / span / node_count, 1) if span else None,
+        "events": events,
+    }
+
+def log_node_name(path, node_from):
+    if node_from == "dir":
+        return os.path.basename(os.path.dirname(os.path.abspath(path)))
+    # casper-node-x-001.log.2.gz -> casper-node-x-001
+    name = os.path.basename(path)
+    name = re.sub(r"\.gz$", "", name)
+    name = re.sub(r"\.\d+$", "", name)
+    return re.sub(r"\.(log|json|txt)$", "", name)
+
+def raise_open_file_limit(needed):
+    """Raise the soft limit on open files towards needed, one socket per node."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
 
 def run_client(argv0, *args):
     """Run the casper client, compiling it if necessary, with the given command-line args"""
+    Timings.count_subprocess()
     return subprocess.check_output(argv0 + list(args))
 
 
+class Timings:
+    """Phase and per-node durations, bytes written and subprocess counts of one run.
+
+    Phases are sequential: starting a phase ends the previous one. Counters
+    are kept for the run, and each phase records how much they grew during it.
+    """
+
+    subprocesses = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def count_subprocess(cls):
+        with cls.lock:
+            cls.subprocesses += 1
+
+    def __init__(self, command):
+        self.command = command
+        self.started = time.time()
+        self.started_monotonic = time.monotonic()
+        self.phases = []
+        self.current = None
+        self.nodes = {}
+        self.counters = {"bytes_written": 0}
+        self.node_count = None
+
+    def snapshot(self):
+        counters = dict(self.counters)
+        counters["subprocesses"] = Timings.subprocesses
+        return counters
+
+    def phase(self, name):
+        self.end_phase()
+        self.current = (name, time.monotonic(), self.snapshot())
+
+    def end_phase(self):
+        if not self.current:
+            return
+        name, started, before = self.current
+        after = self.snapshot()
+        phase = {"name": name, "seconds": time.monotonic() - started}
+        phase.update({key: after[key] - before.get(key, 0) for key in after})
+        self.phases.append(phase)
+        self.current = None
+
+    def add_bytes(self, size, counter="bytes_written"):
+        self.add_count(counter, size)
+
+    def add_count(self, counter, count):
+        with Timings.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def node(self, node, name, seconds):
+        with Timings.lock:
+            durations = self.nodes.setdefault(node, {})
+            durations[name] = durations.get(name, 0) + seconds
+
+    def set_node_count(self, node_count):
+        self.node_count = node_count
+
+    def finish(self):
+        self.end_phase()
+
+    def report(self):
+        return {
+            "command": self.command,
+            "argv": sys.argv[1:],
+            "started": datetime.utcfromtimestamp(self.started).isoformat("T") + "Z",
+            "seconds": time.monotonic() - self.started_monotonic,
+            "node_count": self.node_count,
+            "counters": self.snapshot(),
+            "phases": self.phases,
+            "nodes": self.nodes,
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        show_val("Timings", path)
+
+
 def show_val(key, value):
     """Auxiliary function to display a value on the terminal."""
 
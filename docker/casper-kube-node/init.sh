@@ -10,6 +10,12 @@ then
 fi
 
 
+#statefulset pods derive their index from the pod ordinal
+if [ -z "$CASPER_NODE_INDEX" ] && [ -n "$CASPER_NODE_INDEX_OFFSET" ]
+then
+    CASPER_NODE_INDEX=$(printf %03d $(( ${HOSTNAME##*-} + CASPER_NODE_INDEX_OFFSET )))
+fi
+
 if [ -z "$CASPER_NODE_INDEX" ]
 then
     echo "CASPER_NODE_INDEX not set, exiting"
@@ -29,11 +35,229 @@ fi
 #    sleep 30
 #fi
 
+network_prefix=networks/$NETWORK_NAME
+node_name=casper-node-$NETWORK_NAME-$CASPER_NODE_INDEX
+
+#download a bundle to $2 and print its expected sha256: from the in-cluster
+#artifact cache when there is one, falling back to a single S3 GET
+download_bundle() {
+    local key=$1 bundle=$2
+    if [ -n "$ARTIFACT_CACHE_URL" ]
+    then
+        local headers=$(mktemp)
+        if curl -sf --connect-timeout 5 --retry 3 -D $headers -o $bundle $ARTIFACT_CACHE_URL/$key
+        then
+            grep -i '^x-amz-meta-sha256:' $headers | cut -d' ' -f2 | tr -d '\r'
+            rm -f $headers
+            return 0
+        fi
+        rm -f $headers
+        echo "artifact cache unavailable for $key, using S3" >&2
+    fi
+    local response
+    response=$(aws s3api get-object --bucket $bucket_name --key $key $bundle) || return 1
+    echo "$response" | jq -r '.Metadata.sha256 // empty'
+}
+
+#fetch a bundle, verify its sha256 and extract it
+fetch_bundle() {
+    local key=$1 target=$2
+    local bundle=$(mktemp)
+    local expected actual
+    if expected=$(download_bundle $key $bundle)
+    then
+        actual=$(sha256sum $bundle | cut -d' ' -f1)
+        if [ -n "$expected" ] && [ "$expected" == "$actual" ]
+        then
+            mkdir -p $target
+            tar -xzf $bundle -C $target
+            local status=$?
+            rm -f $bundle
+            return $status
+        fi
+        echo "checksum mismatch for $key (expected $expected, got $actual)"
+    fi
+    rm -f $bundle
+    return 1
+}
+
+#binaries are published as content defined chunks, shared by every network of
+#the bucket. Chunks are kept on the node's volume, so after a rebuild only the
+#chunks that changed are downloaded.
+export bucket_name ARTIFACT_CACHE_URL
+export chunk_cache=/storage/.binary-chunks
+
+#fetch a chunk into the chunk cache, unless it's there already
+fetch_chunk() {
+    local store=$1 digest=$2
+    [ -f $chunk_cache/$digest ] && return 0
+    local chunk=$chunk_cache/$digest.gz
+    if ! { [ -n "$ARTIFACT_CACHE_URL" ] && curl -sf --connect-timeout 5 --retry 3 -o $chunk $ARTIFACT_CACHE_URL/$store/$digest; }
+    then
+        if ! aws s3api get-object --bucket $bucket_name --key $store/$digest $chunk > /dev/null
+        then
+            rm -f $chunk
+            return 1
+        fi
+    fi
+    if [ "$(gunzip -c $chunk | tee $chunk_cache/$digest.part | sha256sum | cut -d' ' -f1)" != "$digest" ]
+    then
+        echo "checksum mismatch for chunk $digest"
+        rm -f $chunk $chunk_cache/$digest.part
+        return 1
+    fi
+    mv $chunk_cache/$digest.part $chunk_cache/$digest
+    rm -f $chunk
+}
+export -f fetch_chunk
+
+#fetch the missing chunks of the network's binaries and reassemble them below $1
+#returns 2 when the network has no chunk list, 1 when its binaries can't be fetched
+fetch_binary_chunks() {
+    local target=$1
+    local chunk_list=$(mktemp)
+    local expected
+    #chunks never change, but the chunk list does with every build: skip the cache
+    if ! expected=$(ARTIFACT_CACHE_URL= download_bundle $network_prefix/bundles/bin-chunks.json $chunk_list)
+    then
+        rm -f $chunk_list
+        return 2
+    fi
+    if [ "$expected" != "$(sha256sum $chunk_list | cut -d' ' -f1)" ]
+    then
+        echo "checksum mismatch for the chunk list"
+        rm -f $chunk_list
+        return 1
+    fi
+    mkdir -p $chunk_cache
+    local store=$(jq -r .chunk_store $chunk_list)
+    if ! jq -r '.files[].chunks[][0]' $chunk_list | sort -u | xargs -P 16 -n 1 bash -c 'fetch_chunk $0 $1' $store
+    then
+        rm -f $chunk_list
+        return 1
+    fi
+
+    local path digest mode
+    while read path digest mode
+    do
+        mkdir -p $(dirname $target/$path)
+        jq -r --arg path $path '.files[$path].chunks[][0]' $chunk_list | sed "s|^|$chunk_cache/|" | xargs cat > $target/$path.part
+        if [ "$(sha256sum $target/$path.part | cut -d' ' -f1)" != "$digest" ]
+        then
+            #a damaged cached chunk, start over on the next attempt
+            echo "checksum mismatch for $path, clearing the chunk cache"
+            rm -rf $target/$path.part $chunk_list $chunk_cache
+            return 1
+        fi
+        chmod $(printf %o $mode) $target/$path.part
+        mv $target/$path.part $target/$path
+    done < <(jq -r '.files | to_entries[] | "\(.key) \(.value.sha256) \(.value.mode)"' $chunk_list)
+
+    #keep only the chunks of the current binaries
+    jq -r '.files[].chunks[][0]' $chunk_list | sort -u > $chunk_list.keep
+    ls $chunk_cache | sort | comm -23 - $chunk_list.keep | sed "s|^|$chunk_cache/|" | xargs -r rm -f
+    rm -f $chunk_list $chunk_list.keep
+}
+
+#fetch a shared file by its sha256 to $2, from the artifact cache when there
+#is one: shared files never change, so cached copies are never stale. Only for
+#the files the network's shared bundle lacks, e.g. when published without bundles
+fetch_shared() {
+    local digest=$1 target=$2 key=$network_prefix/shared/$1
+    mkdir -p $(dirname $target)
+    if ! { [ -n "$ARTIFACT_CACHE_URL" ] && curl -sf --connect-timeout 5 --retry 3 -o $target.part $ARTIFACT_CACHE_URL/$key; }
+    then
+        aws s3 cp --quiet s3://$bucket_name/$key $target.part || return 1
+    fi
+    if [ "$(sha256sum $target.part | cut -d' ' -f1)" != "$digest" ]
+    then
+        echo "checksum mismatch for $key"
+        rm -f $target.part
+        return 1
+    fi
+    mv $target.part $target
+}
+
 #config
-aws s3 sync s3://$bucket_name/networks/$NETWORK_NAME/nodes/casper-node-$NETWORK_NAME-$CASPER_NODE_INDEX/etc/ /etc/
+if ! fetch_bundle $network_prefix/bundles/nodes/$node_name.tar.gz /etc
+then
+    echo "no node bundle, syncing config"
+    aws s3 sync s3://$bucket_name/$network_prefix/nodes/$node_name/etc/ /etc/
+fi
 
-#binary
-aws s3 sync s3://$bucket_name/networks/$NETWORK_NAME/staging/bin /var/lib/casper/bin
+#shared config (chainspec, accounts, faucet key), stored once per network by digest
+#and fetched with the single GET of the network's shared bundle
+shared_manifest=/etc/casper/shared-files.json
+if [ -f "$shared_manifest" ]
+then
+    shared_bundle=$(mktemp -d)
+    if ! fetch_bundle $network_prefix/bundles/shared.tar.gz $shared_bundle
+    then
+        echo "no shared bundle, fetching the shared files one by one"
+    fi
+    while read digest path
+    do
+        #a digest may be installed at several paths, e.g. the chainspec of two versions
+        if [ -f $shared_bundle/$digest ] && [ "$(sha256sum $shared_bundle/$digest | cut -d' ' -f1)" == "$digest" ]
+        then
+            mkdir -p $(dirname /etc/$path)
+            cp $shared_bundle/$digest /etc/$path
+        elif ! fetch_shared $digest /etc/$path
+        then
+            echo "could not fetch shared file $path, exiting"
+            exit 1
+        fi
+    done < <(jq -r 'to_entries[] | "\(.value) \(.key)"' $shared_manifest)
+    rm -rf $shared_bundle
+fi
+
+#binary: with a chunk list, the whole binaries left from an earlier publish may be stale
+fetch_binary_chunks /var/lib/casper/bin
+chunks_status=$?
+if [ $chunks_status -eq 1 ]
+then
+    echo "binary chunks failed, exiting"
+    exit 1
+elif [ $chunks_status -ne 0 ] && ! fetch_bundle $network_prefix/bundles/bin.tar.gz /var/lib/casper/bin
+then
+    echo "no binary bundle, syncing binaries"
+    aws s3 sync s3://$bucket_name/$network_prefix/staging/bin /var/lib/casper/bin
+fi
 chmod +x /var/lib/casper/bin/$CASPER_NODE_VERSION/casper-node
 
+#restore the node's storage from the network's snapshot, once per snapshot: the marker names
+#the snapshot the storage came from. Without a snapshot, storage restored earlier is wiped
+#so the node starts from genesis again
+storage_path=/storage/$node_name
+snapshot_marker=$storage_path/.snapshot-restored
+restored_snapshot=$(cat $snapshot_marker 2>/dev/null)
+if [ -f /etc/casper/snapshot.json ]
+then
+    snapshot=$(jq -r .snapshot /etc/casper/snapshot.json)
+    if [ "$restored_snapshot" != "$snapshot" ]
+    then
+        echo "restoring snapshot $snapshot"
+        mkdir -p $storage_path
+        find $storage_path -mindepth 1 -delete
+        #a partial restore never matches, and is wiped if the snapshot is cleared
+        echo "$snapshot (incomplete)" > $snapshot_marker
+        if ! python3 /restore-snapshot.py --storage-path $storage_path --bucket $bucket_name --prefix $network_prefix
+        then
+            echo "snapshot restore failed, exiting"
+            exit 1
+        fi
+        echo "$snapshot" > $snapshot_marker
+    fi
+elif [ -f $snapshot_marker ]
+then
+    echo "snapshot cleared, wiping the storage restored from ${restored_snapshot:-a snapshot}"
+    find $storage_path -mindepth 1 -delete
+fi
+
+#emulate the network conditions of the node's region, when the network has a profile
+if [ -f /etc/casper/netem.sh ]
+then
+    bash /etc/casper/netem.sh || echo "network profile not applied"
+fi
+
 bash -c "exec /usr/bin/casper-node-launcher"
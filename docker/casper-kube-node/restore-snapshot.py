@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Restore a node's storage from a casper-tool.py snapshot before the node starts.
+
+Reads the node's snapshot manifest and writes every file of it, fetching its
+chunks in parallel from the in-cluster artifact cache when there is one, else
+from S3, or from a local snapshots directory. Each chunk is checked against its
+sha256 before it is written; chunks of zeros stay holes.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+MiB = 1024 * 1024
+
+
+class ChunkSource:
+    """Objects of the network's prefix: from the artifact cache, S3 or a directory."""
+
+    def __init__(self, bucket, prefix, cache_url, local_dir, workers):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_url = cache_url
+        self.local_dir = local_dir
+        self.s3 = None
+        if not local_dir:
+            # botocore ships with the awscli package of the node image
+            import botocore.config
+            import botocore.session
+
+            self.s3 = botocore.session.get_session().create_client(
+                "s3", config=botocore.config.Config(max_pool_connections=workers))
+
+    def get(self, key):
+        if self.local_dir:
+            with open(os.path.join(self.local_dir, *key.split("/")), "rb") as f:
+                return f.read()
+        if self.cache_url:
+            try:
+                url = "{}/{}/{}".format(self.cache_url.rstrip("/"), self.prefix, key)
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    return response.read()
+            except OSError as e:
+                logging.warning("artifact cache unavailable for %s: %s", key, e)
+        response = self.s3.get_object(Bucket=self.bucket, Key="{}/{}".format(self.prefix, key))
+        return response["Body"].read()
+
+
+def restore(source, manifest, chunks_prefix, storage_path, workers):
+    """Write the files of a snapshot manifest below storage_path, returning the bytes restored."""
+    for directory in manifest["dirs"]:
+        Path(storage_path, directory).mkdir(parents=True, exist_ok=True)
+    chunk_size = manifest["chunk_size"]
+    restored = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entry in manifest["files"]:
+            path = os.path.join(storage_path, *entry["path"].split("/"))
+            Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                f.truncate(entry["size"])
+                fd = f.fileno()
+
+                def restore_chunk(chunk):
+                    offset, digest = chunk
+                    for attempt in range(3):
+                        data = gzip.decompress(source.get("{}/{}".format(chunks_prefix, digest)))
+                        if hashlib.sha256(data).hexdigest() == digest:
+                            os.pwrite(fd, data, offset)
+                            return len(data)
+                        logging.warning("chunk %s failed its checksum, attempt %d", digest, attempt + 1)
+                    raise Exception("chunk {} is corrupt".format(digest))
+
+                chunks = [(index * chunk_size, digest) for index, digest in enumerate(entry["chunks"]) if digest]
+                restored += sum(pool.map(restore_chunk, chunks))
+            os.chmod(path, entry["mode"])
+    return restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--restore-file", default="/etc/casper/snapshot.json", help="The node's snapshot.json")
+    parser.add_argument("--storage-path", required=True, help="The node's storage directory")
+    parser.add_argument("--bucket", default="builds.casperlabs.io")
+    parser.add_argument("--prefix", required=True, help="The network's prefix, e.g. networks/<network>")
+    parser.add_argument("--artifact-cache-url", default=os.environ.get("ARTIFACT_CACHE_URL"))
+    parser.add_argument("--local-dir", help="Read the network's objects from this directory instead of S3")
+    parser.add_argument("--workers", type=int, default=16, help="Chunks fetched in parallel")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    restore_file = json.load(open(args.restore_file))
+    source = ChunkSource(args.bucket, args.prefix, args.artifact_cache_url, args.local_dir, args.workers)
+    manifest = json.loads(source.get(restore_file["manifest"]))
+
+    started = time.monotonic()
+    restored = restore(source, manifest, restore_file["chunks"], args.storage_path, args.workers)
+    logging.info("restored snapshot %s: %.1f MiB in %.1fs", restore_file["snapshot"],
+                 restored / MiB, time.monotonic() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""In-cluster cache of a network's S3 artifacts.
+
+Serves GET and HEAD /<key> for the objects of one bucket out of a local cache
+directory, including single range requests. An object missing from the cache
+is fetched from the origin once, however many pods ask for it at the same
+time. On start the cache fills itself from the --prefill prefixes in the
+background, so node pods starting together hit the cache instead of S3. The
+chunks listed by a prefilled binary chunk list are prefilled along with it, as
+they are kept in the bucket's chunk store, outside the network's prefix.
+
+Objects named by their sha256 (shared files, binary and snapshot chunks) never
+change and are served from the cache as is. Every other key, e.g. a node bundle
+that add-joiners or a republish rewrites, is revalidated against the origin's
+ETag once it was last checked more than --revalidate-seconds ago.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+MiB = 1024 * 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+# what publish-network names the chunk list of a network's binaries
+BINARY_CHUNK_LIST = "bin-chunks.json"
+# the last path segment of content addressed keys, which are never revalidated
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactCache:
+    """Objects of a bucket cached below cache_dir, fetched from the origin on first use."""
+
+    def __init__(self, s3, bucket, cache_dir, revalidate_seconds=5):
+        self.s3 = s3
+        self.bucket = bucket
+        self.objects_path = os.path.join(cache_dir, "objects")
+        self.metadata_path = os.path.join(cache_dir, "metadata")
+        self.revalidate_seconds = revalidate_seconds
+        # key -> time.monotonic() of the last fetch or revalidation of a mutable key
+        self.validated = {}
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "refreshed": 0,
+                      "origin_bytes": 0, "served_bytes": 0, "prefilled": 0}
+
+    def count(self, name, value=1):
+        with self.stats_lock:
+            self.stats[name] += value
+
+    def key_lock(self, key):
+        with self.locks_lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def fresh(self, key, metadata_path):
+        """Whether the cached copy of key can be served without asking the origin."""
+        if not os.path.isfile(metadata_path):
+            return False
+        if DIGEST_PATTERN.match(key.rsplit("/", 1)[-1]):
+            return True
+        validated = self.validated.get(key)
+        return validated is not None and time.monotonic() - validated < self.revalidate_seconds
+
+    def get(self, key):
+        """(path, metadata) of a cached object, None when the origin doesn't have it."""
+        object_path = os.path.join(self.objects_path, key)
+        metadata_path = os.path.join(self.metadata_path, key + ".json")
+        if self.fresh(key, metadata_path):
+            self.count("hits")
+            return object_path, json.load(open(metadata_path))
+
+        # concurrent requests for the same key wait for a single origin request
+        with self.key_lock(key):
+            if self.fresh(key, metadata_path):
+                self.count("hits")
+                return object_path, json.load(open(metadata_path))
+            cached = json.load(open(metadata_path)) if os.path.isfile(metadata_path) else None
+            extra = {"IfNoneMatch": cached["etag"]} if cached and cached["etag"] else {}
+            try:
+                response = self.s3.get_object(Bucket=self.bucket, Key=key, **extra)
+            except ClientError as e:
+                code = e.response["Error"]["Code"]
+                if cached and code in ["304", "NotModified"]:
+                    self.validated[key] = time.monotonic()
+                    self.count("revalidated")
+                    return object_path, cached
+                if code in ["NoSuchKey", "404"]:
+                    # deleted at the origin since it was cached
+                    if cached:
+                        os.remove(metadata_path)
+                    return None
+                raise
+            self.count("refreshed" if cached else "misses")
+
+            Path(os.path.dirname(object_path)).mkdir(parents=True, exist_ok=True)
+            Path(os.path.dirname(metadata_path)).mkdir(parents=True, exist_ok=True)
+            with open(object_path + ".part", "wb") as f:
+                for chunk in response["Body"].iter_chunks(MiB):
+                    f.write(chunk)
+                    self.count("origin_bytes", len(chunk))
+            os.replace(object_path + ".part", object_path)
+            metadata = {
+                "etag": response.get("ETag"),
+                "content_type": response.get("ContentType", "application/octet-stream"),
+                "metadata": response.get("Metadata", {}),
+            }
+            # the metadata file marks the object complete
+            with open(metadata_path + ".part", "w") as f:
+                json.dump(metadata, f)
+            os.replace(metadata_path + ".part", metadata_path)
+            self.validated[key] = time.monotonic()
+            return object_path, metadata
+
+    def prefill(self, prefixes, workers):
+        """Fetch every object below prefixes, and the chunks their chunk lists name, workers at a time."""
+        keys = []
+        for prefix in prefixes:
+            for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+                keys += [item["Key"] for item in page.get("Contents", [])]
+
+        def fetch(key):
+            try:
+                cached = self.get(key)
+                self.count("prefilled")
+                return cached
+            except Exception as e:
+                logging.warning("prefill of %s failed: %s", key, e)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            chunk_lists = [cached for key, cached in zip(keys, pool.map(fetch, keys))
+                           if cached and key.rsplit("/", 1)[-1] == BINARY_CHUNK_LIST]
+            chunks = set()
+            for object_path, _ in chunk_lists:
+                chunk_list = json.load(open(object_path))
+                chunks.update("/".join([chunk_list["chunk_store"], digest])
+                              for entry in chunk_list["files"].values() for digest, _ in entry["chunks"])
+            list(pool.map(fetch, sorted(chunks)))
+        logging.info("prefilled %d objects", self.stats["prefilled"])
+
+
+class ArtifactHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cache = None
+
+    def do_HEAD(self):
+        self.serve(body=False)
+
+    def do_GET(self):
+        self.serve(body=True)
+
+    def serve(self, body):
+        key = unquote(urlsplit(self.path).path).lstrip("/")
+        if key == "healthz":
+            return self.send_json(200, self.cache.stats, body)
+        if not key or ".." in key.split("/") or key.endswith("/"):
+            return self.send_json(400, {"error": "invalid key"}, body)
+
+        try:
+            cached = self.cache.get(key)
+        except Exception as e:
+            logging.warning("origin fetch of %s failed: %s", key, e)
+            return self.send_json(502, {"error": str(e)}, body)
+        if cached is None:
+            return self.send_json(404, {"error": "not found"}, body)
+        object_path, metadata = cached
+
+        size = os.path.getsize(object_path)
+        start, end = 0, size - 1
+        status = 200
+        if self.headers.get("Range"):
+            byte_range = self.parse_range(self.headers["Range"], size)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = byte_range
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", metadata["content_type"])
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if metadata["etag"]:
+            self.send_header("ETag", metadata["etag"])
+        for name, value in metadata["metadata"].items():
+            self.send_header("x-amz-meta-{}".format(name), value)
+        if status == 206:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, size))
+        self.end_headers()
+
+        if body and end >= start:
+            with open(object_path, "rb") as f:
+                self.wfile.flush()
+                self.connection.sendfile(f, start, end - start + 1)
+            self.cache.count("served_bytes", end - start + 1)
+
+    @staticmethod
+    def parse_range(header, size):
+        """(start, end) of a single `bytes=` range, None when it can't be satisfied."""
+        match = RANGE_PATTERN.match(header.strip())
+        if not match or match.group(1) == match.group(2) == "":
+            return None
+        if match.group(1) == "":
+            # suffix range: the last n bytes
+            start, end = max(0, size - int(match.group(2))), size - 1
+        else:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        if start >= size or start > end:
+            return None
+        return start, end
+
+    def send_json(self, status, value, body):
+        data = json.dumps(value).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug("%s " + format, self.address_string(), *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", default="builds.casperlabs.io", help="S3 bucket of the artifacts")
+    parser.add_argument("--endpoint-url", help="S3 compatible origin, e.g. a local stand-in")
+    parser.add_argument("--cache-dir", default="/var/cache/artifact-cache", help="Where cached objects are kept")
+    parser.add_argument("--prefill", action="append", default=[], help="Key prefix to fetch on start, repeatable")
+    parser.add_argument("--prefill-workers", type=int, default=16, help="Concurrent origin fetches while prefilling")
+    parser.add_argument("--revalidate-seconds", type=float, default=5,
+                        help="Serve a key that isn't content addressed this long before checking its ETag again")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    s3 = boto3.client("s3", endpoint_url=args.endpoint_url,
+                      config=Config(max_pool_connections=max(10, args.prefill_workers)))
+    ArtifactHandler.cache = ArtifactCache(s3, args.bucket, args.cache_dir, args.revalidate_seconds)
+
+    server = ThreadingHTTPServer((args.host, args.port), ArtifactHandler)
+    server.daemon_threads = True
+    if args.prefill:
+        threading.Thread(
+            target=ArtifactHandler.cache.prefill, args=(args.prefill, args.prefill_workers), daemon=True
+        ).start()
+    logging.info("serving s3://%s on %s:%d", args.bucket, args.host, server.server_address[1])
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,18 @@
 #!/bin/bash
 
+#artifact-cache mode: serve the network's S3 artifacts to the node pods
+#the prefix is what publish-network writes for the pods: the node bundles, the
+#shared bundle and the binaries (bundles/bin.tar.gz, or bundles/bin-chunks.json
+#whose chunks the cache follows into the chunk store)
+if [ "$CASPER_KUBE_UTIL_MODE" == "artifact-cache" ]
+then
+    bucket_name=${ARTIFACT_CACHE_BUCKET:-builds.casperlabs.io}
+    exec python3 /artifact-cache.py \
+        --bucket $bucket_name \
+        --port ${ARTIFACT_CACHE_PORT:-8080} \
+        --prefill networks/$NETWORK_NAME/bundles/
+fi
+
 git clone https://github.com/CasperLabs/casper-node /casper-node
 cd /casper-node
 git checkout $CASPER_NODE_GIT_HASH
@@ -0,0 +1,108 @@
+import importlib.util
+import os
+import sys
+import urllib.request
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(name, path):
+    """Import a script whose file name isn't a module name, e.g. casper-tool.py."""
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+@pytest.fixture(scope="session")
+def tool():
+    return load_script("casper_tool", "casper-tool.py")
+
+
+@pytest.fixture
+def s3_server(monkeypatch):
+    """A local moto S3 server with an empty `bucket`, as (endpoint url, client)."""
+    moto_server = pytest.importorskip("moto.server")
+    boto3 = pytest.importorskip("boto3")
+    # moto accepts any credentials, make sure boto3 finds some
+    for name, value in [("AWS_ACCESS_KEY_ID", "test"), ("AWS_SECRET_ACCESS_KEY", "test"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")]:
+        monkeypatch.setenv(name, value)
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = "http://{}:{}".format(host, port)
+    # moto keeps its buckets per process, not per server: start from an empty store
+    urllib.request.urlopen(urllib.request.Request(endpoint_url + "/moto-api/reset", method="POST"))
+    s3 = boto3.client("s3", endpoint_url=endpoint_url)
+    s3.create_bucket(Bucket="bucket")
+    yield endpoint_url, s3
+    server.stop()
+
+
+# a release's chainspec.toml and config-example.toml, trimmed to what create-network sets
+CHAINSPEC_TEMPLATE = """
+[protocol]
+version = '1.0.0'
+activation_point = '2021-01-01T00:00:00Z'
+
+[network]
+name = 'casper-example'
+
+[core]
+era_duration = '30min'
+unbonding_delay = 14
+auction_delay = 3
+
+[deploys]
+block_max_transfer_count = 1000
+"""
+
+CONFIG_TEMPLATE = """
+[node]
+trusted_hash = 'HEX-FORMATTED BLOCK HASH'
+
+[logging]
+format = 'json'
+
+[consensus]
+secret_key_path = 'secret_key.pem'
+
+[consensus.highway]
+unit_hashes_folder = '/var/lib/casper-node'
+
+[network]
+public_address = '<IP ADDRESS>:0'
+bind_address = '0.0.0.0:34553'
+known_addresses = []
+
+[storage]
+path = '/var/lib/casper-node'
+"""
+
+
+@pytest.fixture
+def create_network(tool, tmp_path, monkeypatch):
+    """Runs create-network from the templates above, keeping its genesis history in tmp_path.
+    Called with the network path, the command's options and the tool's options."""
+    from click.testing import CliRunner
+
+    monkeypatch.setattr(tool, "GENESIS_HISTORY", str(tmp_path / "genesis-history.jsonl"))
+    sources_path = tmp_path / "sources"
+    sources_path.mkdir()
+    (sources_path / "chainspec.toml").write_text(CHAINSPEC_TEMPLATE)
+    (sources_path / "config-example.toml").write_text(CONFIG_TEMPLATE)
+    (sources_path / "casper-node").write_bytes(b"#!/bin/sh\n")
+
+    def run(network_path, args=(), tool_args=("--no-keypool",)):
+        result = CliRunner().invoke(tool.cli, [
+            *tool_args, "create-network", "--source-chainspec", str(sources_path / "chainspec.toml"),
+            "--source-config", str(sources_path / "config-example.toml"),
+            "--source-casper-node", str(sources_path / "casper-node"), *args, str(network_path)])
+        assert result.exit_code == 0, result.output
+        return result.output
+    return run
@@ -0,0 +1,186 @@
+"""An in-process stand-in for the parts of the Kubernetes API that deploy-network uses.
+
+Objects are created with POST (409 when they exist) and merge patched with PATCH.
+Collections are listed with GET and watched with `?watch=1` as chunked JSON lines.
+Watches end after `watch_seconds`; setting `expire_watches` ends the next one with a
+410 ERROR event instead, which makes the client relist. Workloads get pods that become scheduled
+and then ready. The first `fail_requests` requests of a method are answered with
+429 or 503.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def merge_patch(target, patch):
+    """RFC 7386 JSON merge patch."""
+    if not isinstance(patch, dict):
+        return patch
+    target = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+    return target
+
+
+class FakeKube:
+    def __init__(self, token="token", pod_delay=0.05, watch_seconds=2):
+        self.token = token
+        self.pod_delay = pod_delay
+        self.watch_seconds = watch_seconds
+        self.lock = threading.Condition()
+        self.objects = {}          # collection path -> {name: object}
+        self.events = []           # (resource version, collection path, type, object)
+        self.resource_version = 0
+        self.requests = []         # (method, path, status)
+        self.created = []          # (collection path, kind, name) in creation order
+        self.fail_requests = {}    # method -> [status, ...] answered before handling
+        self.expire_watches = False
+        self.lists = 0
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                fake.handle(self, "POST")
+
+            def do_PATCH(self):
+                fake.handle(self, "PATCH")
+
+            def do_GET(self):
+                fake.handle(self, "GET")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+
+    def emit(self, collection, event_type, obj):
+        with self.lock:
+            self.resource_version += 1
+            obj["metadata"]["resourceVersion"] = str(self.resource_version)
+            self.objects.setdefault(collection, {})[obj["metadata"]["name"]] = obj
+            self.events.append((self.resource_version, collection, event_type, obj))
+            self.lock.notify_all()
+
+    def run_pod(self, namespace, name):
+        pods = "/api/v1/namespaces/{}/pods".format(namespace)
+        events = "/api/v1/namespaces/{}/events".format(namespace)
+        pod = {"metadata": {"name": name}, "status": {"conditions": []}}
+        self.emit(pods, "ADDED", json.loads(json.dumps(pod)))
+        for reason in ["Scheduled", "Pulled", "Started"]:
+            time.sleep(self.pod_delay)
+            if reason == "Scheduled":
+                pod["status"]["conditions"].append({"type": "PodScheduled", "status": "True"})
+                self.emit(pods, "MODIFIED", json.loads(json.dumps(pod)))
+            self.emit(events, "ADDED", {"metadata": {"name": "{}.{}".format(name, reason)}, "reason": reason,
+                                        "involvedObject": {"kind": "Pod", "name": name}})
+        time.sleep(self.pod_delay)
+        pod["status"]["conditions"].append({"type": "Ready", "status": "True"})
+        self.emit(pods, "MODIFIED", json.loads(json.dumps(pod)))
+
+    def send(self, handler, method, status, body, headers=()):
+        self.requests.append((method, urlsplit(handler.path).path, status))
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def handle(self, handler, method):
+        body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0))
+        if handler.headers.get("Authorization") != "Bearer {}".format(self.token):
+            return self.send(handler, method, 401, {"code": 401})
+        with self.lock:
+            failures = self.fail_requests.get(method)
+            status = failures.pop(0) if failures else None
+        if status:
+            return self.send(handler, method, status, {"code": status},
+                             [("Retry-After", "0")] if status == 429 else [])
+
+        url = urlsplit(handler.path)
+        query = parse_qs(url.query)
+        if method == "POST":
+            resource = json.loads(body)
+            name = resource["metadata"]["name"]
+            with self.lock:
+                if name in self.objects.get(url.path, {}):
+                    return self.send(handler, method, 409, {"code": 409, "reason": "AlreadyExists"})
+                self.created.append((url.path, resource["kind"], name))
+            self.emit(url.path, "ADDED", resource)
+            if resource["kind"] in ["Deployment", "StatefulSet"]:
+                namespace = url.path.split("/")[-2]
+                for ordinal in range(resource["spec"].get("replicas", 1)):
+                    threading.Thread(target=self.run_pod, args=(namespace, "{}-{}".format(name, ordinal)),
+                                     daemon=True).start()
+            return self.send(handler, method, 201, resource)
+
+        if method == "PATCH":
+            collection, name = url.path.rsplit("/", 1)
+            if handler.headers.get("Content-Type") != "application/merge-patch+json":
+                return self.send(handler, method, 415, {"code": 415})
+            with self.lock:
+                existing = self.objects.get(collection, {}).get(name)
+            if existing is None:
+                return self.send(handler, method, 404, {"code": 404})
+            patched = merge_patch(existing, json.loads(body))
+            self.emit(collection, "MODIFIED", patched)
+            return self.send(handler, method, 200, patched)
+
+        if "watch" not in query:
+            with self.lock:
+                self.lists += 1
+                items = list(self.objects.get(url.path, {}).values())
+                version = str(self.resource_version)
+            return self.send(handler, method, 200, {"items": items, "metadata": {"resourceVersion": version}})
+        self.watch(handler, url.path, int(query["resourceVersion"][0]))
+
+    def watch(self, handler, collection, since):
+        self.requests.append(("WATCH", collection, 200))
+        handler.send_response(200)
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def write(event):
+            line = (json.dumps(event) + "\n").encode()
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            handler.wfile.flush()
+
+        deadline = time.monotonic() + self.watch_seconds
+        while time.monotonic() < deadline:
+            with self.lock:
+                if self.expire_watches:
+                    self.expire_watches = False
+                    pending = None
+                else:
+                    pending = [e for e in self.events if e[0] > since and e[1] == collection]
+                    if not pending:
+                        self.lock.wait(0.05)
+                        continue
+            if pending is None:
+                write({"type": "ERROR", "object": {"kind": "Status", "code": 410, "reason": "Expired"}})
+                break
+            for version, _, event_type, obj in pending:
+                write({"type": event_type, "object": obj})
+                since = version
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
@@ -0,0 +1,83 @@
+import tracemalloc
+
+import toml
+
+FAUCET = "01" + "fa" * 32
+VALIDATORS = ["01" + "{:02x}".format(index) * 32 for index in range(1, 4)]
+ZERO_WEIGHT = ["01" + "ee" * 32]
+
+
+def fake_key(role, index):
+    return "01{}{:062x}".format(role, index)
+
+
+def test_accounts_toml(tool, tmp_path):
+    path = tmp_path / "accounts.toml"
+    extra = [(fake_key("0a", index), 1000) for index in range(3)]
+    delegators = tool.delegator_entries([fake_key("0d", index) for index in range(4)], VALIDATORS, 500, 100)
+    tool.create_accounts_toml(str(path), FAUCET, VALIDATORS, ZERO_WEIGHT, extra, delegators)
+
+    accounts = toml.load(str(path))
+    assert [account["public_key"] for account in accounts["accounts"]] == (
+        [FAUCET] + VALIDATORS + ZERO_WEIGHT + [key for key, _ in extra])
+    assert [account["validator"]["bonded_amount"] for account in accounts["accounts"][1:4]] == [
+        str(10**13), str(10**13 + 1), str(10**13 + 2)]
+    assert accounts["accounts"][-1]["balance"] == "1000"
+    assert [(d["delegator_public_key"], d["validator_public_key"]) for d in accounts["delegators"]] == [
+        (fake_key("0d", index), VALIDATORS[index % 3]) for index in range(4)]
+    assert accounts["delegators"][0]["delegated_amount"] == "100"
+
+
+def test_network_without_delegators(tool, tmp_path):
+    path = tmp_path / "accounts.toml"
+    tool.create_accounts_toml(str(path), FAUCET, VALIDATORS, ZERO_WEIGHT)
+    accounts = toml.load(str(path))
+    assert accounts["delegators"] == [] and len(accounts["accounts"]) == 5
+
+
+def test_delegators_are_pulled_after_the_accounts(tool, tmp_path):
+    events = []
+
+    def accounts():
+        for index in range(3):
+            yield fake_key("0a", index), 1000
+        events.append("accounts written")
+
+    def delegator_keys():
+        # generate_raw_keys starts its process pool here
+        events.append("delegators started")
+        for index in range(3):
+            yield fake_key("0d", index)
+
+    tool.create_accounts_toml(str(tmp_path / "accounts.toml"), FAUCET, VALIDATORS, ZERO_WEIGHT,
+                              accounts(), tool.delegator_entries(delegator_keys(), VALIDATORS, 500, 100))
+    assert events == ["accounts written", "delegators started"]
+
+
+def write_bulk_accounts(tool, path, count):
+    """Peak traced memory of writing count fake accounts and count delegators."""
+    tracemalloc.start()
+    try:
+        tool.create_accounts_toml(
+            str(path), FAUCET, VALIDATORS, ZERO_WEIGHT,
+            ((fake_key("0a", index), 1000) for index in range(count)),
+            tool.delegator_entries((fake_key("0d", index) for index in range(count)), VALIDATORS, 500, 100))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_accounts_stream_in_bounded_memory(tool, tmp_path):
+    small = write_bulk_accounts(tool, tmp_path / "small.toml", 1000)
+    path = tmp_path / "accounts.toml"
+    count = 10000
+    peak = write_bulk_accounts(tool, path, count)
+
+    # the write buffer and a few entries: ten times the accounts take no more memory
+    assert peak < 2 * 1024 * 1024 and peak < small + 256 * 1024
+    with open(path) as f:
+        counts = {"[[accounts]]": 0, "[[delegators]]": 0}
+        for line in f:
+            if line.startswith("[["):
+                counts[line.strip()] += 1
+    assert counts == {"[[accounts]]": 1 + len(VALIDATORS) + len(ZERO_WEIGHT) + count, "[[delegators]]": count}
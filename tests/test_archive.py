@@ -0,0 +1,71 @@
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+
+import pytest
+
+
+def write_tree(path, files):
+    """files: relative path -> bytes, created in the given order."""
+    for relative_path, data in files.items():
+        file_path = path / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+    os.chmod(path / "bin" / "casper-node", 0o755)
+
+
+def sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+FILES = {
+    "bin/casper-node": os.urandom(5 * 1024 * 1024 + 17),
+    "bin/1_0_0/config.toml": b"[node]\n" * 1000,
+    "etc/chainspec.toml": b"[network]\nname = 'net'\n",
+    "etc/empty": b"",
+}
+
+
+@pytest.mark.parametrize("compression", ["gz", "bz2"])
+def test_archives_are_reproducible(tool, tmp_path, compression):
+    first, second = tmp_path / "first", tmp_path / "second"
+    write_tree(first, FILES)
+    # the same content written in another order, with other mtimes
+    write_tree(second, dict(reversed(list(FILES.items()))))
+    for index, file_path in enumerate(sorted(second.rglob("*"))):
+        os.utime(file_path, (1000000 + index, 1000000 + index))
+
+    digests = set()
+    for tree, workers in [(first, 1), (second, 4), (first, 3)]:
+        obj = {"package-workers": workers, "timings": tool.Timings("test")}
+        archive_path = tmp_path / "{}-{}.tar.{}".format(tree.name, workers, compression)
+        assert tool.create_archive(str(archive_path), [("bin", str(tree / "bin")), ("etc", str(tree / "etc"))], obj,
+                                   compression, quiet=True)
+        digests.add(sha256(archive_path))
+    assert len(digests) == 1
+
+    with tarfile.open(str(archive_path)) as tar:
+        members = {member.name: member for member in tar.getmembers()}
+        assert sorted(members) == sorted(set(FILES) | {"bin", "bin/1_0_0", "etc"})
+        for name, data in FILES.items():
+            assert tar.extractfile(name).read() == data
+            assert members[name].mtime == tool.ARCHIVE_MTIME and members[name].uid == 0
+        assert members["bin/casper-node"].mode & 0o111
+
+
+def test_parallel_compressor_blocks_read_as_one_stream(tool):
+    data = os.urandom(tool.ParallelCompressor.BLOCK_SIZE) * 2 + b"tail"
+    outputs = set()
+    for workers in [1, 2, 8]:
+        out = io.BytesIO()
+        with tool.ParallelCompressor(out, "gz", workers) as compressor:
+            for offset in range(0, len(data), 1000003):
+                compressor.write(data[offset:offset + 1000003])
+        outputs.add(out.getvalue())
+    assert len(outputs) == 1
+
+    assert gzip.decompress(outputs.pop()) == data
+    with pytest.raises(Exception, match="unsupported compression"):
+        tool.ParallelCompressor(io.BytesIO(), "xz")
@@ -0,0 +1,155 @@
+import hashlib
+import http.client
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+from botocore.exceptions import ClientError
+
+from conftest import load_script
+
+OBJECT = bytes(range(256)) * 40
+
+
+def etag(data):
+    return '"{}"'.format(hashlib.md5(data).hexdigest())
+
+
+class FakeS3:
+    """get_object of an in-memory bucket, counting origin requests. Objects carry
+    their sha256 as metadata, as publish uploads them, and honor If-None-Match."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.fetches = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        with self.lock:
+            self.fetches += 1
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        data = self.objects[Key]
+        if IfNoneMatch == etag(data):
+            with self.lock:
+                self.not_modified += 1
+            raise ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+        # slow enough for concurrent requests of the same key to overlap
+        time.sleep(0.05)
+        body = io.BytesIO(data)
+        body.iter_chunks = lambda size: iter(lambda: body.read(size), b"")
+        return {"Body": body, "ETag": etag(data), "ContentType": "application/gzip",
+                "Metadata": {"sha256": hashlib.sha256(data).hexdigest()}}
+
+
+@pytest.fixture
+def cache_url(tmp_path):
+    module = load_script("artifact_cache", "docker/casper-kube-util/artifact-cache.py")
+    s3 = FakeS3({"networks/net/bundles/bin.tar.gz": OBJECT})
+    handler = type("Handler", (module.ArtifactHandler,), {})
+    handler.cache = module.ArtifactCache(s3, "bucket", str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}".format(server.server_address[1]), s3, handler.cache
+    server.shutdown()
+
+
+def test_miss_is_fetched_once_then_served_from_cache(cache_url):
+    url, s3, cache = cache_url
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda _: requests.get(url + "/networks/net/bundles/bin.tar.gz"), range(8)))
+    assert all(r.status_code == 200 and r.content == OBJECT for r in responses)
+    assert responses[0].headers["x-amz-meta-sha256"] == hashlib.sha256(OBJECT).hexdigest()
+    assert responses[0].headers["ETag"] == etag(OBJECT)
+    assert s3.fetches == 1
+    assert cache.stats["misses"] == 1 and cache.stats["hits"] == 7
+
+    assert requests.get(url + "/networks/net/bundles/bin.tar.gz").content == OBJECT
+    assert s3.fetches == 1
+
+
+@pytest.mark.parametrize("header,status,start,end", [
+    ("bytes=0-99", 206, 0, 99),
+    ("bytes=100-", 206, 100, len(OBJECT) - 1),
+    ("bytes=-10", 206, len(OBJECT) - 10, len(OBJECT) - 1),
+    ("bytes=10000-20000", 206, 10000, len(OBJECT) - 1),
+])
+def test_range_requests(cache_url, header, status, start, end):
+    url, s3, cache = cache_url
+    response = requests.get(url + "/networks/net/bundles/bin.tar.gz", headers={"Range": header})
+    assert response.status_code == status
+    assert response.content == OBJECT[start:end + 1]
+    assert response.headers["Content-Range"] == "bytes {}-{}/{}".format(start, end, len(OBJECT))
+
+
+@pytest.mark.parametrize("header", ["bytes=20000-", "bytes=50-10", "bytes=-", "items=0-1"])
+def test_unsatisfiable_ranges(cache_url, header):
+    url, s3, cache = cache_url
+    response = requests.get(url + "/networks/net/bundles/bin.tar.gz", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */{}".format(len(OBJECT))
+
+
+def test_head_has_no_body(cache_url):
+    url, s3, cache = cache_url
+    response = requests.head(url + "/networks/net/bundles/bin.tar.gz")
+    assert response.status_code == 200
+    assert response.headers["Content-Length"] == str(len(OBJECT)) and response.content == b""
+
+
+def test_missing_and_invalid_keys(cache_url):
+    url, s3, cache = cache_url
+    assert requests.get(url + "/networks/net/missing").status_code == 404
+    # sent as is, requests would normalize the path
+    connection = http.client.HTTPConnection(url[len("http://"):])
+    connection.request("GET", "/networks/../secret")
+    assert connection.getresponse().status == 400
+    connection.close()
+    assert requests.get(url + "/networks/net/").status_code == 400
+    # misses aren't cached, the origin is asked again
+    assert requests.get(url + "/networks/net/missing").status_code == 404
+    assert s3.fetches == 2
+
+
+def test_republished_bundle_is_revalidated(cache_url):
+    url, s3, cache = cache_url
+    key = "/networks/net/bundles/bin.tar.gz"
+    assert requests.get(url + key).content == OBJECT
+    cache.revalidate_seconds = 0
+
+    # unchanged at the origin: a conditional request, served from the cache
+    assert requests.get(url + key).content == OBJECT
+    assert s3.fetches == 2 and s3.not_modified == 1 and cache.stats["revalidated"] == 1
+
+    # republished under the same key: the new bundle and its sha256 are served
+    republished = OBJECT[::-1] + b"joiner"
+    s3.objects[key[1:]] = republished
+    response = requests.get(url + key)
+    assert response.content == republished
+    assert response.headers["x-amz-meta-sha256"] == hashlib.sha256(republished).hexdigest()
+    assert response.headers["ETag"] == etag(republished)
+    assert cache.stats["refreshed"] == 1
+
+    # removed at the origin: not served from the cache anymore
+    del s3.objects[key[1:]]
+    assert requests.get(url + key).status_code == 404
+
+
+def test_recently_validated_and_content_addressed_keys_are_not_revalidated(cache_url):
+    url, s3, cache = cache_url
+    chunk = "networks/net/binaries/chunks/" + hashlib.sha256(b"chunk").hexdigest()
+    s3.objects[chunk] = b"chunk"
+    for _ in range(3):
+        assert requests.get(url + "/networks/net/bundles/bin.tar.gz").content == OBJECT
+    assert s3.fetches == 1
+
+    cache.revalidate_seconds = 0
+    for _ in range(3):
+        assert requests.get(url + "/" + chunk).content == b"chunk"
+    assert s3.fetches == 2 and s3.not_modified == 0
@@ -0,0 +1,113 @@
+import json
+import threading
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+from fake_kube import FakeKube
+
+
+def config_map(name):
+    return {"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": name}, "data": {"a": "1"}}
+
+
+def manifest(nodes=3):
+    resources = [config_map("casper-node-config")]
+    resources += [{"apiVersion": "v1", "kind": "Service", "metadata": {"name": "casper-node-{:03d}".format(n)},
+                   "spec": {"ports": [{"port": 7777}]}} for n in range(1, nodes + 1)]
+    resources.append({"apiVersion": "networking.k8s.io/v1", "kind": "Ingress", "metadata": {"name": "ingress"},
+                      "spec": {}})
+    resources.append({"apiVersion": "apps/v1", "kind": "StatefulSet", "metadata": {"name": "casper-node"},
+                      "spec": {"replicas": nodes}})
+    resources.append({"apiVersion": "v1", "kind": "PersistentVolumeClaim", "metadata": {"name": "storage"},
+                      "spec": {}})
+    return resources
+
+
+@pytest.fixture
+def kube():
+    with FakeKube() as fake:
+        yield fake
+
+
+def test_create_batches_in_kind_order(tool, kube):
+    resources = manifest()
+    batches = tool.kube_create_batches(resources)
+    assert [sorted({r["kind"] for r in batch}) for batch in batches] == [
+        ["ConfigMap", "PersistentVolumeClaim", "Service"], ["StatefulSet"], ["Ingress"]]
+
+    client = tool.KubeClient(kube.url, token="token")
+    assert client.create_batches("net", batches, concurrency=4) == len(resources)
+    kinds = [kind for _, kind, _ in kube.created]
+    # every object of a batch exists before the next batch is started
+    assert kinds.index("StatefulSet") > max(i for i, k in enumerate(kinds) if k in ["ConfigMap", "Service"])
+    assert kinds[-1] == "Ingress"
+    assert ("/apis/apps/v1/namespaces/net/statefulsets", "StatefulSet", "casper-node") in kube.created
+
+
+def test_throttled_and_failed_requests_are_retried(tool, kube):
+    kube.fail_requests["POST"] = [429, 503, 429]
+    client = tool.KubeClient(kube.url, token="token", max_retries=3)
+    assert client.create("net", config_map("retried"))
+    assert [status for method, _, status in kube.requests if method == "POST"] == [429, 503, 429, 201]
+
+
+def test_retries_give_up(tool, kube):
+    kube.fail_requests["POST"] = [503, 503]
+    client = tool.KubeClient(kube.url, token="token", max_retries=1)
+    with pytest.raises(Exception, match="creating ConfigMap given-up failed: 503"):
+        client.create("net", config_map("given-up"))
+
+
+def test_existing_objects_are_patched(tool, kube):
+    client = tool.KubeClient(kube.url, token="token")
+    assert client.create("net", config_map("config"))
+    changed = dict(config_map("config"), data={"a": "2", "b": "3"})
+    assert not client.create("net", changed)
+    assert kube.objects["/api/v1/namespaces/net/configmaps"]["config"]["data"] == {"a": "2", "b": "3"}
+    assert [(m, s) for m, _, s in kube.requests] == [("POST", 201), ("POST", 409), ("PATCH", 200)]
+
+
+def test_watch_relists_after_expiry(tool, kube):
+    client = tool.KubeClient(kube.url, token="token")
+    client.create("net", config_map("first"))
+    stop = threading.Event()
+    watch = client.watch("/api/v1/namespaces/net/configmaps", stop)
+    assert next(watch)[1]["metadata"]["name"] == "first"
+
+    client.create("net", config_map("second"))
+    assert next(watch)[1]["metadata"]["name"] == "second"
+    kube.expire_watches = True
+    client.create("net", config_map("third"))
+    # the expired stream is dropped, the relist returns every current object
+    names = [next(watch)[1]["metadata"]["name"] for _ in range(3)]
+    stop.set()
+    assert sorted(names) == ["first", "second", "third"]
+    assert kube.lists == 2
+
+
+def test_deploy_network_waits_for_ready_pods(tool, kube, tmp_path, monkeypatch):
+    monkeypatch.setattr(tool, "GENESIS_HISTORY", str(tmp_path / "history.jsonl"))
+    network_path = tmp_path / "net"
+    network_path.mkdir()
+    (network_path / "kube_resources.yaml").write_text(yaml.safe_dump_all(manifest(nodes=4)))
+
+    result = CliRunner().invoke(tool.cli, [
+        "deploy-network", "--kube-server", kube.url, "--kube-token", "token", "--timeout", "30",
+        "--timeline", str(tmp_path / "timeline.json"), str(network_path)])
+    assert result.exit_code == 0, result.output
+
+    timeline = json.load(open(tmp_path / "timeline.json"))
+    assert sorted(timeline) == ["casper-node-{}".format(n) for n in range(4)]
+    for stages in timeline.values():
+        assert stages["scheduled"] <= stages["pulled"] <= stages["started"] <= stages["ready"]
+    record = json.loads(open(tmp_path / "history.jsonl").readline())
+    assert record["command"] == "deploy-network" and record["nodes"] == 4
+
+
+def test_node_container_has_a_readiness_probe(tool):
+    profile = {"limits": {"cpu": "1"}, "requests": {"cpu": "1"}}
+    settings = {"image": "image", "git_hash": "hash", "network_name": "net", "node_version": "1_0_0"}
+    container = tool.kube_node_container("casper-node", settings, [], profile)
+    assert container["readinessProbe"]["httpGet"] == {"path": "/status", "port": 8888}
@@ -0,0 +1,116 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+BLOCKS = ["{:064x}".format(index) for index in range(1, 6)]
+SIGNERS = ["01" + "{:02x}".format(index) * 32 for index in range(3)]
+
+
+def recording():
+    """An event stream as a node sends it: the API version, then per block the
+    BlockAdded event and a finality signature from each validator."""
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+    lines = ['data:{"ApiVersion":"1.0.0"}', ""]
+    event_id = 0
+    for block_hash in BLOCKS:
+        events = [{"BlockAdded": {"block_hash": block_hash, "block": {"header": {"timestamp": timestamp}}}}]
+        events += [{"FinalitySignature": {"block_hash": block_hash, "public_key": signer}} for signer in SIGNERS]
+        for event in events:
+            lines += ["data:" + json.dumps(event), "id:{}".format(event_id), ""]
+            event_id += 1
+        lines += [":", ""]
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def chunked(data, size):
+    pieces = [data[i:i + size] for i in range(0, len(data), size)]
+    return b"".join(b"%x;ext=1\r\n%s\r\n" % (len(piece), piece) for piece in pieces) + b"0\r\n\r\n"
+
+
+async def events_of(tool, feed, headers):
+    reader = asyncio.StreamReader()
+    for piece in feed:
+        reader.feed_data(piece)
+    reader.feed_eof()
+    return [event async for event in tool.read_event_stream(reader, headers)]
+
+
+@pytest.mark.parametrize("size", [7, 64, 100000])
+def test_read_chunked_event_stream(tool, size):
+    events = asyncio.run(events_of(tool, [chunked(recording(), size)], {"transfer-encoding": "chunked"}))
+    assert events[0] == ("ApiVersion", "1.0.0")
+    assert [name for name, _ in events[1:]] == ["BlockAdded", "FinalitySignature", "FinalitySignature",
+                                                 "FinalitySignature"] * len(BLOCKS)
+    assert [value["block_hash"] for name, value in events if name == "BlockAdded"] == BLOCKS
+
+
+def test_read_event_stream_until_eof(tool):
+    data = recording().replace(b"\r\n", b"\n")
+    # data lines of one event are joined with newlines
+    data += b'data:{"Step":\ndata: {"era_id": 3}}\n\n'
+    events = asyncio.run(events_of(tool, [data[i:i + 5] for i in range(0, len(data), 5)], {}))
+    assert len(events) == 2 + 4 * len(BLOCKS)
+    assert events[-1] == ("Step", {"era_id": 3})
+
+
+async def replay_server(streams):
+    """Nodes serving the recording, then ending the stream, and every connection they accepted."""
+    connections = []
+
+    async def serve(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        connections.append(writer)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        writer.write(chunked(recording(), 512))
+        await writer.drain()
+        writer.close()
+
+    servers = [await asyncio.start_server(serve, "127.0.0.1", 0) for _ in range(streams)]
+    urls = ["http://127.0.0.1:{}/events/main".format(s.sockets[0].getsockname()[1]) for s in servers]
+    return servers, urls, connections
+
+
+def test_event_watcher_follows_replayed_streams(tool):
+    async def watch():
+        servers, urls, connections = await replay_server(3)
+        watcher = tool.EventWatcher([("node-{}".format(i), url) for i, url in enumerate(urls)],
+                                    quorum=2, window=60, block_timeout=30, report_interval=0.5)
+        series = io.StringIO()
+        # each stream ends after the replay and is reconnected a second later
+        await watcher.run(1.6, series)
+        for server in servers:
+            server.close()
+        return watcher, series.getvalue(), len(connections)
+
+    watcher, series, connections = asyncio.run(watch())
+    assert connections == 6 and watcher.reconnects == 6
+    # the replays after a reconnect repeat finished blocks, which aren't counted again
+    assert watcher.blocks == len(BLOCKS) and watcher.incomplete == 0 and not watcher.in_flight
+    assert watcher.events == 2 * 3 * (1 + 4 * len(BLOCKS))
+    rows = list(csv.DictReader(io.StringIO(series)))
+    assert list(rows[0]) == tool.EventWatcher.COLUMNS
+    assert rows[-1]["blocks"] == str(len(BLOCKS))
+    for series_name in ["spread", "arrival", "finality"]:
+        assert rows[-1]["{}_p50_ms".format(series_name)] != ""
+
+
+def test_event_watcher_expires_blocks_missing_nodes(tool):
+    watcher = tool.EventWatcher([("a", "url-a"), ("b", "url-b")], quorum=2, window=60, block_timeout=10,
+                                report_interval=10)
+    watcher.on_event("a", "BlockAdded", {"block_hash": "aa"}, 100)
+    watcher.on_event("a", "FinalitySignature", {"block_hash": "aa", "public_key": SIGNERS[0]}, 101)
+    watcher.on_event("a", "FinalitySignature", {"block_hash": "aa", "public_key": SIGNERS[1]}, 102)
+    assert watcher.blocks == 0 and list(watcher.in_flight) == ["aa"]
+
+    # node b never adds the block, it is finished incomplete after block_timeout
+    watcher.on_event("a", "BlockAdded", {"block_hash": "bb"}, 111)
+    assert watcher.blocks == 1 and watcher.incomplete == 1 and list(watcher.in_flight) == ["bb"]
+    assert [value for _, value in watcher.samples["finality"].samples] == [2]
+    assert not watcher.samples["spread"].samples
+    # late events of a finished block are ignored
+    watcher.on_event("b", "BlockAdded", {"block_hash": "aa"}, 112)
+    assert "aa" not in watcher.in_flight and watcher.blocks == 1
@@ -0,0 +1,78 @@
+import json
+from datetime import datetime, timedelta
+
+
+def row(command, nodes, seconds, mode="full", network="net", **extra):
+    return dict(command=command, network=network, nodes=nodes, seconds=seconds, mode=mode, **extra)
+
+
+def write_history(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+def full_run(nodes, seconds, network="net", genesis_in=None, genesis_slack=None):
+    return [
+        row("create-network", nodes, seconds, network=network, genesis_in=genesis_in),
+        row("publish-network", nodes, seconds, network=network),
+        row("deploy-network", nodes, seconds, network=network, genesis_slack=genesis_slack),
+    ]
+
+
+def test_partial_runs_are_not_fitted(tool, tmp_path):
+    records = full_run(10, 10) + full_run(20, 20)
+    history = write_history(tmp_path / "full.jsonl", records)
+    expected = tool.estimate_genesis_in(history, 40, 0, 0)
+    assert expected == 120
+
+    # a quick incremental create and changed-only publish of a large network
+    records += [row("create-network", 100, 1, mode="incremental"),
+                row("publish-network", 100, 1, mode="changed-only"),
+                row("publish-network", 100, 1, mode="skip-unchanged"),
+                row("create-network", 100, 1)]
+    records[-1].pop("mode")
+    history = write_history(tmp_path / "partial.jsonl", records)
+    assert tool.estimate_genesis_in(history, 40, 0, 0) == expected
+
+
+def test_margin_follows_the_observed_slack(tool, tmp_path):
+    # 30s of commands, ready 20s after genesis at a 40s delay: 60s needed, a 100% margin
+    records = full_run(10, 10, genesis_in=40, genesis_slack=-20)
+    assert tool.observed_genesis_margins(records) == [1.0]
+    history = write_history(tmp_path / "missed.jsonl", records)
+    assert tool.estimate_genesis_in(history, 10, 0.25, 0) == 60
+
+    # ready with plenty of slack: the configured margin is kept
+    records = full_run(10, 10, genesis_in=120, genesis_slack=90)
+    assert tool.observed_genesis_margins(records) == [0.0]
+    history = write_history(tmp_path / "slack.jsonl", records)
+    assert tool.estimate_genesis_in(history, 10, 0.25, 0) == 37
+
+
+def test_observed_margins_pair_runs_of_a_network(tool):
+    records = (full_run(10, 10, network="a", genesis_in=60)
+               + full_run(10, 10, network="b", genesis_in=45, genesis_slack=0))
+    # network a's deploy has no recorded slack, b's is paired with b's own create
+    assert tool.observed_genesis_margins(records) == [0.5]
+    # a changed-only publish isn't a comparable run
+    records = full_run(10, 10, genesis_in=60, genesis_slack=0)
+    records[1]["mode"] = "changed-only"
+    assert tool.observed_genesis_margins(records) == []
+
+
+def test_idle_time_between_commands_is_not_needed_time(tool):
+    # 30s of commands with a 40s genesis delay. The operator waited 50s before publishing
+    # and 30s before deploying, so the nodes were ready 70s after genesis: 110s from create
+    # to ready, of which the commands needed 30s and the genesis delay covered them
+    created = datetime(2026, 10, 18, 12, 0, 10)
+    records = full_run(10, 10, genesis_in=40, genesis_slack=-70)
+    for record, finished in zip(records, [0, 60, 100]):
+        record["time"] = (created + timedelta(seconds=finished)).isoformat("T") + ".000000Z"
+    assert tool.observed_genesis_margins(records) == [0.0]
+
+    # records without a time count no idle time
+    for record in records:
+        record.pop("time")
+    assert tool.observed_genesis_margins(records) == [110 / 30 - 1]
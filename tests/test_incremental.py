@@ -0,0 +1,64 @@
+import json
+
+from test_publish import keys, publish
+
+TOOL_ARGS = ["--no-keypool", "--validator-count", "3"]
+
+
+def pending(network_path):
+    return json.loads((network_path / ".publish-pending.json").read_text())
+
+
+def node_files(node):
+    return ["nodes/{}/etc/casper/{}".format(node, name) for name in [
+        "1_0_0/config.toml", "keys/public_key.pem", "keys/public_key_hex", "keys/secret_key.pem",
+        "shared-files.json"]]
+
+
+def test_resize_publishes_only_the_changed_nodes(tool, tmp_path, create_network, s3_server):
+    endpoint_url, s3 = s3_server
+    network_path = tmp_path / "net"
+    create_network(network_path, tool_args=TOOL_ARGS + ["--non-validator-count", "1"])
+    publish(tool, network_path, endpoint_url, "--changed-only")
+    assert not (network_path / ".publish-pending.json").exists()
+    nodes = ["casper-node-net-{:03d}".format(index) for index in range(1, 7)]
+    keys_before = {node: (network_path / "nodes" / node / "etc/casper/keys/public_key_hex").read_text()
+                   for node in nodes[:4]}
+    chainspec = (network_path / "staging/config/1_0_0/chainspec.toml").read_text()
+
+    # grow by two zero weight nodes: the others keep their keys and configs, the
+    # genesis accounts change and with them the shared file every node references
+    output = create_network(network_path, ["--incremental"], TOOL_ARGS + ["--non-validator-count", "3"])
+    assert "Generating keys:  2 of 7" in output and "Node configs:  2 of 6 rendered" in output
+    changed = pending(network_path)["changed"]
+    assert [path for path in changed if path.startswith("nodes/")] == sorted(
+        ["nodes/{}/etc/casper/shared-files.json".format(node) for node in nodes[:4]]
+        + node_files(nodes[4]) + node_files(nodes[5]))
+    assert "staging/config/1_0_0/accounts.toml" in changed
+    assert "staging/config/1_0_0/chainspec.toml" not in changed
+    assert pending(network_path)["removed"] == []
+    assert (network_path / "staging/config/1_0_0/chainspec.toml").read_text() == chainspec
+    for node, public_key in keys_before.items():
+        assert (network_path / "nodes" / node / "etc/casper/keys/public_key_hex").read_text() == public_key
+
+    output = publish(tool, network_path, endpoint_url, "--changed-only")
+    uploaded = [line.split("Uploaded:  ")[1].split(" ")[0] for line in output.splitlines() if "Uploaded:  " in line]
+    assert not [key for key in uploaded if "/1_0_0/config.toml" in key and nodes[4] not in key and nodes[5] not in key]
+    assert set("networks/net/" + path for path in node_files(nodes[4])) <= set(keys(s3, "networks/net/nodes/"))
+
+    # shrink to no zero weight node at all
+    create_network(network_path, ["--incremental"], TOOL_ARGS + ["--non-validator-count", "0"])
+    assert sorted(p.name for p in (network_path / "nodes").iterdir()) == nodes[:3]
+    removed = pending(network_path)["removed"]
+    assert removed == sorted(path for node in nodes[3:] for path in node_files(node))
+    assert not [path for path in pending(network_path)["changed"] if path.startswith("nodes/")
+                and not path.endswith("shared-files.json")]
+
+    publish(tool, network_path, endpoint_url, "--changed-only")
+    published_nodes = set(key.split("/")[3] for key in keys(s3, "networks/net/nodes/"))
+    assert published_nodes == set(nodes[:3])
+    # the removed nodes' bundles go with them
+    assert keys(s3, "networks/net/bundles/nodes/") == [
+        "networks/net/bundles/nodes/{}.tar.gz".format(node) for node in nodes[:3]]
+    assert sorted(p.name for p in (network_path / "bundles" / "nodes").iterdir() if not p.name.startswith(".")) == [
+        "{}.tar.gz".format(node) for node in nodes[:3]]
@@ -0,0 +1,99 @@
+import json
+import os
+
+from click.testing import CliRunner
+
+
+def keypool(tool, pool_path, *args):
+    result = CliRunner().invoke(tool.cli, ["--keypool-dir", str(pool_path), "keypool", *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def index_events(pool_path):
+    with open(pool_path / "index.jsonl") as f:
+        return [json.loads(line) for line in f]
+
+
+def fill(tool, pool_path, count):
+    keypool(tool, pool_path, "fill", "--count", str(count), "--batch-size", "2")
+    return tool.pool_public_keys(str(pool_path))
+
+
+def test_fill_and_status(tool, tmp_path):
+    pool_path = tmp_path / "keypool"
+    public_keys = fill(tool, pool_path, 5)
+    assert len(public_keys) == len(set(public_keys)) == 5
+    for public_key in public_keys:
+        key_path = pool_path / "available" / public_key
+        assert (key_path / "public_key_hex").read_text() == public_key
+        assert (key_path / "secret_key.pem").is_file() and (key_path / "public_key.pem").is_file()
+    assert not os.listdir(pool_path / "generating")
+
+    # topping up to the same count generates nothing
+    assert fill(tool, pool_path, 5) == public_keys
+    assert set(public_keys) < set(fill(tool, pool_path, 6))
+    assert [event["event"] for event in index_events(pool_path)] == ["generated"] * 6
+    output = keypool(tool, pool_path, "status")
+    assert "Available:  6" in output and "Claimed:  0" in output
+
+
+def test_status_of_a_missing_pool(tool, tmp_path):
+    output = keypool(tool, tmp_path / "keypool", "status")
+    assert "Available:  0" in output and "Claimed:  0" in output
+    result = CliRunner().invoke(tool.cli, ["--no-keypool", "keypool", "status"])
+    assert result.exit_code == 2 and "--no-keypool given" in result.output
+
+
+def test_claimed_keys_are_not_reused(tool, tmp_path):
+    pool_path = tmp_path / "keypool"
+    public_keys = fill(tool, pool_path, 5)
+
+    first = tool.claim_pool_keys(str(pool_path), [str(tmp_path / "a" / str(index)) for index in range(2)])
+    second = tool.claim_pool_keys(str(pool_path), [str(tmp_path / "b" / str(index)) for index in range(2)])
+    assert first + second == public_keys[:4]
+    assert tool.pool_public_keys(str(pool_path)) == public_keys[4:]
+    assert (tmp_path / "b" / "1" / "public_key_hex").read_text() == public_keys[3]
+    claims = [event for event in index_events(pool_path) if event["event"] == "claimed"]
+    assert [(event["public_key"], event["key_path"]) for event in claims] == [
+        (public_keys[0], str(tmp_path / "a" / "0")), (public_keys[1], str(tmp_path / "a" / "1")),
+        (public_keys[2], str(tmp_path / "b" / "0")), (public_keys[3], str(tmp_path / "b" / "1"))]
+
+    # a pool running dry hands out what it has
+    assert tool.claim_pool_keys(str(pool_path), [str(tmp_path / "c" / str(index)) for index in range(3)]) == [
+        public_keys[4]]
+    assert tool.claim_pool_keys(str(pool_path), [str(tmp_path / "d" / "0")]) == []
+    assert not (tmp_path / "d").exists()
+    assert "Claimed:  5" in keypool(tool, pool_path, "status")
+
+
+def test_keys_claimed_concurrently_are_skipped(tool, tmp_path, monkeypatch):
+    pool_path = tmp_path / "keypool"
+    public_keys = fill(tool, pool_path, 3)
+    # another run claims the first key after this one listed the pool
+    listed = tool.pool_public_keys(str(pool_path))
+    os.rename(pool_path / "available" / public_keys[0], tmp_path / "elsewhere")
+    monkeypatch.setattr(tool, "pool_public_keys", lambda path: listed)
+    assert tool.claim_pool_keys(str(pool_path), [str(tmp_path / "a"), str(tmp_path / "b")]) == public_keys[1:]
+
+
+def test_networks_claim_then_generate(tool, tmp_path, create_network):
+    pool_path = tmp_path / "keypool"
+    public_keys = fill(tool, pool_path, 3)
+    tool_args = ["--keypool-dir", str(pool_path), "--validator-count", "3", "--non-validator-count", "1"]
+
+    # four nodes and the faucet: three keys claimed, two generated
+    output = create_network(tmp_path / "first", tool_args=tool_args)
+    assert "Key pool:  3 of 5 keys claimed" in output
+    assert tool.pool_public_keys(str(pool_path)) == []
+    # an empty pool is no error, every key is generated
+    output = create_network(tmp_path / "second", tool_args=tool_args)
+    assert "Key pool:  0 of 5 keys claimed" in output
+
+    network_keys = []
+    for network in ["first", "second"]:
+        nodes = json.loads((tmp_path / network / ".network-manifest.json").read_text())["nodes"]
+        network_keys += [node["public_key"] for node in nodes.values()]
+        network_keys.append((tmp_path / network / "staging" / "faucet" / "public_key_hex").read_text())
+    assert len(network_keys) == len(set(network_keys)) == 10
+    assert set(public_keys) <= set(network_keys[:5])
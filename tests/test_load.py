@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+SEED = "9d61b19deffd5a60ba844af492ec2cc44449c5697b326919703bac031cae7f60"
+ACCOUNT = "01d75a980182b10ab7d54bfed3c964073a0ee172f3daa62325af021a68f707511a"
+TARGET = "013d4017c3e843895a92b70aa74d1b7ebc9c982ccf2ec4968cc0cd55f12af4660c"
+
+# a 2.5 CSPR transfer with id 7 from the RFC 8032 test key, as the pycspr SDK (0.12.4)
+# builds and signs it, hex lower cased
+GOLDEN_DEPLOY = {
+    "hash": "7a64dd46c09a0b74fe0e5129d3bfd709038073c84975f78827152b0594ce884c",
+    "header": {
+        "account": ACCOUNT,
+        "timestamp": "2023-11-14T22:13:20.123Z",
+        "ttl": "30m",
+        "gas_price": 1,
+        "body_hash": "42bb6f75ada6cd777430c09fadc26928c0fcba8109e338aad7ab2ba4f812bef7",
+        "dependencies": [],
+        "chain_name": "casper-net-1",
+    },
+    "payment": {"ModuleBytes": {"module_bytes": "", "args": [
+        ["amount", {"cl_type": "U512", "bytes": "0400e1f505", "parsed": "100000000"}],
+    ]}},
+    "session": {"Transfer": {"args": [
+        ["amount", {"cl_type": "U512", "bytes": "0400f90295", "parsed": "2500000000"}],
+        ["target", {"cl_type": "PublicKey", "bytes": TARGET, "parsed": TARGET}],
+        ["id", {"cl_type": {"Option": "U64"}, "bytes": "010700000000000000", "parsed": 7}],
+    ]}},
+    "approvals": [{
+        "signer": ACCOUNT,
+        "signature": "01532dac2bff089a01875031d7dce50e162814f7c01456a5605f8a15c89b16897c"
+                     "7dc50f4355e6ea484a34540700996225cedb5c4bf3b4ead15a13d663bd8a9d09",
+    }],
+}
+
+
+def transfer_factory(tool, **kwargs):
+    secret_key = tool.Ed25519PrivateKey.from_private_bytes(bytes.fromhex(SEED))
+    return tool.TransferFactory("casper-net-1", [(ACCOUNT, secret_key)], 2500000000, 100000000, "30m", **kwargs)
+
+
+def test_transfer_matches_a_known_good_deploy(tool):
+    factory = transfer_factory(tool)
+    factory.recipients = [TARGET]
+    assert factory.deploy(7, 1700000000123) == GOLDEN_DEPLOY
+
+
+def test_batch_is_signed_json_rpc(tool):
+    bodies = transfer_factory(tool, recipients=4).batch(3)
+    requests = [json.loads(body) for body in bodies]
+    assert [r["id"] for r in requests] == [1, 2, 3]
+    for request in requests:
+        assert request["method"] == "account_put_deploy"
+        deploy = request["params"]["deploy"]
+        Ed25519PublicKey.from_public_bytes(bytes.fromhex(ACCOUNT[2:])).verify(
+            bytes.fromhex(deploy["approvals"][0]["signature"][2:]), bytes.fromhex(deploy["hash"]))
+    assert len({r["params"]["deploy"]["hash"] for r in requests}) == 3
+
+
+class RpcStub:
+    """A node's JSON-RPC endpoint accepting account_put_deploy, rejecting every
+    `reject_every`th deploy with an RPC error, and counting connections."""
+
+    def __init__(self, reject_every=0):
+        self.deploys = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.deploys.append(request["params"]["deploy"]["hash"])
+                    count = len(stub.deploys)
+                if reject_every and count % reject_every == 0:
+                    response = {"jsonrpc": "2.0", "id": request["id"],
+                                "error": {"code": -32008, "message": "invalid deploy"}}
+                else:
+                    response = {"jsonrpc": "2.0", "id": request["id"],
+                                "result": {"api_version": "1.0.0",
+                                           "deploy_hash": request["params"]["deploy"]["hash"]}}
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}/rpc".format(self.server.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+
+
+@pytest.mark.parametrize("reject_every", [0, 4])
+def test_load_generator_against_rpc_stub(tool, reject_every):
+    with RpcStub(reject_every) as first, RpcStub(reject_every) as second:
+        generator = tool.LoadGenerator([first.url, second.url], transfer_factory(tool),
+                                       connections=2, max_in_flight=8, report_interval=60)
+        stats = asyncio.run(generator.run(tps=100, ramp_to=None, ramp_seconds=0, duration=1))
+
+    assert 90 <= stats["submitted"] <= 100
+    # round robin over the nodes, on at most `connections` keep-alive connections each
+    assert len(first.deploys) + len(second.deploys) == stats["submitted"]
+    assert abs(len(first.deploys) - len(second.deploys)) <= 1
+    assert first.connections <= 2 and second.connections <= 2
+    rejected = len(first.deploys) // 4 + len(second.deploys) // 4 if reject_every else 0
+    assert stats["errors"] == rejected and stats["error_kinds"] == ({"rpc -32008": rejected} if rejected else {})
+    assert stats["accepted"] == stats["submitted"] - rejected
+    assert set(stats["latency_ms"]) == {"p50", "p90", "p99", "max"}
+
+
+def test_ramp_schedule(tool):
+    scheduled = tool.LoadGenerator.scheduled
+    assert scheduled(10, 5, None, 0) == 50
+    # 10 to 30 tps over 10s is 200 deploys, then 30 tps
+    assert scheduled(10, 10, 30, 10) == 200
+    assert scheduled(12, 10, 30, 10) == 260
@@ -0,0 +1,128 @@
+import gzip
+import json
+
+import pytest
+from click.testing import CliRunner
+
+# a text format node log, the older half rotated and gzipped
+ROTATED_TEXT_LOG = """\
+Oct 18 12:00:00.000 INFO  [casper_node::components::small_network] established outgoing connection to 10.0.0.2:35000
+Oct 18 12:00:01.000 INFO  [casper_node::components::linear_chain] added block height=1 took 10ms
+Oct 18 12:00:02.000 DEBUG [casper_node::components::contract_runtime] executed block height=1 took 250us
+"""
+TEXT_LOG = """\
+Oct 18 12:00:05.000 INFO  [casper_node::components::consensus] starting era 2
+Oct 18 12:00:10.000 WARN  [casper_node::components::small_network] connection closed by 10.0.0.3:35000
+Oct 18 12:00:35.000 INFO  [casper_node::components::consensus] new era 3 after the switch block
+Oct 18 12:00:36.000 INFO  [casper_node::components::gossiper] gossiped deploy to 3 peers
+Oct 18 12:00:40.000 ERROR [casper_node::reactor] unrelated failure
+"""
+# a json format node log
+JSON_LOG = "".join(json.dumps(line) + "\n" for line in [
+    {"timestamp": "2026-10-18T12:00:00.000Z", "level": "INFO",
+     "fields": {"message": "stored block", "height": 5, "duration_ms": 3}},
+    {"timestamp": "2026-10-18T12:01:00.500Z", "level": "INFO",
+     "fields": {"message": "block added", "height": 7, "elapsed_s": 2}},
+    {"timestamp": "2026-10-18T12:02:00.000Z", "level": "INFO", "fields": {"message": "fast sync complete"}},
+    {"timestamp": "2026-10-18T12:02:30.000Z", "level": "DEBUG",
+     "fields": {"message": "peer connected", "peer_id": "tls:1"}},
+])
+
+
+def write_logs(path):
+    path.mkdir()
+    with gzip.open(path / "casper-node-001.log.1.gz", "wt") as f:
+        f.write(ROTATED_TEXT_LOG)
+    (path / "casper-node-001.log").write_text(TEXT_LOG)
+    (path / "casper-node-002.json").write_text(JSON_LOG)
+
+
+def test_analyze_text_log(tool, tmp_path):
+    write_logs(tmp_path / "logs")
+    stats = tool.analyze_log_file(str(tmp_path / "logs" / "casper-node-001.log"), tool.LOG_EVENTS)
+    assert (stats["lines"], stats["formats"]) == (5, {"text": 5, "json": 0})
+    assert stats["levels"] == {"INFO": 3, "WARN": 1, "ERROR": 1}
+    assert {name: event["count"] for name, event in stats["events"].items()} == {
+        "era_transition": 2, "peer_disconnected": 1, "gossip": 1}
+    assert stats["last"] - stats["first"] == 35
+    # one era from the transition at 12:00:05 to the one at 12:00:35
+    assert (stats["eras"]["count"], stats["eras"]["seconds"]) == (1, 30)
+    assert stats["height_max"] is None
+
+    rotated = tool.analyze_log_file(str(tmp_path / "logs" / "casper-node-001.log.1.gz"), tool.LOG_EVENTS)
+    assert rotated["bytes"] == (tmp_path / "logs" / "casper-node-001.log.1.gz").stat().st_size
+    assert {name: event["count"] for name, event in rotated["events"].items()} == {
+        "peer_connected": 1, "block_added": 1, "block_executed": 1}
+    assert rotated["events"]["block_added"]["durations"]["max"] == 10
+    assert rotated["events"]["block_executed"]["durations"]["max"] == 0.25
+    assert rotated["height_max"] == 1
+
+
+def test_analyze_json_log(tool, tmp_path):
+    write_logs(tmp_path / "logs")
+    stats = tool.analyze_log_file(str(tmp_path / "logs" / "casper-node-002.json"), tool.LOG_EVENTS)
+    assert stats["formats"] == {"text": 0, "json": 4}
+    assert stats["levels"] == {"INFO": 3, "DEBUG": 1}
+    assert {name: event["count"] for name, event in stats["events"].items()} == {
+        "block_added": 2, "sync": 1, "peer_connected": 1}
+    assert stats["last"] - stats["first"] == 150
+    assert stats["height_max"] == 7
+    assert tool.histogram_percentiles(stats["events"]["block_added"]["durations"]) == {
+        "p50": pytest.approx(3.364, abs=0.001), "p90": 2000, "p99": 2000, "max": 2000}
+
+
+@pytest.mark.parametrize("workers", ["1", "3"])
+def test_analyze_logs(tool, tmp_path, workers):
+    write_logs(tmp_path / "logs")
+    output = tmp_path / "summary.json"
+    result = CliRunner().invoke(tool.cli, [
+        "analyze-logs", "--workers", workers, "-o", str(output), str(tmp_path / "logs")])
+    assert result.exit_code == 0, result.output
+    summary = json.loads(output.read_text())
+
+    assert sorted(summary["nodes"]) == ["casper-node-001", "casper-node-002"]
+    # the rotated file is merged into its node
+    text_node = summary["nodes"]["casper-node-001"]
+    assert (text_node["files"], text_node["lines"], text_node["formats"]) == (2, 8, {"text": 8, "json": 0})
+    assert text_node["levels"] == {"DEBUG": 1, "ERROR": 1, "INFO": 5, "WARN": 1}
+    assert (text_node["span_seconds"], text_node["height_max"], text_node["era_seconds_mean"]) == (40, 1, 30)
+    # a connect and a disconnect in 40 seconds
+    assert text_node["peer_churn_per_hour"] == 180
+    assert text_node["events"]["block_added"] == {
+        "count": 1, "per_minute": 1.5, "duration_ms": {"p50": 10, "p90": 10, "p99": 10, "max": 10}}
+    assert text_node["events"]["block_executed"]["duration_ms"]["max"] == 0.25
+    assert {name: event["count"] for name, event in text_node["events"].items()} == {
+        "block_added": 1, "block_executed": 1, "era_transition": 2, "gossip": 1,
+        "peer_connected": 1, "peer_disconnected": 1}
+
+    json_node = summary["nodes"]["casper-node-002"]
+    assert (json_node["span_seconds"], json_node["height_max"], json_node["era_seconds_mean"]) == (150, 7, None)
+    assert json_node["events"]["block_added"]["per_minute"] == 0.8
+    assert json_node["events"]["sync"] == {"count": 1, "per_minute": 0.4}
+
+    network = summary["network"]
+    assert (network["files"], network["lines"], network["formats"]) == (3, 12, {"text": 8, "json": 4})
+    assert network["height_max"] == 7
+    assert network["events"]["block_added"]["count"] == 3
+    assert network["events"]["block_added"]["duration_ms"]["max"] == 2000
+    assert network["events"]["peer_connected"]["count"] == 2
+    assert "block_added:  3 events" in result.output
+
+
+def test_custom_events_and_node_directories(tool, tmp_path):
+    for node in ["casper-node-001", "casper-node-002"]:
+        (tmp_path / "logs" / node).mkdir(parents=True)
+        (tmp_path / "logs" / node / "stdout.log").write_text(TEXT_LOG)
+    events_path = tmp_path / "events.yaml"
+    events_path.write_text("unrelated_failure: 'unrelated (failure|error)'\ngossip: {pattern: 'gossiped deploy to [2-9]'}\n")
+    output = tmp_path / "summary.json"
+    result = CliRunner().invoke(tool.cli, [
+        "analyze-logs", "--node-from", "dir", "--events-file", str(events_path), "-o", str(output),
+        str(tmp_path / "logs")])
+    assert result.exit_code == 0, result.output
+    summary = json.loads(output.read_text())
+    assert sorted(summary["nodes"]) == ["casper-node-001", "casper-node-002"]
+    events = summary["network"]["events"]
+    assert (events["unrelated_failure"]["count"], events["gossip"]["count"]) == (2, 2)
+    # two nodes sharing the 35 seconds: one failure per node in 35 seconds
+    assert events["unrelated_failure"]["per_minute"] == round(60 / 35, 2)
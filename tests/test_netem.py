@@ -0,0 +1,96 @@
+import shutil
+import subprocess
+
+import pytest
+
+PROFILE = {
+    "regions": {"us-east": 3, "eu-west": 2, "ap-south": 1},
+    "default": {"delay": "1ms"},
+    "links": [
+        {"between": ["us-east", "eu-west"], "delay": "40ms", "jitter": "5ms", "loss": "0.1%", "rate": "200mbit"},
+        {"between": ["ap-south", "us-east"], "delay": "120ms"},
+    ],
+    "uplink": "1gbit",
+    "nodes": {},
+}
+
+
+def nodes(count):
+    return ["casper-node-{:03d}".format(index) for index in range(1, count + 1)]
+
+
+def test_regions_follow_the_weights(tool):
+    regions = tool.assign_regions(nodes(12), PROFILE)
+    assert [regions[node] for node in nodes(6)] == ["us-east", "eu-west", "us-east", "ap-south", "eu-west", "us-east"]
+    # smooth round robin repeats every sum of weights nodes
+    assert [regions[node] for node in nodes(12)[6:]] == [regions[node] for node in nodes(6)]
+    assert tool.assign_regions(nodes(12), PROFILE) == regions
+
+
+def test_explicit_regions_take_no_round_robin_turn(tool):
+    profile = dict(PROFILE, regions={"a": 3, "b": 2}, nodes={"casper-node-001": "b"})
+    regions = tool.assign_regions(nodes(6), profile)
+    assert regions["casper-node-001"] == "b"
+    # the others are spread as if the pinned node weren't there
+    unpinned = tool.assign_regions(nodes(6)[1:], dict(profile, nodes={}))
+    assert {node: regions[node] for node in nodes(6)[1:]} == unpinned
+    assert list(unpinned.values()) == ["a", "b", "a", "b", "a"]
+
+
+def test_netem_plan(tool):
+    regions = {"casper-node-001": "us-east", "casper-node-002": "us-east",
+               "casper-node-003": "eu-west", "casper-node-004": "ap-south"}
+    addresses = {"casper-node-003": "casper-node-003.net.svc"}
+    plan = tool.netem_plan("casper-node-001", regions, PROFILE, addresses)
+
+    assert plan["region"] == "us-east"
+    assert plan["commands"] == [
+        ["tc", "qdisc", "add", "dev", "$dev", "root", "handle", "1:", "htb", "default", "10"],
+        ["tc", "class", "add", "dev", "$dev", "parent", "1:", "classid", "1:1", "htb", "rate", "1gbit"],
+        # unmatched traffic, e.g. to the artifact cache
+        ["tc", "class", "add", "dev", "$dev", "parent", "1:1", "classid", "1:10", "htb", "rate", "1gbit", "ceil", "1gbit"],
+        ["tc", "qdisc", "add", "dev", "$dev", "parent", "1:10", "handle", "10:", "netem", "delay", "1ms"],
+        # peer regions in name order
+        ["tc", "class", "add", "dev", "$dev", "parent", "1:1", "classid", "1:11", "htb", "rate", "1gbit", "ceil", "1gbit"],
+        ["tc", "qdisc", "add", "dev", "$dev", "parent", "1:11", "handle", "11:", "netem", "delay", "120ms"],
+        ["tc", "class", "add", "dev", "$dev", "parent", "1:1", "classid", "1:12", "htb", "rate", "200mbit", "ceil", "200mbit"],
+        ["tc", "qdisc", "add", "dev", "$dev", "parent", "1:12", "handle", "12:", "netem",
+         "delay", "40ms", "5ms", "distribution", "normal", "loss", "0.1%"],
+        ["tc", "class", "add", "dev", "$dev", "parent", "1:1", "classid", "1:13", "htb", "rate", "1gbit", "ceil", "1gbit"],
+        ["tc", "qdisc", "add", "dev", "$dev", "parent", "1:13", "handle", "13:", "netem", "delay", "1ms"],
+    ]
+    assert plan["filters"] == [
+        ("1:11", "ap-south", ["casper-node-004"]),
+        ("1:12", "eu-west", ["casper-node-003.net.svc"]),
+        ("1:13", "us-east", ["casper-node-002"]),
+    ]
+
+
+def test_netem_plan_without_default_delay(tool):
+    profile = dict(PROFILE, default={}, links=[])
+    plan = tool.netem_plan("a", {"a": "us-east", "b": "eu-west"}, profile, {})
+    assert not [command for command in plan["commands"] if "netem" in command]
+    assert plan["filters"] == [("1:11", "eu-west", ["b"])]
+
+
+@pytest.mark.skipif(not shutil.which("bash"), reason="bash not installed")
+def test_rendered_script_is_valid_bash(tool, tmp_path):
+    plan = tool.netem_plan("casper-node-001", tool.assign_regions(nodes(6), PROFILE), PROFILE, {})
+    script = tmp_path / "netem.sh"
+    script.write_text(tool.render_netem_script(plan))
+    subprocess.run(["bash", "-n", str(script)], check=True)
+
+
+@pytest.mark.parametrize("profile,error", [
+    ("default: {delay: 1ms}\n", "has no regions"),
+    ("regions: {a: 1}\nlatency: 1ms\n", "unknown network profile keys latency"),
+    ("regions: {a: 1}\ndefault: {delay: 1 ms}\n", "invalid delay 1 ms in default"),
+    ("regions: {a: 1}\ndefault: {jitter: 1ms}\n", "jitter without delay in default"),
+    ("regions: {a: 1}\nlinks: [{between: [a, b], delay: 1ms}]\n", "must name two of the profile's regions"),
+    ("regions: {a: 1}\nnodes: {casper-node-001: b}\n", "unknown region b"),
+])
+def test_invalid_profiles(tool, tmp_path, profile, error):
+    path = tmp_path / "profile.yaml"
+    path.write_text(profile)
+    with pytest.raises(Exception, match=error):
+        tool.load_network_profile(str(path))
@@ -0,0 +1,135 @@
+import time
+
+import pytest
+import toml
+
+TEMPLATE = {
+    "node": {"trusted_hash": "HEX-FORMATTED BLOCK HASH"},
+    "logging": {"format": "json"},
+    "consensus": {"secret_key_path": "secret_key.pem", "highway": {"unit_hashes_folder": "/var/lib"}},
+    "network": {"public_address": "<IP ADDRESS>:0", "bind_address": "0.0.0.0:1", "known_addresses": []},
+    "storage": {"path": "/var/lib/casper-node"},
+}
+
+
+def renderer(tool, template):
+    return tool.NodeConfigRenderer(template, {"casper-node-port": 35000})
+
+
+def test_render_sets_per_node_values(tool):
+    config = toml.loads(renderer(tool, TEMPLATE).render("casper-node-002", ["casper-node-001"], "ab" * 32))
+    assert config["node"]["trusted_hash"] == "ab" * 32
+    assert config["network"]["public_address"] == "casper-node-002:35000"
+    assert config["network"]["bind_address"] == "0.0.0.0:35000"
+    assert config["network"]["known_addresses"] == ["casper-node-001:35000"]
+    assert config["storage"]["path"] == "/storage/casper-node-002"
+    assert config["consensus"]["highway"]["unit_hashes_folder"] == "/storage/casper-node-002"
+    assert config["consensus"]["secret_key_path"] == "../keys/secret_key.pem"
+    assert config["logging"]["format"] == "text"
+
+
+def test_trusted_hash_without_node_section_raises(tool):
+    template = {k: v for k, v in TEMPLATE.items() if k != "node"}
+    config_renderer = renderer(tool, template)
+    assert "node" not in toml.loads(config_renderer.render("casper-node-002", []))
+    with pytest.raises(Exception, match=r"\[node\]"):
+        config_renderer.render("casper-node-002", [], "ab" * 32)
+
+
+def test_missing_storage_section_raises(tool):
+    with pytest.raises(Exception, match=r"\[storage\]"):
+        renderer(tool, {k: v for k, v in TEMPLATE.items() if k != "storage"})
+
+
+# a release's config-example.toml, trimmed: nested tables, arrays and inline values
+TEMPLATE_TOML = """
+[node]
+trusted_hash = 'HEX-FORMATTED BLOCK HASH'
+
+[logging]
+format = 'json'
+color = false
+abbreviate_modules = false
+
+[consensus]
+secret_key_path = 'secret_key.pem'
+
+[consensus.highway]
+unit_hashes_folder = '/var/lib/casper-node'
+pending_vertex_timeout = '30min'
+standstill_timeout = '5min'
+
+[consensus.highway.round_success_meter]
+num_rounds_to_consider = 40
+acceleration_parameter = 40
+acceleration_ftt = [1, 100]
+
+[network]
+public_address = '<IP ADDRESS>:0'
+bind_address = '0.0.0.0:34553'
+known_addresses = ['1.2.3.4:34553']
+gossip_interval = '30sec'
+max_outgoing_byte_rate_non_validators = 0
+
+[network.estimator_weights]
+consensus = 0
+deploy_gossip = 2
+
+[rpc_server]
+address = '0.0.0.0:7777'
+qps_limit = 100
+
+[storage]
+path = '/var/lib/casper-node'
+max_block_store_size = 483183820800
+enable_mem_deduplication = true
+"""
+
+# the highway layout, and the flat one of releases without consensus.highway
+LAYOUTS = {
+    "highway": TEMPLATE_TOML,
+    "flat": TEMPLATE_TOML.replace(
+        "secret_key_path = 'secret_key.pem'\n\n[consensus.highway]\nunit_hashes_folder = '/var/lib/casper-node'\n",
+        "secret_key_path = 'secret_key.pem'\nunit_hashes_folder = '/var/lib/casper-node'\n\n[consensus.other]\n"),
+}
+
+
+def legacy_render(template, port, public_address, known_addresses, trusted_hash):
+    """generate_node_config before the renderer: load, patch and dump the template per node."""
+    config = toml.loads(template)
+    if trusted_hash:
+        config["node"]["trusted_hash"] = trusted_hash
+    config["consensus"]["secret_key_path"] = "../keys/secret_key.pem"
+    config["logging"]["format"] = "text"
+    config["network"]["public_address"] = "{}:{}".format(public_address, port)
+    config["network"]["bind_address"] = "0.0.0.0:{}".format(port)
+    config["network"]["known_addresses"] = ["{}:{}".format(n, port) for n in known_addresses]
+    storage_path = "/storage/{}".format(public_address)
+    config["storage"]["path"] = storage_path
+    try:
+        config["consensus"]["highway"]["unit_hashes_folder"] = storage_path
+    except KeyError:
+        config["consensus"]["unit_hashes_folder"] = storage_path
+    return toml.dumps(config)
+
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+@pytest.mark.parametrize("trusted_hash", [None, "ab" * 32])
+def test_render_matches_the_legacy_path(tool, layout, trusted_hash):
+    config_renderer = renderer(tool, toml.loads(LAYOUTS[layout]))
+    known = ["casper-node-{:03d}".format(index) for index in range(1, 6)]
+    for node in ["casper-node-001", "casper-node-007"]:
+        rendered = config_renderer.render(node, known, trusted_hash)
+        expected = legacy_render(LAYOUTS[layout], 35000, node, known, trusted_hash)
+        assert toml.loads(rendered) == toml.loads(expected)
+    flat = "unit_hashes_folder" in toml.loads(rendered)["consensus"]
+    assert flat == (layout == "flat")
+
+
+def test_thousand_renders_well_under_a_second(tool):
+    config_renderer = renderer(tool, toml.loads(TEMPLATE_TOML))
+    known = ["casper-node-{:03d}".format(index) for index in range(1, 101)]
+    started = time.perf_counter()
+    for index in range(1000):
+        config_renderer.render("casper-node-{:04d}".format(index), known, "ab" * 32)
+    assert time.perf_counter() - started < 0.5
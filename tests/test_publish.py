@@ -0,0 +1,264 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+
+from click.testing import CliRunner
+
+from conftest import ROOT
+
+
+def publish(tool, target_path, endpoint_url, *args):
+    result = CliRunner().invoke(tool.cli, [
+        "publish-network", "--aws-profile", "None", "--target-s3-bucket", "bucket",
+        "--s3-endpoint-url", endpoint_url, *args, str(target_path)])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def keys(s3, prefix):
+    return sorted(item["Key"] for page in s3.get_paginator("list_objects_v2").paginate(Bucket="bucket", Prefix=prefix)
+                  for item in page.get("Contents", []))
+
+
+def test_multipart_uploads_fit_the_connection_pool(tool, tmp_path, s3_server, caplog):
+    endpoint_url, s3 = s3_server
+    network_path = tmp_path / "net"
+    os.makedirs(network_path / "files")
+    for index in range(4):
+        with open(network_path / "files" / "big-{}".format(index), "wb") as f:
+            f.write(os.urandom(12 * 1024 * 1024))
+
+    with caplog.at_level(logging.WARNING, logger="urllib3.connectionpool"):
+        publish(tool, network_path, endpoint_url, "--no-bundles", "--upload-workers", "4",
+                "--multipart-threshold", "1", "--multipart-chunksize", "5", "--multipart-concurrency", "3")
+    assert not [r for r in caplog.records if "Connection pool is full" in r.getMessage()]
+    assert keys(s3, "networks/net/") == ["networks/net/files/big-{}".format(i) for i in range(4)]
+
+
+def write_network(tool, network_path, node_count):
+    """A published network tree: per node config and keys, and a chainspec shared by digest."""
+    chainspec = network_path / "chainspec.toml.src"
+    os.makedirs(network_path)
+    chainspec.write_text("[network]\nname = 'net'\n")
+    digest = tool.store_shared_file(str(network_path / "shared"), str(chainspec))
+    chainspec.unlink()
+    for index in range(1, node_count + 1):
+        node_path = network_path / "nodes" / "casper-node-{:03d}".format(index)
+        os.makedirs(node_path / "etc" / "casper" / "1_0_0")
+        (node_path / "etc" / "casper" / "1_0_0" / "config.toml").write_text("[node]\n")
+        tool.write_shared_manifest(str(node_path), {"casper/1_0_0/chainspec.toml": digest})
+    return digest
+
+
+def test_node_bundles_leave_shared_files_out(tool, tmp_path, s3_server):
+    import tarfile
+
+    endpoint_url, s3 = s3_server
+    network_path = tmp_path / "net"
+    digest = write_network(tool, network_path, 3)
+    publish(tool, network_path, endpoint_url)
+
+    with tarfile.open(network_path / "bundles" / "nodes" / "casper-node-001.tar.gz") as tar:
+        names = tar.getnames()
+    assert "casper/1_0_0/config.toml" in names
+    assert not [name for name in names if name.endswith("chainspec.toml")]
+    # published once, for every node to fetch in one GET, or by digest
+    with tarfile.open(network_path / "bundles" / tool.SHARED_BUNDLE) as tar:
+        assert tar.getnames() == [digest]
+    assert "networks/net/bundles/" + tool.SHARED_BUNDLE in keys(s3, "networks/net/bundles/")
+    assert keys(s3, "networks/net/shared/") == ["networks/net/shared/" + digest]
+
+
+def shared_block(tmp_path, bundled):
+    """init.sh's shared file install into tmp_path/etc, with a shared bundle of the
+    bundled files and a fetch_shared that records its use."""
+    import tarfile
+
+    init = open(os.path.join(ROOT, "docker", "casper-kube-node", "init.sh")).read()
+    block = init[init.index("#shared config"):init.index("#binary:")]
+    files = {"casper/1_0_0/chainspec.toml": b"chainspec", "casper/2_0_0/chainspec.toml": b"chainspec",
+             "casper/1_0_0/accounts.toml": b"accounts", "faucet/secret_key.pem": b"key"}
+    digests = {path: hashlib.sha256(data).hexdigest() for path, data in files.items()}
+    os.makedirs(tmp_path / "etc" / "casper")
+    (tmp_path / "etc" / "casper" / "shared-files.json").write_text(json.dumps(digests))
+    os.makedirs(tmp_path / "shared")
+    for path, data in files.items():
+        (tmp_path / "shared" / digests[path]).write_bytes(data)
+    with tarfile.open(tmp_path / "shared.tar.gz", "w:gz") as tar:
+        for path in bundled:
+            tar.add(tmp_path / "shared" / digests[path], digests[path])
+    script = tmp_path / "shared.sh"
+    script.write_text(
+        "network_prefix=networks/net\n"
+        "fetch_bundle() {{ echo bundle $1; [ -n '{bundled}' ] && tar -xzf {bundle} -C $2; }}\n"
+        "fetch_shared() {{ echo fetched $2; mkdir -p $(dirname $2); cp {shared}/$1 $2; }}\n".format(
+            bundled="y" if bundled else "", bundle=tmp_path / "shared.tar.gz", shared=tmp_path / "shared")
+        + block.replace("/etc/", str(tmp_path / "etc") + "/"))
+    result = subprocess.run(["bash", str(script)], capture_output=True, text=True)
+    installed = {path: (tmp_path / "etc" / path).read_bytes() for path in files if (tmp_path / "etc" / path).exists()}
+    return result, installed, files
+
+
+def test_init_installs_shared_files_from_one_bundle(tmp_path):
+    # the chainspec of both versions is one file of the bundle
+    result, installed, files = shared_block(tmp_path / "bundled", [
+        "casper/1_0_0/chainspec.toml", "casper/1_0_0/accounts.toml", "faucet/secret_key.pem"])
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert installed == files
+    assert result.stdout == "bundle networks/net/bundles/shared.tar.gz\n"
+
+    # a file the bundle lacks is fetched on its own
+    result, installed, files = shared_block(tmp_path / "partial", ["casper/1_0_0/chainspec.toml"])
+    assert result.returncode == 0 and installed == files
+    assert sorted(line for line in result.stdout.splitlines() if line.startswith("fetched")) == [
+        "fetched {}/etc/{}".format(tmp_path / "partial", path)
+        for path in ["casper/1_0_0/accounts.toml", "faucet/secret_key.pem"]]
+
+    # without a shared bundle every file is fetched on its own
+    result, installed, files = shared_block(tmp_path / "unbundled", [])
+    assert result.returncode == 0 and installed == files
+    assert "no shared bundle" in result.stdout and result.stdout.count("fetched") == len(files)
+
+
+def test_account_keys_are_never_published(tool, tmp_path, s3_server):
+    endpoint_url, s3 = s3_server
+    network_path = tmp_path / "net"
+    write_network(tool, network_path, 1)
+    account = '{"kind": "account", "public_key": "01' + "ab" * 32 + '", "secret_key": "' + "cd" * 32 + '"}\n'
+    # an earlier version wrote the keys into the published tree, and published them
+    legacy_path = network_path / "staging" / "accounts.jsonl"
+    os.makedirs(legacy_path.parent)
+    legacy_path.write_text(account)
+    tool.record_network_changes(str(network_path), {"nodes": {}, "files": {}}, {})
+    os.remove(network_path / tool.PUBLISH_PENDING)
+    s3.put_object(Bucket="bucket", Key="networks/net/staging/accounts.jsonl", Body=account.encode())
+
+    publish(tool, network_path, endpoint_url)
+    assert not legacy_path.exists()
+    assert (network_path / "staging" / ".accounts.jsonl").read_text() == account
+    assert not [key for key in keys(s3, "") if "accounts" in key]
+    manifest = tool.load_network_manifest(str(network_path))
+    assert not [path for path in manifest["files"] if "accounts" in path]
+    assert tool.load_senders(str(network_path), None, 10)[0][0] == "01" + "ab" * 32
+
+
+def test_binaries_are_published_one_way_only(tool, tmp_path, s3_server):
+    endpoint_url, s3 = s3_server
+    network_path = tmp_path / "net"
+    write_network(tool, network_path, 1)
+    os.makedirs(network_path / "staging" / "bin" / "1_0_0")
+    (network_path / "staging" / "bin" / "1_0_0" / "casper-node").write_bytes(os.urandom(300 * 1024))
+    whole = ["networks/net/bundles/bin.tar.gz", "networks/net/staging/bin/1_0_0/casper-node"]
+    chunk_list = "networks/net/" + tool.BINARY_CHUNK_LIST
+
+    publish(tool, network_path, endpoint_url, "--no-binary-chunks")
+    assert set(whole) <= set(keys(s3, "networks/net/")) and chunk_list not in keys(s3, "networks/net/")
+
+    # init.sh would fall back to the whole binaries, which the next build leaves stale
+    publish(tool, network_path, endpoint_url)
+    published = keys(s3, "networks/net/")
+    assert chunk_list in published and not set(whole) & set(published)
+    assert keys(s3, tool.BINARY_CHUNK_STORE + "/")
+
+    # and the other way around, init.sh prefers a left over chunk list
+    publish(tool, network_path, endpoint_url, "--no-binary-chunks")
+    published = keys(s3, "networks/net/")
+    assert set(whole) <= set(published) and chunk_list not in published
+
+
+def binary_block(tmp_path, chunks_status):
+    """init.sh's binary fetch, with fetch_binary_chunks returning chunks_status and
+    fallbacks that record their use."""
+    init = open(os.path.join(ROOT, "docker", "casper-kube-node", "init.sh")).read()
+    block = init[init.index("#binary:"):init.index("chmod +x /var/lib/casper/bin")]
+    script = tmp_path / "binary.sh"
+    script.write_text(
+        "fetch_binary_chunks() { return %d; }\n"
+        "fetch_bundle() { echo fallback bundle; return 1; }\n"
+        "aws() { echo fallback sync; }\n" % chunks_status + block)
+    return subprocess.run(["bash", str(script)], capture_output=True, text=True)
+
+
+def test_init_never_falls_back_from_published_chunks(tmp_path):
+    result = binary_block(tmp_path, 0)
+    assert result.returncode == 0 and "fallback" not in result.stdout
+    result = binary_block(tmp_path, 1)
+    assert result.returncode == 1 and "fallback" not in result.stdout
+    # no chunk list published
+    result = binary_block(tmp_path, 2)
+    assert result.returncode == 0 and "fallback bundle" in result.stdout and "fallback sync" in result.stdout
+
+
+def cache_prefill(s3, cache_dir):
+    """Prefill an artifact cache as casper-kube-util's init.sh starts it for `net`,
+    returning the keys it cached."""
+    import re
+    from conftest import load_script
+
+    init = open(os.path.join(ROOT, "docker", "casper-kube-util", "init.sh")).read()
+    prefixes = [prefix.replace("$NETWORK_NAME", "net") for prefix in re.findall(r"--prefill (\S+)", init)]
+    cache = load_script("artifact_cache", "docker/casper-kube-util/artifact-cache.py").ArtifactCache(
+        s3, "bucket", str(cache_dir))
+    cache.prefill(prefixes, 4)
+    metadata_path = cache_dir / "metadata"
+    return sorted(str(path.relative_to(metadata_path))[:-len(".json")] for path in metadata_path.rglob("*.json"))
+
+
+def test_artifact_cache_prefills_what_publish_writes(tool, tmp_path, s3_server):
+    endpoint_url, s3 = s3_server
+    network_path = tmp_path / "net"
+    digest = write_network(tool, network_path, 2)
+    os.makedirs(network_path / "staging" / "bin" / "1_0_0")
+    (network_path / "staging" / "bin" / "1_0_0" / "casper-node").write_bytes(os.urandom(300 * 1024))
+    node_bundles = ["networks/net/bundles/nodes/casper-node-00{}.tar.gz".format(i) for i in [1, 2]]
+
+    # the chunks pods fetch live in the bucket wide chunk store, the cache follows the chunk list there
+    publish(tool, network_path, endpoint_url)
+    chunks = keys(s3, tool.BINARY_CHUNK_STORE + "/")
+    shared_bundle = "networks/net/bundles/" + tool.SHARED_BUNDLE
+    assert cache_prefill(s3, tmp_path / "chunked") == sorted(
+        node_bundles + ["networks/net/" + tool.BINARY_CHUNK_LIST, shared_bundle] + chunks)
+
+    publish(tool, network_path, endpoint_url, "--no-binary-chunks")
+    assert cache_prefill(s3, tmp_path / "whole") == sorted(
+        node_bundles + ["networks/net/bundles/bin.tar.gz", shared_bundle])
+
+
+def upload_report(output):
+    """(uploaded, skipped) of publish's upload total, checking the per-file and aggregate throughput lines."""
+    import re
+
+    throughput = r"\d+\.\d MiB in \d+\.\d\ds, \d+\.\d MiB/s"
+    per_file = re.findall(r"Uploaded:  (\S+) \((" + throughput + r")\)", output)
+    total = re.search(r"Upload total:  (\d+) files, (\d+) skipped, " + throughput, output)
+    assert total, output
+    assert len(per_file) == int(total.group(1))
+    return sorted(key for key, _ in per_file), int(total.group(2))
+
+
+def test_skip_unchanged_uploads_only_changed_files(tool, tmp_path, s3_server):
+    endpoint_url, s3 = s3_server
+    network_path = tmp_path / "net"
+    os.makedirs(network_path / "files")
+    (network_path / "files" / "a").write_text("a")
+    (network_path / "files" / "b").write_text("b")
+    # above the 5 MiB multipart threshold: compared by its multipart ETag
+    (network_path / "files" / "big").write_bytes(os.urandom(12 * 1024 * 1024))
+    options = ["--no-bundles", "--skip-unchanged", "--multipart-threshold", "5", "--multipart-chunksize", "5"]
+    all_keys = ["networks/net/files/" + name for name in ["a", "b", "big"]]
+
+    assert upload_report(publish(tool, network_path, endpoint_url, *options)) == (all_keys, 0)
+    assert s3.head_object(Bucket="bucket", Key="networks/net/files/big")["ETag"].endswith('-3"')
+    assert upload_report(publish(tool, network_path, endpoint_url, *options)) == ([], 3)
+
+    (network_path / "files" / "b").write_text("changed")
+    with open(network_path / "files" / "big", "r+b") as f:
+        f.seek(11 * 1024 * 1024)
+        f.write(b"changed")
+    assert upload_report(publish(tool, network_path, endpoint_url, *options)) == (all_keys[1:], 1)
+    assert s3.get_object(Bucket="bucket", Key="networks/net/files/b")["Body"].read() == b"changed"
+
+    # without --skip-unchanged everything is uploaded again
+    assert upload_report(publish(tool, network_path, endpoint_url, *options[:1])) == (all_keys, 0)
@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ETAG = '"v2"'
+
+
+def make_archive(content):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as tar:
+        info = tarfile.TarInfo("casper-node")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+ARCHIVE = make_archive(os.urandom(256 * 1024))
+
+
+class ReleaseHandler(BaseHTTPRequestHandler):
+    """Serves ARCHIVE with an ETag and single `bytes=N-` ranges, 416 past its end."""
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get("Range") and self.headers.get("If-Range") == ETAG:
+            start = int(self.headers["Range"][len("bytes="):].rstrip("-"))
+            if start >= len(ARCHIVE):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(len(ARCHIVE)))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        body = ARCHIVE[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def release_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ReleaseHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}/bin.tar.gz".format(server.server_address[1])
+    server.shutdown()
+
+
+def write_part(archive_path, url, data):
+    with open(archive_path + ".part", "wb") as f:
+        f.write(data)
+    with open(archive_path + ".part.json", "w") as f:
+        json.dump({"url": url, "etag": ETAG, "last_modified": None}, f)
+
+
+def test_download_and_resume(tool, tmp_path, release_url):
+    archive_path = str(tmp_path / "bin.tar.gz")
+    write_part(archive_path, release_url, ARCHIVE[:1000])
+    assert tool.fetch_release_archive(release_url, archive_path, str(tmp_path / "out")).startswith("resumed")
+    assert open(archive_path, "rb").read() == ARCHIVE
+
+
+@pytest.mark.parametrize("stale_archive", [False, True])
+def test_complete_part_file_is_fetched_again(tool, tmp_path, release_url, stale_archive):
+    """A crash between the download and the rename leaves a complete .part file, answered with 416."""
+    archive_path = str(tmp_path / "bin.tar.gz")
+    if stale_archive:
+        with open(archive_path, "wb") as f:
+            f.write(make_archive(b"old"))
+        with open(archive_path + ".json", "w") as f:
+            json.dump({"url": release_url, "etag": '"v1"', "last_modified": None}, f)
+    write_part(archive_path, release_url, ARCHIVE)
+
+    extract_path = tmp_path / "out"
+    assert tool.fetch_release_archive(release_url, archive_path, str(extract_path)) == "downloaded"
+    assert open(archive_path, "rb").read() == ARCHIVE
+    assert not os.path.exists(archive_path + ".part")
+    assert os.path.getsize(extract_path / "casper-node") == 256 * 1024
+    # and the next run revalidates the finished archive
+    assert tool.fetch_release_archive(release_url, archive_path, str(extract_path)) == "cached"
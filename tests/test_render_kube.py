@@ -0,0 +1,321 @@
+from string import Template
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+# create-kube-network's heredocs before render-kube, per node and per ingress host
+LEGACY_NODE = """
+---
+apiVersion: v1
+kind: PersistentVolumeClaim
+metadata:
+  name: $node_label-pv-claim
+spec:
+  storageClassName: gp2
+  accessModes:
+    - ReadWriteOnce
+  resources:
+    requests:
+      storage: $node_storage
+
+---
+kind: Service
+apiVersion: v1
+metadata:
+  name: $node_label
+spec:
+  selector:
+    app: $node_label
+  ports:
+    - name: rest
+      protocol: TCP
+      port: 8888
+      targetPort: 8888
+    - name: rpc
+      protocol: TCP
+      port: 7777
+      targetPort: 7777
+    - name: casper-node
+      protocol: TCP
+      port: $node_port
+      targetPort: $node_port
+
+---
+kind: Deployment
+apiVersion: apps/v1
+metadata:
+  name: "${node_label}"
+  labels:
+    app: $node_label
+spec:
+  replicas: 1
+  selector:
+    matchLabels:
+      app: $node_label
+  template:
+    metadata:
+      labels:
+       app:  $node_label
+    spec:
+      containers:
+        - name: $node_label
+
+          image: "${docker_repository}/casper-kube-node"
+          env:
+          - name: CASPER_NODE_GIT_HASH
+            value: "$git_hash"
+          - name: CASPER_NODE_INDEX
+            value: "$zero_pad_index"
+          - name: NETWORK_NAME
+            value: "$network_name"
+          - name: CASPER_NODE_VERSION
+            value: "$node_version"
+          - name: RUST_LOG
+            value: info
+          - name: RUST_BACKTRACE
+            value: "1"
+          resources:
+            limits:
+              cpu: "$node_cpu_limit"
+              memory: "$node_mem_limit"
+            requests:
+              cpu: "$node_cpu_request"
+              memory: "$node_mem_request"
+          volumeMounts:
+          - mountPath: "/storage"
+            name: $node_label-pv
+          securityContext:
+            capabilities:
+              add:
+                - NET_ADMIN
+      volumes:
+        - name: $node_label-pv
+          persistentVolumeClaim:
+            claimName: $node_label-pv-claim
+"""
+
+LEGACY_INGRESS = """
+---
+apiVersion: extensions/v1beta1
+kind: Ingress
+metadata:
+  name: casper-ingress
+spec:
+  rules:
+"""
+
+LEGACY_INGRESS_HOST = """
+  - host: $node_label.k8s.srtip.casperlabs.io
+    http:
+      paths:
+      - path: /status
+        backend:
+          serviceName: $node_label
+          servicePort: 8888
+      - path: /rpc
+        backend:
+          serviceName: $node_label
+          servicePort: 7777
+      - path: /events
+        backend:
+          serviceName: $node_label
+          servicePort: 9999
+"""
+
+SETTINGS = {
+    "network_name": "net", "node_port": "35000", "node_storage": "1Gi", "git_hash": "abc123",
+    "docker_repository": "registry.example", "node_version": "1_0_0",
+    "node_cpu_limit": "500m", "node_mem_limit": "500Mi", "node_cpu_request": "500m", "node_mem_request": "500Mi",
+}
+NODE_COUNT = 4
+EVENTS_PORT = {"name": "events", "protocol": "TCP", "port": 9999, "targetPort": 9999}
+
+
+def legacy_objects():
+    text = ""
+    for index in range(1, NODE_COUNT + 1):
+        text += Template(LEGACY_NODE).substitute(
+            SETTINGS, node_label="casper-node-net-{:03d}".format(index), zero_pad_index="{:03d}".format(index))
+    text += LEGACY_INGRESS + "".join(
+        Template(LEGACY_INGRESS_HOST).substitute(node_label="casper-node-net-{:03d}".format(index))
+        for index in range(1, NODE_COUNT + 1))
+    return [o for o in yaml.safe_load_all(text) if o]
+
+
+def render(tool, tmp_path, workload, *args):
+    output = tmp_path / "kube_resources.yaml"
+    result = CliRunner().invoke(tool.cli, [
+        "--node-port", SETTINGS["node_port"], "--validator-count", "3", "--non-validator-count", "1",
+        "--workload", workload, "render-kube", "-n", "net", "--git-hash", SETTINGS["git_hash"],
+        "--docker-image", SETTINGS["docker_repository"] + "/casper-kube-node", "-o", str(output), *args,
+        str(tmp_path / "net")])
+    assert result.exit_code == 0, result.output
+    return [o for o in yaml.safe_load_all(open(output)) if o]
+
+
+def by_kind(objects):
+    return {(o["kind"], o["metadata"]["name"]): o for o in objects}
+
+
+def test_deployments_match_the_heredoc(tool, tmp_path):
+    legacy = by_kind(legacy_objects())
+    rendered = by_kind(render(tool, tmp_path, "deployment"))
+    assert sorted(rendered) == sorted(legacy)
+
+    for (kind, name), old in legacy.items():
+        new = rendered[kind, name]
+        assert new["metadata"] == old["metadata"], name
+        if kind == "PersistentVolumeClaim":
+            assert new["spec"] == old["spec"]
+        elif kind == "Service":
+            assert new["spec"]["selector"] == old["spec"]["selector"]
+            # the Ingress routed /events to the Services, which had no such port
+            assert new["spec"]["ports"] == old["spec"]["ports"][:2] + [EVENTS_PORT] + old["spec"]["ports"][2:]
+        elif kind == "Deployment":
+            assert new["spec"]["selector"] == old["spec"]["selector"]
+            assert new["spec"]["replicas"] == 1
+            # labels the spreading selects pods by are added
+            assert new["spec"]["template"]["metadata"]["labels"] == dict(
+                old["spec"]["template"]["metadata"]["labels"], **{"casper-network": "net"},
+                **{"casper-role": new["spec"]["template"]["metadata"]["labels"]["casper-role"]})
+            [container], [old_container] = new["spec"]["template"]["spec"]["containers"], \
+                old["spec"]["template"]["spec"]["containers"]
+            for key in ["name", "image", "env", "resources", "volumeMounts", "securityContext"]:
+                assert container[key] == old_container[key], (name, key)
+            assert new["spec"]["template"]["spec"]["volumes"] == old["spec"]["template"]["spec"]["volumes"]
+        else:
+            assert new["spec"] == old["spec"]
+
+
+def test_statefulsets_run_the_heredoc_pods(tool, tmp_path):
+    legacy = by_kind(legacy_objects())
+    rendered = render(tool, tmp_path, "statefulset")
+    objects = by_kind(rendered)
+
+    headless = objects["Service", "casper-node-net"]
+    assert headless["spec"]["clusterIP"] == "None" and headless["spec"]["selector"] == {"app": "casper-node-net"}
+    assert headless["spec"]["ports"] == legacy["Service", "casper-node-net-001"]["spec"]["ports"][:2] + [
+        EVENTS_PORT] + legacy["Service", "casper-node-net-001"]["spec"]["ports"][2:]
+
+    statefulsets = [o for o in rendered if o["kind"] == "StatefulSet"]
+    assert [s["metadata"]["name"] for s in statefulsets] == [
+        "casper-node-net-bootstrap", "casper-node-net-validator", "casper-node-net-zero-weight"]
+    pods = []
+    for statefulset in statefulsets:
+        [container] = statefulset["spec"]["template"]["spec"]["containers"]
+        offset = int({e["name"]: e["value"] for e in container["env"]}["CASPER_NODE_INDEX_OFFSET"])
+        for ordinal in range(statefulset["spec"]["replicas"]):
+            # init.sh's node index: the pod ordinal plus the offset
+            pods.append(("casper-node-net-{:03d}".format(ordinal + offset), container, statefulset))
+    assert [node for node, _, _ in pods] == ["casper-node-net-{:03d}".format(i) for i in range(1, NODE_COUNT + 1)]
+
+    for node, container, statefulset in pods:
+        old = legacy["Deployment", node]
+        [old_container] = old["spec"]["template"]["spec"]["containers"]
+        old_env = [e for e in old_container["env"] if e["name"] != "CASPER_NODE_INDEX"]
+        assert [e for e in container["env"] if e["name"] != "CASPER_NODE_INDEX_OFFSET"] == old_env
+        for key in ["image", "resources", "securityContext"]:
+            assert container[key] == old_container[key]
+        assert container["volumeMounts"] == [{"mountPath": "/storage", "name": "storage"}]
+        assert statefulset["spec"]["volumeClaimTemplates"][0]["spec"] == \
+            legacy["PersistentVolumeClaim", node + "-pv-claim"]["spec"]
+        assert statefulset["spec"]["template"]["metadata"]["labels"]["app"] == "casper-node-net"
+
+
+def hosts(**group_vars):
+    children = {}
+    for group, first, count in [("bootstrap", 1, 1), ("validators", 2, 2), ("zero_weight", 4, 1)]:
+        children[group] = {"hosts": {"casper-node-net-{:03d}".format(i): "" for i in range(first, first + count)}}
+        if group in group_vars:
+            children[group]["vars"] = {"kube_resources": group_vars[group]}
+    return {"all": {"children": children}}
+
+
+DEFAULTS = {"requests": {"cpu": "500m", "memory": "500Mi"}, "limits": {"cpu": "1", "memory": "1Gi"}, "storage": "1Gi"}
+
+
+def test_role_profiles_override_in_order(tool):
+    profiles = tool.kube_role_profiles(
+        hosts(validators={"limits": {"cpu": 8}}),
+        DEFAULTS,
+        {"validators": {"requests": {"cpu": "2"}, "limits": {"cpu": "4"}}, "validator": {"storage": "100Gi"},
+         "zero-weight": {"requests": {"memory": "2Gi"}, "limits": {"memory": "2Gi"}}})
+    # group profile, then role profile, then the hosts group's kube_resources
+    assert profiles["validator"] == {"requests": {"cpu": "2", "memory": "500Mi"},
+                                     "limits": {"cpu": "8", "memory": "1Gi"}, "storage": "100Gi"}
+    assert profiles["zero-weight"]["requests"]["memory"] == "2Gi" and profiles["zero-weight"]["storage"] == "1Gi"
+    assert profiles["bootstrap"] == DEFAULTS == profiles["joiner"]
+
+    for bad, error in [({"validator": {"cpus": 1}}, "unknown resource key cpus"),
+                       ({"bootstrap": {"requests": {"cpu": "2"}}}, "cpu request 2 is above its limit 1")]:
+        with pytest.raises(Exception, match=error):
+            tool.kube_role_profiles(hosts(), DEFAULTS, bad)
+
+
+def test_node_container_resources(tool):
+    profile = tool.kube_role_profiles(hosts(), DEFAULTS, {"validator": {"requests": {"cpu": "2"}, "limits": {"cpu": "3"}}})
+    settings = {"image": "image", "git_hash": "", "network_name": "net", "node_version": "1_0_0",
+                "artifact_cache_url": "http://artifact-cache:8080"}
+    container = tool.kube_node_container("node", settings, [], profile["validator"])
+    assert container["resources"] == {"limits": {"cpu": "3", "memory": "1Gi"}, "requests": {"cpu": "2", "memory": "500Mi"}}
+    assert {"name": "ARTIFACT_CACHE_URL", "value": "http://artifact-cache:8080"} in container["env"]
+    # the pod spec owns its copy, editing one node's container leaves the profile as it is
+    container["resources"]["limits"]["cpu"] = "99"
+    assert profile["validator"]["limits"]["cpu"] == "3"
+
+
+def pod_specs(objects):
+    specs = {}
+    for o in objects:
+        if o["kind"] in ["Deployment", "StatefulSet"]:
+            specs[o["spec"]["template"]["metadata"]["labels"]["casper-role"]] = o["spec"]["template"]["spec"]
+    return specs
+
+
+def test_per_role_resources_and_spreading(tool, tmp_path):
+    (tmp_path / "net").mkdir()
+    (tmp_path / "net" / "hosts.yaml").write_text(yaml.safe_dump(hosts(zero_weight={"storage": "5Gi"})))
+    resources_file = tmp_path / "resources.yaml"
+    resources_file.write_text(yaml.safe_dump({"validator": {"requests": {"cpu": "2", "memory": "4Gi"},
+                                                            "limits": {"cpu": "4", "memory": "8Gi"}}}))
+    objects = render(tool, tmp_path, "deployment", "--resources-file", str(resources_file))
+    specs = pod_specs(objects)
+    assert specs["validator"]["containers"][0]["resources"] == {
+        "limits": {"cpu": "4", "memory": "8Gi"}, "requests": {"cpu": "2", "memory": "4Gi"}}
+    assert specs["zero-weight"]["containers"][0]["resources"]["requests"] == {"cpu": "500m", "memory": "500Mi"}
+    claims = {o["metadata"]["name"]: o["spec"]["resources"]["requests"]["storage"]
+              for o in objects if o["kind"] == "PersistentVolumeClaim"}
+    assert claims == {"casper-node-net-001-pv-claim": "1Gi", "casper-node-net-002-pv-claim": "1Gi",
+                      "casper-node-net-003-pv-claim": "1Gi", "casper-node-net-004-pv-claim": "5Gi"}
+
+    # soft spreading of the default roles, across cluster nodes and zones
+    selector = {"matchLabels": {"casper-network": "net"},
+                "matchExpressions": [{"key": "casper-role", "operator": "In", "values": ["bootstrap", "validator"]}]}
+    for role in ["bootstrap", "validator"]:
+        spec = specs[role]
+        assert [(c["topologyKey"], c["whenUnsatisfiable"], c["labelSelector"]) for c in spec["topologySpreadConstraints"]] == [
+            ("kubernetes.io/hostname", "ScheduleAnyway", selector), ("topology.kubernetes.io/zone", "ScheduleAnyway", selector)]
+        [preferred] = spec["affinity"]["podAntiAffinity"]["preferredDuringSchedulingIgnoredDuringExecution"]
+        assert preferred["podAffinityTerm"] == {"labelSelector": selector, "topologyKey": "kubernetes.io/hostname"}
+    assert "affinity" not in specs["zero-weight"] and "topologySpreadConstraints" not in specs["zero-weight"]
+
+    # hard spreading: one validator per cluster node is required, zones stay best effort
+    specs = pod_specs(render(tool, tmp_path, "statefulset", "--spread-roles", "validator", "--spread-mode", "hard"))
+    spec = specs["validator"]
+    assert [c["whenUnsatisfiable"] for c in spec["topologySpreadConstraints"]] == ["DoNotSchedule", "ScheduleAnyway"]
+    [required] = spec["affinity"]["podAntiAffinity"]["requiredDuringSchedulingIgnoredDuringExecution"]
+    assert required["labelSelector"]["matchExpressions"][0]["values"] == ["validator"]
+    assert "affinity" not in specs["bootstrap"]
+
+
+def test_dry_run_reports_the_totals(tool, tmp_path):
+    (tmp_path / "net").mkdir()
+    (tmp_path / "net" / "hosts.yaml").write_text(yaml.safe_dump(hosts(validators={"requests": {"cpu": "1"}, "limits": {"cpu": "1"}})))
+    result = CliRunner().invoke(tool.cli, ["render-kube", "--dry-run", "--spread-mode", "hard", str(tmp_path / "net")])
+    assert result.exit_code == 0, result.output
+    assert "2 nodes x requests 1 cpu / 500Mi mem" in result.output
+    # 0.5 + 2 x 1 + 0.5 cpu and 4 x 500Mi requested, 4 x 1Gi storage
+    assert "requests 3 cpu / 2.0Gi mem" in result.output and "4.0Gi storage" in result.output
+    assert "needs 3 cluster nodes" in result.output
+    assert not (tmp_path / "net" / "kube_resources.yaml").exists()
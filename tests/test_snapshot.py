@@ -0,0 +1,112 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+from click.testing import CliRunner
+
+from conftest import ROOT
+
+needs_bash = pytest.mark.skipif(not (shutil.which("bash") and shutil.which("jq")), reason="needs bash and jq")
+
+
+def restore_block(tmp_path):
+    """init.sh's snapshot restore, pointed at tmp_path, with a stub restore-snapshot.py
+    that records the snapshot it restored in the storage."""
+    init = open(os.path.join(ROOT, "docker", "casper-kube-node", "init.sh")).read()
+    block = init[init.index("#restore the node's storage"):init.index("#emulate the network conditions")]
+    stub = tmp_path / "restore-snapshot.py"
+    stub.write_text(
+        "import json, os, sys\n"
+        "storage = sys.argv[sys.argv.index('--storage-path') + 1]\n"
+        "snapshot = json.load(open(os.environ['ETC_CASPER'] + '/snapshot.json'))['snapshot']\n"
+        "if snapshot == 'broken':\n"
+        "    sys.exit(1)\n"
+        "os.makedirs(storage + '/db', exist_ok=True)\n"
+        "open(storage + '/db/data.lmdb', 'w').write(snapshot)\n")
+    script = tmp_path / "restore.sh"
+    script.write_text("node_name=casper-node-001\nbucket_name=bucket\nnetwork_prefix=networks/net\n" + block
+                      .replace("/etc/casper", str(tmp_path / "etc"))
+                      .replace("/storage", str(tmp_path / "storage"))
+                      .replace("/restore-snapshot.py", str(stub)))
+    (tmp_path / "etc").mkdir()
+    env = dict(os.environ, ETC_CASPER=str(tmp_path / "etc"))
+    return lambda: subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True)
+
+
+def set_snapshot(tmp_path, name):
+    path = tmp_path / "etc" / "snapshot.json"
+    if name is None:
+        path.unlink()
+    else:
+        path.write_text(json.dumps({"snapshot": name, "manifest": "snapshots/{}/n.json".format(name),
+                                    "chunks": "snapshots/chunks"}))
+
+
+@needs_bash
+def test_restore_follows_the_snapshot(tmp_path):
+    start = restore_block(tmp_path)
+    storage = tmp_path / "storage" / "casper-node-001"
+    data = storage / "db" / "data.lmdb"
+    marker = storage / ".snapshot-restored"
+
+    assert start().returncode == 0 and not storage.exists()
+
+    set_snapshot(tmp_path, "era-10")
+    assert start().returncode == 0
+    assert data.read_text() == "era-10" and marker.read_text() == "era-10\n"
+    # the node ran on from the snapshot, a restart keeps its storage
+    data.write_text("era-12")
+    assert start().returncode == 0 and data.read_text() == "era-12"
+
+    # another snapshot replaces the storage, files it doesn't have included
+    (storage / "db" / "stale").write_text("")
+    set_snapshot(tmp_path, "era-20")
+    result = start()
+    assert result.returncode == 0 and "restoring snapshot era-20" in result.stdout
+    assert data.read_text() == "era-20" and marker.read_text() == "era-20\n"
+    assert not (storage / "db" / "stale").exists()
+
+    # cleared: the restored storage is wiped, and the node starts from genesis from then on
+    set_snapshot(tmp_path, None)
+    result = start()
+    assert result.returncode == 0 and "wiping the storage restored from era-20" in result.stdout
+    assert os.listdir(storage) == []
+    (storage / "db").mkdir()
+    data.write_text("genesis")
+    assert start().returncode == 0 and data.read_text() == "genesis"
+
+
+@needs_bash
+def test_failed_restore_is_retried(tmp_path):
+    start = restore_block(tmp_path)
+    marker = tmp_path / "storage" / "casper-node-001" / ".snapshot-restored"
+    set_snapshot(tmp_path, "broken")
+    result = start()
+    assert result.returncode == 1 and "snapshot restore failed" in result.stdout
+    assert marker.read_text() == "broken (incomplete)\n"
+    set_snapshot(tmp_path, "era-10")
+    assert start().returncode == 0 and marker.read_text() == "era-10\n"
+
+    # a partial restore is wiped when the snapshot is cleared instead
+    set_snapshot(tmp_path, "broken")
+    assert start().returncode == 1
+    set_snapshot(tmp_path, None)
+    assert start().returncode == 0 and os.listdir(marker.parent) == []
+
+
+def test_clear_removes_the_nodes_snapshot(tool, tmp_path):
+    network_path = tmp_path / "net"
+    for node in ["casper-node-001", "casper-node-002"]:
+        os.makedirs(network_path / "nodes" / node / "etc" / "casper")
+        os.makedirs(network_path / "snapshots" / "era-10", exist_ok=True)
+        (network_path / "snapshots" / "era-10" / "{}.json".format(node)).write_text("{}")
+    result = CliRunner().invoke(tool.cli, ["restore-network", "--name", "era-10", str(network_path)])
+    assert result.exit_code == 0, result.output
+    restore_file = network_path / "nodes" / "casper-node-001" / "etc" / "casper" / "snapshot.json"
+    assert json.loads(restore_file.read_text())["snapshot"] == "era-10"
+
+    result = CliRunner().invoke(tool.cli, ["restore-network", "--clear", str(network_path)])
+    assert result.exit_code == 0, result.output
+    assert not restore_file.exists()
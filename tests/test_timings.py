@@ -0,0 +1,85 @@
+import json
+import time
+
+import pytest
+
+
+def test_phases_record_counter_deltas(tool):
+    timings = tool.Timings("create-network")
+    timings.phase("keygen")
+    timings.add_bytes(100)
+    tool.Timings.count_subprocess()
+    time.sleep(0.01)
+    timings.phase("package")
+    timings.add_bytes(50)
+    timings.add_count("uploads", 2)
+    timings.node("casper-node-001", "config", 0.5)
+    timings.node("casper-node-001", "config", 0.25)
+    timings.finish()
+
+    keygen, package = timings.phases
+    assert keygen["name"] == "keygen" and keygen["seconds"] >= 0.01
+    assert (keygen["bytes_written"], keygen["subprocesses"]) == (100, 1)
+    assert (package["bytes_written"], package["subprocesses"], package["uploads"]) == (50, 0, 2)
+    assert timings.nodes == {"casper-node-001": {"config": 0.75}}
+    assert timings.report()["counters"]["bytes_written"] == 150
+    # finishing twice doesn't add a phase
+    timings.finish()
+    assert len(timings.phases) == 2
+
+
+@pytest.mark.parametrize("keygen_workers", ["1", "2"])
+def test_timings_report(tool, tmp_path, create_network, keygen_workers):
+    report_path = tmp_path / "timings.json"
+    create_network(tmp_path / "net", tool_args=[
+        "--no-keypool", "--keygen-workers", keygen_workers, "--validator-count", "3",
+        "--non-validator-count", "1", "--timings", str(report_path)])
+    report = json.loads(report_path.read_text())
+
+    assert sorted(report) == ["argv", "command", "counters", "node_count", "nodes", "phases", "seconds", "started"]
+    assert report["command"] == "create-network" and report["node_count"] == 4
+    assert report["started"].endswith("Z") and report["seconds"] > 0
+    assert [phase["name"] for phase in report["phases"]] == [
+        "chainspec", "copy-binary", "hosts", "keygen", "topology", "node-configs",
+        "network-profile", "accounts", "shared-files", "package", "manifest"]
+    for phase in report["phases"]:
+        assert sorted(phase) == ["bytes_written", "name", "seconds", "subprocesses"]
+    assert report["counters"]["bytes_written"] == sum(phase["bytes_written"] for phase in report["phases"])
+    keygen = next(phase for phase in report["phases"] if phase["name"] == "keygen")
+    # the three key files of the four nodes and the faucet
+    key_paths = [tmp_path / "net" / "nodes" / node / "etc" / "casper" / "keys" for node in report["nodes"]
+                 if node != "faucet"] + [tmp_path / "net" / "staging" / "faucet"]
+    assert keygen["bytes_written"] == sum(
+        (key_path / name).stat().st_size for key_path in key_paths
+        for name in ["secret_key.pem", "public_key.pem", "public_key_hex"])
+
+    nodes = ["casper-node-net-{:03d}".format(index) for index in range(1, 5)]
+    assert sorted(report["nodes"]) == nodes + ["faucet"]
+    for node in nodes:
+        assert sorted(report["nodes"][node]) == ["config", "keygen"]
+        assert report["nodes"][node]["keygen"] > 0
+    assert list(report["nodes"]["faucet"]) == ["keygen"]
+
+
+def test_existing_keys_are_not_timed(tool, tmp_path, create_network):
+    network_path = tmp_path / "net"
+    create_network(network_path, tool_args=["--no-keypool", "--validator-count", "2", "--non-validator-count", "0"])
+    report_path = tmp_path / "timings.json"
+    create_network(network_path, args=["--incremental"], tool_args=[
+        "--no-keypool", "--validator-count", "3", "--non-validator-count", "0", "--timings", str(report_path)])
+    nodes = json.loads(report_path.read_text())["nodes"]
+    assert [node for node in sorted(nodes) if "keygen" in nodes[node]] == ["casper-node-net-003"]
+
+
+def test_claimed_keys_are_timed(tool, tmp_path):
+    pool_path = str(tmp_path / "keypool")
+    pool_keys = [str(tmp_path / "generating" / str(index)) for index in range(2)]
+    obj = {"keypool": None, "keygen": "native", "keygen-workers": 1, "timings": tool.Timings("keypool")}
+    tool.add_pool_keys(pool_path, pool_keys, tool.generate_keys(pool_keys, obj))
+
+    obj = dict(obj, keypool=pool_path, timings=tool.Timings("add-joiners"))
+    key_paths = [str(tmp_path / "nodes" / node) for node in ["joiner-1", "joiner-2", "joiner-3"]]
+    tool.ensure_account_keys(key_paths, obj, ["joiner-1", "joiner-2", "joiner-3"])
+    # two keys claimed from the pool, one generated
+    assert sorted(obj["timings"].nodes) == ["joiner-1", "joiner-2", "joiner-3"]
+    assert all(durations["keygen"] > 0 for durations in obj["timings"].nodes.values())
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+
+def network(count, bootstrap=3, zero_weight=0):
+    nodes = ["casper-node-{:04d}".format(index) for index in range(1, count + 1)]
+    return nodes[:bootstrap], nodes[bootstrap:count - zero_weight], nodes[count - zero_weight:]
+
+
+def test_stats_of_known_graphs(tool):
+    path = {"a": ["b"], "b": ["c"], "c": ["d"], "d": ["e"], "e": []}
+    assert tool.topology_stats(path) == {"nodes": 5, "edges": 4, "degree_min": 1, "degree_mean": 1.6,
+                                         "degree_max": 2, "diameter": 4, "diameter_exact": True}
+    # edges are undirected and counted once, self loops and unknown peers are ignored
+    ring = {str(i): [str((i + 1) % 6), str((i - 1) % 6), str(i), "elsewhere"] for i in range(6)}
+    stats = tool.topology_stats(ring)
+    assert (stats["edges"], stats["degree_min"], stats["degree_max"], stats["diameter"]) == (6, 2, 2, 3)
+    star = {"hub": []}
+    star.update({str(i): ["hub"] for i in range(10)})
+    assert tool.topology_stats(star)["diameter"] == 2
+    assert tool.topology_stats({"a": ["b"], "b": [], "c": []})["diameter"] is None
+
+
+def test_sampled_diameter_is_a_lower_bound(tool):
+    path = {str(i): [str(i + 1)] for i in range(199)}
+    path["199"] = []
+    stats = tool.topology_stats(path, max_bfs_work=1000, samples=8)
+    assert not stats["diameter_exact"]
+    assert 100 <= stats["diameter"] <= 199
+
+
+@pytest.mark.parametrize("count", [10, 1000])
+@pytest.mark.parametrize("name", ["full-mesh", "random", "ring-chords", "bootstrap-k"])
+def test_topologies(tool, name, count):
+    degree = 6
+    bootstrap, validators, zero_weight = network(count, zero_weight=count // 10)
+    known = tool.TOPOLOGIES[name](bootstrap, validators, zero_weight, degree, random.Random(7))
+    assert sorted(known) == sorted(bootstrap + validators + zero_weight)
+    for node, peers in known.items():
+        # the bootstrap nodes dial each other, full mesh nodes everyone, themselves included
+        if node in bootstrap:
+            assert peers == bootstrap
+            continue
+        if name == "full-mesh":
+            assert peers == bootstrap + validators
+            continue
+        assert node not in peers and len(set(peers)) == len(peers)
+        if name == "random":
+            assert len(peers) == min(degree, count - 1)
+        elif name == "ring-chords":
+            nodes = bootstrap + validators + zero_weight
+            assert len(peers) == min(degree, count - 1)
+            assert peers[0] == nodes[(nodes.index(node) + 1) % count]
+        else:
+            assert peers[:len(bootstrap)] == bootstrap
+            assert len(peers) == len(bootstrap) + min(degree, len(validators) - (node in validators))
+            assert set(peers[len(bootstrap):]) <= set(validators)
+
+    stats = tool.topology_stats(known)
+    assert stats["nodes"] == count and stats["diameter"] is not None
+    if name in ["full-mesh", "bootstrap-k"]:
+        # every node dials the bootstrap nodes
+        assert stats["diameter"] <= 2
+    else:
+        # a random graph of degree d has a diameter around log(n) / log(d)
+        assert stats["diameter"] <= (4 if count == 10 else 8)
+    # every node but the bootstrap nodes dials `degree` peers, an edge is dialed from both ends at most
+    if name in ["random", "ring-chords"]:
+        assert stats["degree_mean"] >= min(degree, count - 1) * (count - len(bootstrap)) / count
+        assert stats["degree_min"] >= 1 and stats["degree_max"] <= count - 1
+
+
+def test_topologies_are_reproducible(tool):
+    bootstrap, validators, zero_weight = network(200)
+    for topology in tool.TOPOLOGIES.values():
+        first = topology(bootstrap, validators, zero_weight, 8, random.Random(3))
+        assert topology(bootstrap, validators, zero_weight, 8, random.Random(3)) == first
@@ -0,0 +1,171 @@
+import asyncio
+import csv
+import io
+import json
+import threading
+
+import pytest
+
+
+class StatusStub:
+    """Nodes' REST /status endpoints, served by `servers` keep-alive HTTP servers on
+    one event loop of their own. Node i answers on /status/i with the height, era,
+    peer count, HTTP status and delay of nodes[i], which tests change between polls."""
+
+    def __init__(self, nodes, servers=1):
+        self.nodes = nodes
+        self.loop = asyncio.new_event_loop()
+        self.servers = servers
+        self.ports = []
+        self.listeners = []
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+
+    async def start(self):
+        for _ in range(self.servers):
+            server = await asyncio.start_server(self.serve, "127.0.0.1", 0, backlog=4096)
+            self.listeners.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                node = self.nodes[int(request.split(b" ")[1].rsplit(b"/", 1)[1])]
+                await asyncio.sleep(node.get("delay", 0))
+                if node.get("status", 200) == 200:
+                    body = json.dumps({
+                        "peers": [{"node_id": "tls:{}".format(peer)} for peer in range(node["peers"])],
+                        "last_added_block_info": {"height": node["height"], "era_id": node["era"]},
+                    }).encode()
+                else:
+                    body = b"unavailable"
+                writer.write(b"HTTP/1.1 %d X\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (
+                    node.get("status", 200), len(body), body))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    def urls(self):
+        return [("casper-node-{:03d}".format(index + 1), "http://127.0.0.1:{}/status/{}".format(
+            self.ports[index % len(self.ports)], index)) for index in range(len(self.nodes))]
+
+    async def stop(self):
+        for server in self.listeners:
+            server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def watch(tool, stub, duration, interval=0.5, timeout=0.3, lag_blocks=3, between_polls=None):
+    """The network and node time series of watching stub for duration seconds."""
+    watcher = tool.NetworkWatcher(stub.urls(), interval, timeout, lag_blocks, report_interval=60)
+    if between_polls:
+        aggregate = watcher.aggregate
+
+        def aggregate_then_change(now, elapsed, results):
+            row = aggregate(now, elapsed, results)
+            between_polls(watcher.polls)
+            return row
+        watcher.aggregate = aggregate_then_change
+    series, node_series = io.StringIO(), io.StringIO()
+    asyncio.run(watcher.run(duration, series, node_series))
+    return (watcher, list(csv.DictReader(io.StringIO(series.getvalue()))),
+            list(csv.DictReader(io.StringIO(node_series.getvalue()))))
+
+
+def test_poll_and_aggregate(tool):
+    stub = StatusStub([
+        {"height": 100, "era": 4, "peers": 4},
+        {"height": 99, "era": 4, "peers": 3},
+        {"height": 97, "era": 4, "peers": 4},
+        {"height": 96, "era": 3, "peers": 1},
+        {"height": 90, "era": 3, "peers": 0, "status": 503},
+        {"height": 100, "era": 4, "peers": 4, "delay": 1},
+    ], servers=2)
+    try:
+        watcher, rows, node_rows = watch(tool, stub, 1.2)
+    finally:
+        stub.close()
+
+    assert watcher.polls == len(rows) == 3 and watcher.overruns == 0
+    assert list(rows[0]) == tool.NetworkWatcher.COLUMNS
+    row = rows[0]
+    assert (row["nodes"], row["up"], row["errors"]) == ("6", "4", "2")
+    assert (row["height_min"], row["height_p50"], row["height_max"], row["height_spread"]) == ("96", "99", "100", "4")
+    assert row["era_max"] == "4"
+    # 96 is more than 3 blocks behind 100, 97 isn't; the nodes that didn't answer aren't counted
+    assert row["lagging"] == "1"
+    assert (row["peers_min"], row["peers_p50"], row["peers_max"]) == ("1", "4", "4")
+    assert [float(row["elapsed"]) for row in rows] == pytest.approx([0, 0.5, 1.0], abs=0.1)
+
+    assert list(node_rows[0]) == tool.NetworkWatcher.NODE_COLUMNS
+    first = {row["node"]: row for row in node_rows[:6]}
+    assert (first["casper-node-001"]["height"], first["casper-node-001"]["peers"]) == ("100", "4")
+    assert first["casper-node-005"]["error"] == "http 503" and first["casper-node-005"]["height"] == ""
+    # the slow node times out instead of delaying the poll
+    assert first["casper-node-006"]["error"] == "timeout"
+    assert all(float(row["poll_ms"]) < 400 for row in rows)
+
+
+def test_block_rate_and_lagging_nodes(tool):
+    nodes = [{"height": 10, "era": 1, "peers": 2} for _ in range(4)]
+
+    def advance(polls):
+        # the network adds 2 blocks per poll, node 4 loses its peers and stops after the first
+        for node in nodes if polls == 0 else nodes[:3]:
+            node["height"] += 2
+        nodes[3]["peers"] = 0
+
+    stub = StatusStub(nodes)
+    try:
+        watcher, rows, node_rows = watch(tool, stub, 2.2, lag_blocks=3, between_polls=advance)
+    finally:
+        stub.close()
+
+    assert [row["height_max"] for row in rows] == ["10", "12", "14", "16", "18"]
+    assert [row["height_spread"] for row in rows] == ["0", "0", "2", "4", "6"]
+    assert [row["lagging"] for row in rows] == ["0", "0", "0", "1", "1"]
+    assert [row["peers_min"] for row in rows] == ["2", "0", "0", "0", "0"]
+    # 2 blocks per 0.5s
+    assert rows[0]["blocks_per_minute"] == ""
+    assert [float(row["blocks_per_minute"]) for row in rows[1:]] == pytest.approx([240] * 4, rel=0.1)
+
+
+def test_block_rate_window(tool):
+    watcher = tool.NetworkWatcher([], 1, 1, 3, 60, rate_window=10)
+    up = lambda height: [{"height": height, "era": 1, "peers": 1, "latency_ms": 1}]
+    assert watcher.aggregate("t", 0, up(100))["blocks_per_minute"] == ""
+    assert watcher.aggregate("t", 5, up(105))["blocks_per_minute"] == 60
+    # the rate covers the last 10 seconds only, the block at 0 has left the window
+    assert watcher.aggregate("t", 11, up(111))["blocks_per_minute"] == 60
+    assert watcher.aggregate("t", 15, up(131))["blocks_per_minute"] == 156
+    # nodes all down: no heights, no rate, nothing recorded
+    row = watcher.aggregate("t", 16, [{"error": "timeout"}])
+    assert (row["up"], row["height_max"], row["lagging"], row["blocks_per_minute"]) == (0, "", "", "")
+    assert len(watcher.heights) == 3
+
+
+def test_thousand_nodes_within_the_interval(tool):
+    count = 1000
+    tool.raise_open_file_limit(2 * count + 256)
+    nodes = [{"height": 5000 + index % 7, "era": 12, "peers": index % 50} for index in range(count)]
+    stub = StatusStub(nodes, servers=8)
+    try:
+        watcher, rows, node_rows = watch(tool, stub, 3, interval=1, timeout=0.8)
+    finally:
+        stub.close()
+
+    assert watcher.polls == 3 and watcher.overruns == 0
+    for row in rows:
+        assert row["up"] == str(count) and row["errors"] == "0"
+        assert float(row["poll_ms"]) < 1000
+    assert (rows[-1]["height_min"], rows[-1]["height_max"], rows[-1]["lagging"]) == (
+        "5000", "5006", str(sum(1 for node in nodes if node["height"] < 5003)))
+    assert len(node_rows) == 3 * count